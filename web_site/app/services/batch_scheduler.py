@@ -0,0 +1,75 @@
+import asyncio
+import time
+from app.services.metrics import Histogram
+
+
+class DynamicBatcher:
+    """
+    마감 시간(deadline) 기반 동적 배처.
+    - 가장 오래 기다린 프레임 기준으로 max_wait_ms가 지나거나, max_batch_size가 차면 배치를 내보냄
+    - 채널당 최신 프레임 1장만 배치에 들어가므로 한 채널이 배치를 독점하지 못함
+    - 배치에 못 들어간 채널은 대기 시간이 길어져 다음 배치에서 우선 선택됨 (공정성)
+      (대기 시작 시각은 채널별로 기록하므로 프레임이 계속 갱신되는 채널도 순서를 잃지 않음)
+    """
+
+    def __init__(self, capture_service, max_batch_size=8, max_wait_ms=30):
+        self.capture = capture_service
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._wakeup = asyncio.Event()
+        self._loop = None
+        self._waiting_since = {}  # {cid: 처음으로 미처리 프레임이 생긴 시각}
+
+        self.batch_size_hist = Histogram([1, 2, 4, 8, 16, 32, 64])
+        self.queue_wait_hist = Histogram([1, 2, 5, 10, 20, 50, 100, 200, 500, 1000])  # ms
+
+    def notify(self, channel_id):
+        """디코더 쓰레드에서 새 프레임이 들어올 때 호출 (capture_service의 on_frame 콜백)"""
+        if self._loop is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._wakeup.set)
+            except RuntimeError:
+                pass  # 종료 중 이벤트 루프가 이미 닫힌 경우
+
+    async def next_batch(self):
+        """[(cid, frame, seq, timestamp)] 배치 하나를 반환할 때까지 대기"""
+        self._loop = asyncio.get_running_loop()
+        while True:
+            self._wakeup.clear()
+            pending = self.capture.collect_new_frames()
+            if pending:
+                for cid, _, _, ts in pending:
+                    self._waiting_since.setdefault(cid, ts)
+                # 가장 오래 기다린 채널부터
+                pending.sort(key=lambda item: self._waiting_since[item[0]])
+                deadline = self._waiting_since[pending[0][0]] + self.max_wait
+                now = time.monotonic()
+                if len(pending) >= self.max_batch_size or now >= deadline:
+                    return self._emit(pending[:self.max_batch_size], now)
+                timeout = deadline - now
+            else:
+                timeout = 0.5
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def forget(self, cid):
+        """채널 등록 해제 시 대기 시작 시각 제거 (next_batch와 같은 이벤트 루프에서 호출)"""
+        self._waiting_since.pop(cid, None)
+
+    def _emit(self, batch, now):
+        for cid, _, seq, _ in batch:
+            self.capture.mark_seen(cid, seq)
+            waited = now - self._waiting_since.pop(cid, now)
+            self.queue_wait_hist.observe(waited * 1000.0)
+        self.batch_size_hist.observe(len(batch))
+        return batch
+
+    def stats(self):
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "batch_size": self.batch_size_hist.snapshot(),
+            "queue_wait_ms": self.queue_wait_hist.snapshot(),
+        }
@@ -0,0 +1,327 @@
+import random
+import threading
+import time
+import cv2
+from app.services.ffmpeg_capture import FfmpegCapture
+
+
+class FrameSlot:
+    """채널별 '최신 프레임' 한 칸. 디코더 쓰레드가 계속 덮어쓰고, 배처는 새 프레임만 가져갑니다."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.frame = None
+        self.seq = 0          # 프레임이 갱신될 때마다 1씩 증가
+        self.timestamp = 0.0  # 디코딩 완료 시각 (time.monotonic)
+
+    def write(self, frame):
+        with self._lock:
+            self.frame = frame
+            self.seq += 1
+            self.timestamp = time.monotonic()
+
+    def read_if_newer(self, last_seq):
+        """last_seq 이후에 들어온 프레임이 있을 때만 (frame, seq, timestamp) 반환"""
+        with self._lock:
+            if self.frame is None or self.seq <= last_seq:
+                return None
+            return self.frame, self.seq, self.timestamp
+
+
+class ChannelHealth:
+    """채널 연결 상태 (캡처 쓰레드가 갱신하고 /api/v1/stats에서 조회)"""
+
+    def __init__(self):
+        self.state = "connecting"   # connecting | ok | backoff | stopped
+        self.opened_at = None       # 마지막으로 스트림을 연 시각 (epoch)
+        self.last_frame_at = None   # 마지막 프레임 디코딩 시각 (epoch)
+        self.frames = 0
+        self.reconnects = 0
+        self.consecutive_failures = 0
+        self.next_retry_in = 0.0
+        self.last_error = None
+
+    def to_dict(self):
+        return {
+            "state": self.state,
+            "opened_at": self.opened_at,
+            "last_frame_age": round(time.time() - self.last_frame_at, 2) if self.last_frame_at else None,
+            "frames": self.frames,
+            "reconnects": self.reconnects,
+            "consecutive_failures": self.consecutive_failures,
+            "next_retry_in": round(self.next_retry_in, 2),
+            "last_error": self.last_error,
+        }
+
+
+class ChannelCapture(threading.Thread):
+    """
+    채널 하나를 전담하는 디코더 쓰레드 (grab/retrieve를 이벤트 루프 밖에서 수행).
+    - 열기 실패 / 연속 읽기 실패 / 일정 시간 프레임 없음 → VideoCapture를 해제하고 다시 연결
+    - 재연결 대기는 지수 백오프 + 지터 (죽은 채널이 tight loop로 재시도하지 않고, 여러 채널이 동시에 몰리지 않음)
+    - 스트림 열기는 서비스 공용 세마포어로 동시 개수 제한 (URL 일괄 갱신 시 HLS 서버로 몰림 방지)
+    - backend="ffmpeg"이면 FFmpeg 파이프로 디코딩 (키프레임만 / k번째 프레임만, 디코더 안에서 resize_to로 스케일)
+    """
+
+    def __init__(self, channel_id, url, resize_to=None, on_frame=None, metrics=None, open_slots=None,
+                 backoff=(1.0, 60.0), max_read_failures=5, stall_timeout=15.0, io_timeout_ms=10000,
+                 backend="opencv", decode_every=1, keyframes_only=False):
+        super().__init__(name=f"capture-{channel_id}", daemon=True)
+        self.channel_id = channel_id
+        self.url = url
+        self.resize_to = resize_to  # (W, H) 지정 시 디코더 쓰레드에서 미리 리사이즈
+        self.on_frame = on_frame
+        self.metrics = metrics      # PipelineMetrics (grab / retrieve / resize 단계 시간)
+        self.open_slots = open_slots  # 동시 열기 제한 세마포어 (None이면 제한 없음)
+        self.backoff = backoff        # (최초 대기, 최대 대기) 초
+        self.max_read_failures = max_read_failures
+        self.stall_timeout = stall_timeout
+        self.io_timeout_ms = io_timeout_ms  # FFmpeg 열기/읽기 타임아웃 (멈춘 HLS에서 stop()이 늦어지지 않도록)
+        self.backend = backend
+        self.decode_every = max(1, int(decode_every))  # k번째 프레임만 사용
+        self.keyframes_only = keyframes_only
+        self.health = ChannelHealth()
+        self.slot = FrameSlot()
+        self._stop_event = threading.Event()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _open(self):
+        """세마포어 안에서 스트림 열기. 중지 요청이 오면 None"""
+        if self.open_slots is not None:
+            while not self.open_slots.acquire(timeout=0.5):
+                if self._stop_event.is_set():
+                    return None
+        try:
+            if self._stop_event.is_set():
+                return None
+            if self.backend == "ffmpeg":
+                return FfmpegCapture(self.url, size=self.resize_to, every=self.decode_every,
+                                     keyframes_only=self.keyframes_only, timeout_ms=self.io_timeout_ms)
+            cap = cv2.VideoCapture(self.url, cv2.CAP_FFMPEG,
+                                   [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, self.io_timeout_ms,
+                                    cv2.CAP_PROP_READ_TIMEOUT_MSEC, self.io_timeout_ms])
+            cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+            return cap
+        finally:
+            if self.open_slots is not None:
+                self.open_slots.release()
+
+    def _wait_backoff(self, attempt, reason):
+        """attempt번째 재시도 대기: min(최대, 최초 * 2^attempt)의 절반 + [0, 절반) 무작위 (equal jitter)"""
+        base, cap = self.backoff
+        delay = min(cap, base * (2 ** attempt))
+        delay = delay / 2 + random.uniform(0, delay / 2)
+        health = self.health
+        health.state = "backoff"
+        health.last_error = reason
+        health.next_retry_in = delay
+        print(f"⚠️ [채널 {self.channel_id}] {reason} → {delay:.1f}초 후 재연결")
+        self._stop_event.wait(delay)
+        health.next_retry_in = 0.0
+
+    def _read_loop(self, cap):
+        """스트림이 살아 있는 동안 프레임을 읽어 슬롯에 기록. 재연결이 필요하면 사유를 반환"""
+        metrics = self.metrics
+        health = self.health
+        failures = 0
+        last_frame = time.monotonic()
+        # OpenCV 백엔드의 프레임 솎아내기: k-1장은 grab만 하고 버림 (FFmpeg 백엔드는 select 필터가 처리)
+        skip = self.decode_every - 1 if self.backend != "ffmpeg" else 0
+        while not self._stop_event.is_set():
+            t0 = time.perf_counter()
+            for _ in range(skip):
+                cap.grab()
+            grabbed = cap.grab()
+            t1 = time.perf_counter()
+            success, frame = cap.retrieve() if grabbed else (False, None)
+            t2 = time.perf_counter()
+            if not success:
+                failures += 1
+                health.consecutive_failures = failures
+                if metrics is not None:
+                    metrics.inc("read_failures", self.channel_id)
+                if failures >= self.max_read_failures:
+                    return f"연속 읽기 실패 {failures}회"
+                if time.monotonic() - last_frame > self.stall_timeout:
+                    return f"{self.stall_timeout:.0f}초 동안 프레임 없음"
+                # 느린 HLS 세그먼트는 이 쓰레드만 기다리게 하고 다른 채널에는 영향 없음
+                self._stop_event.wait(0.2 * failures)
+                continue
+            if metrics is not None:
+                metrics.observe("grab", t1 - t0)
+                metrics.observe("retrieve", t2 - t1)
+            failures = 0
+            last_frame = time.monotonic()
+            if self.resize_to is not None and (frame.shape[1], frame.shape[0]) != tuple(self.resize_to):
+                frame = cv2.resize(frame, self.resize_to)
+                if metrics is not None:
+                    metrics.observe("resize", time.perf_counter() - t2)
+            self.slot.write(frame)
+            health.state = "ok"
+            health.frames += 1
+            health.consecutive_failures = 0
+            health.last_frame_at = time.time()
+            if self.on_frame is not None:
+                self.on_frame(self.channel_id)
+        return None
+
+    def run(self):
+        print(f"🟢 [채널 {self.channel_id}] 디코더 쓰레드 시작")
+        attempt = 0  # 프레임을 한 장도 못 읽고 연속으로 실패한 연결 횟수
+        first = True
+        health = self.health
+        try:
+            while not self._stop_event.is_set():
+                if not first:
+                    health.reconnects += 1
+                    if self.metrics is not None:
+                        self.metrics.inc("reconnects", self.channel_id)
+                first = False
+                health.state = "connecting"
+                cap = self._open()
+                if cap is None:
+                    break
+                try:
+                    if not cap.isOpened():
+                        reason = "스트림 열기 실패"
+                    else:
+                        health.opened_at = time.time()
+                        frames_before = health.frames
+                        reason = self._read_loop(cap)
+                        if health.frames > frames_before:
+                            attempt = 0  # 정상적으로 읽다가 끊긴 경우 백오프를 처음부터
+                finally:
+                    cap.release()  # 재연결 / 종료 시 소켓과 디코더 메모리 즉시 해제
+                if reason is None:
+                    break
+                self._wait_backoff(attempt, reason)
+                attempt += 1
+        finally:
+            health.state = "stopped"
+            print(f"🔴 [채널 {self.channel_id}] 디코더 쓰레드 종료")
+
+
+class CaptureService:
+    """
+    채널별 디코더 쓰레드를 관리하고, 아직 처리하지 않은 최신 프레임만 모아서 넘겨주는 서비스.
+    - 제거된 채널의 쓰레드는 즉시 중지시키고(VideoCapture 해제), 종료 시 모두 join 합니다.
+    - URL이 바뀐 채널은 새 URL로 대기 쓰레드를 먼저 띄우고, 첫 프레임이 들어오면 그때 교체 (hot-swap)
+      → 토큰 갱신 때 빈 구간 / 재연결 몰림 없이 이전 스트림이 교체 직전까지 프레임을 계속 공급
+      (이전 스트림이 이미 끊겨 재연결 중이면 기다리지 않고 바로 교체)
+    교체는 프레임을 가져가는 쪽(이벤트 루프)에서만 일어나므로 collect_new_frames → mark_seen 사이에 채널이 바뀌지 않습니다.
+    """
+
+    def __init__(self, resize_to=None, on_frame=None, metrics=None, max_concurrent_opens=4,
+                 backend="opencv", decode_every=1, keyframes_only=False):
+        self.resize_to = resize_to
+        self.on_frame = on_frame
+        self.metrics = metrics
+        self.decode_options = {"backend": backend, "decode_every": decode_every,
+                               "keyframes_only": keyframes_only}
+        self.open_slots = threading.BoundedSemaphore(max_concurrent_opens)
+        self.channels = {}   # {cid: ChannelCapture}
+        self.pending = {}    # {cid: 새 URL로 연결 중인 ChannelCapture} (첫 프레임이 오면 channels로 승격)
+        self.last_seen = {}  # {cid: 마지막으로 가져간 seq}
+        self._retired = []   # 중지 요청했지만 아직 끝나지 않은 쓰레드
+
+    def _start(self, cid, url):
+        worker = ChannelCapture(cid, url, resize_to=self.resize_to, on_frame=self.on_frame,
+                                metrics=self.metrics, open_slots=self.open_slots,
+                                **self.decode_options)
+        worker.start()
+        return worker
+
+    def _retire(self, worker):
+        if worker is not None:
+            worker.stop()
+            self._retired.append(worker)
+        self._retired = [w for w in self._retired if w.is_alive()]
+
+    def sync(self, urls):
+        """cached_urls와 동일한 {cid: url}을 받아 쓰레드를 시작/교체/종료"""
+        for cid in list(self.channels):
+            if cid not in urls:
+                self.remove(cid)
+        for cid, url in urls.items():
+            current = self.channels.get(cid)
+            if current is None:
+                self.channels[cid] = self._start(cid, url)
+                self.last_seen[cid] = 0
+                continue
+            pending = self.pending.get(cid)
+            if current.url == url:
+                self._retire(self.pending.pop(cid, None))  # 교체 대기 중에 이전 URL로 되돌아온 경우
+            elif pending is None or pending.url != url:
+                # 같은 채널의 URL 교체 (토큰 만료 등): 이전 스트림은 새 스트림의 첫 프레임까지 유지
+                self._retire(pending)
+                self.pending[cid] = self._start(cid, url)
+                if self.metrics is not None:
+                    self.metrics.inc("reconnects", cid)
+
+    def _promote(self):
+        """첫 프레임이 들어온 (또는 이전 스트림이 끊긴) 대기 쓰레드를 현재 채널로 교체"""
+        for cid, pending in list(self.pending.items()):
+            current = self.channels.get(cid)
+            if pending.slot.seq == 0 and current is not None and current.health.state == "ok":
+                continue
+            del self.pending[cid]
+            self.channels[cid] = pending
+            # 교체 전에 쌓인 새 스트림 프레임은 버려진 것으로 세지 않음 (최신 1장부터 이어서 처리)
+            self.last_seen[cid] = max(0, pending.slot.seq - 1)
+            self._retire(current)
+            print(f"🔁 [채널 {cid}] 새 스트림으로 교체")
+
+    def remove(self, cid):
+        worker = self.channels.pop(cid, None)
+        self.last_seen.pop(cid, None)
+        self._retire(self.pending.pop(cid, None))
+        self._retire(worker)
+
+    def collect_new_frames(self):
+        """마지막으로 가져간 이후 새로 디코딩된 프레임만 [(cid, frame, seq, timestamp)] 형태로 반환"""
+        self._promote()
+        items = []
+        for cid, worker in list(self.channels.items()):
+            item = worker.slot.read_if_newer(self.last_seen.get(cid, 0))
+            if item is not None:
+                frame, seq, ts = item
+                items.append((cid, frame, seq, ts))
+        return items
+
+    def read_new(self, cid):
+        """채널 하나의 새 프레임 (frame, seq, timestamp)을 가져가고 처리한 것으로 표시. 없으면 None"""
+        self._promote()
+        worker = self.channels.get(cid)
+        if worker is None:
+            return None
+        item = worker.slot.read_if_newer(self.last_seen.get(cid, 0))
+        if item is not None:
+            self.mark_seen(cid, item[1])
+        return item
+
+    def mark_seen(self, cid, seq):
+        if cid in self.last_seen:
+            # 마지막으로 가져간 뒤 덮어써진 프레임은 분석되지 못하고 버려진 것
+            if self.metrics is not None and seq > self.last_seen[cid] + 1:
+                self.metrics.inc("frames_dropped", cid, seq - self.last_seen[cid] - 1)
+            self.last_seen[cid] = max(self.last_seen[cid], seq)
+
+    def health(self):
+        """{cid: 연결 상태} (현재 채널만, 교체 대기 중인 새 스트림 상태는 swap_pending에)"""
+        self._promote()
+        health = {}
+        for cid, worker in list(self.channels.items()):
+            health[cid] = worker.health.to_dict()
+            if cid in self.pending:
+                health[cid]["swap_pending"] = self.pending[cid].health.to_dict()
+        return health
+
+    def stop_all(self, timeout=5.0):
+        for cid in list(self.channels):
+            self.remove(cid)
+        deadline = time.monotonic() + timeout
+        for worker in self._retired:
+            worker.join(max(0.0, deadline - time.monotonic()))
+        self._retired = [w for w in self._retired if w.is_alive()]
@@ -0,0 +1,190 @@
+import os
+import re
+import time
+import base64
+import threading
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlsplit, parse_qs
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# SSL 경고 무시 (ITS API 인증서 문제로 verify=False 사용)
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+ITS_API_URL = os.environ.get("ITS_API_URL", "https://openapi.its.go.kr:9443/cctvInfo")
+# 고속도로(ex) 동영상(1) CCTV 전국 범위
+DEFAULT_PARAMS = {
+    "type": "ex", "cctvType": "1",
+    "minX": "126.0", "maxX": "130.0",
+    "minY": "34.0", "maxY": "38.0",
+    "getType": "json",
+}
+KST = timezone(timedelta(hours=9))
+# 이름 뒤에 이어져도 같은 CCTV로 보는 구분 문자 ("[경부선] 서초(서울)"은 서초, "[경부선] 신갈분기점2"는 아님)
+_BOUNDARY = re.compile(r"^$|^[\s(\[/,-]")
+
+
+def url_expiry(url, now=None, tz=KST):
+    """
+    ITS 스트림 URL의 wmsAuthSign(base64: server_time=M/D/YYYY h:mm:ss AM&...&validminutes=N)에서 만료 시각(epoch).
+    서명이 없으면 None. server_time이 현재 시각과 시간대 차이(최대 14시간) 이내로 어긋나 판단이 애매하면
+    방금 발급된 것으로 보고 현재 시각 기준으로 계산 (그보다 오래된 URL은 server_time 기준 → 이미 만료)
+    """
+    now = time.time() if now is None else now
+    try:
+        sign = parse_qs(urlsplit(url).query).get("wmsAuthSign", [None])[0]
+        if not sign:
+            return None
+        decoded = base64.b64decode(sign + "=" * (-len(sign) % 4)).decode("utf-8", "replace")
+        fields = dict(part.split("=", 1) for part in decoded.split("&") if "=" in part)
+        valid = int(fields["validminutes"]) * 60
+    except (ValueError, KeyError, UnicodeError):
+        return None
+    issued = now
+    try:
+        parsed = datetime.strptime(fields.get("server_time", ""), "%m/%d/%Y %I:%M:%S %p")
+        parsed = parsed.replace(tzinfo=tz).timestamp()
+        age = now - parsed
+        if 0 <= age < valid or age > valid + 14 * 3600:
+            issued = parsed
+    except ValueError:
+        pass
+    return issued + valid
+
+
+def base_name(name):
+    """"[경부선] 서초(서울)" → "[경부선] 서초" (괄호 설명을 뗀 인덱스 키)"""
+    return name.split("(", 1)[0].strip()
+
+
+class CctvCatalog:
+    """
+    ITS CCTV 목록 캐시 + 이름 인덱스.
+    - 전국 목록은 연결 풀을 쓰는 requests.Session으로 한 번만 받아서 이름 → 항목 인덱스를 만듦
+      → 채널 전체를 찾는 비용이 HTTP 요청 1번 + 딕셔너리 조회
+    - 대상 이름은 구분 문자 경계까지만 앞부분 일치로 인정 ("신갈분기점"이 "신갈분기점2" / "기흥"이 "기흥휴게소"에 걸리지 않음)
+    - 캐시 유효 시간은 찾아 준 URL 중 가장 먼저 만료되는 시각(refresh_margin 전)에 맞춤 (서명이 없으면 default_ttl)
+    - api_url은 생성자 인자 / ITS_API_URL 환경 변수로 바꿀 수 있어 로컬 스텁 서버로 테스트 가능
+    """
+
+    def __init__(self, api_key, api_url=None, params=None, verify=False, timeout=10,
+                 default_ttl=600, refresh_margin=300, session=None):
+        self.api_key = api_key
+        self.api_url = api_url or ITS_API_URL
+        self.params = dict(DEFAULT_PARAMS, **(params or {}))
+        self.verify = verify
+        self.timeout = timeout
+        self.default_ttl = default_ttl
+        self.refresh_margin = refresh_margin
+        self.session = session or self._make_session()
+        self._lock = threading.Lock()
+        self._entries = []
+        self._index = {}     # {이름: 항목}, {기본 이름: 항목}
+        self._fetched_at = 0.0
+        self._valid_until = 0.0
+        self._resolved = {}  # {대상 이름: 항목} (만료 계산용)
+
+    @staticmethod
+    def _make_session():
+        session = requests.Session()
+        retry = Retry(total=3, backoff_factor=0.5, status_forcelist=(500, 502, 503, 504),
+                      allowed_methods=("GET", "POST"))
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retry)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    # ---------- 목록 수집 ----------
+    @staticmethod
+    def _parse(data):
+        if isinstance(data, dict):
+            if isinstance(data.get("response"), dict) and "data" in data["response"]:
+                data = data["response"]["data"]
+            elif "data" in data:
+                data = data["data"]
+        if isinstance(data, dict):  # 결과가 1건이면 리스트가 아닌 경우가 있음
+            data = [data]
+        entries = []
+        for item in data or []:
+            name = item.get("cctvname") or item.get("cctvName") or ""
+            url = item.get("cctvurl") or item.get("cctvUrl")
+            if name and url:
+                entries.append({"name": name.strip(), "url": url,
+                                "coord": (item.get("coordx"), item.get("coordy")),
+                                "expires_at": url_expiry(url)})
+        return entries
+
+    def refresh(self):
+        """전체 목록을 다시 받아 인덱스 재구성. 받은 CCTV 수 반환"""
+        response = self.session.get(self.api_url, params=dict(self.params, apiKey=self.api_key),
+                                    verify=self.verify, timeout=self.timeout)
+        response.raise_for_status()
+        entries = self._parse(response.json())
+        index = {}
+        for entry in entries:
+            index.setdefault(entry["name"], entry)
+            index.setdefault(base_name(entry["name"]), entry)
+        with self._lock:
+            self._entries = entries
+            self._index = index
+            self._resolved = {}
+            self._fetched_at = time.time()
+            self._valid_until = self._fetched_at + self.default_ttl
+        print(f"📡 ITS CCTV 목록 {len(entries)}개 수집")
+        return len(entries)
+
+    def _ensure_fresh(self):
+        if time.time() >= self._valid_until:
+            self.refresh()
+
+    def _update_ttl(self):
+        """찾아 준 URL 중 가장 이른 만료 - refresh_margin까지 캐시 유지"""
+        expiries = [e["expires_at"] for e in self._resolved.values() if e and e["expires_at"]]
+        if expiries:
+            self._valid_until = max(self._fetched_at + 60, min(expiries) - self.refresh_margin)
+
+    @property
+    def expires_at(self):
+        return self._valid_until
+
+    # ---------- 조회 ----------
+    def _lookup(self, target, exclude=()):
+        entry = self._index.get(target)
+        if entry is not None and not any(x in entry["name"] for x in exclude):
+            return entry
+        # 인덱스에 없으면 (이름 뒤에 설명이 붙은 경우 등) 경계 규칙으로 한 번 훑음
+        for entry in self._entries:
+            name = entry["name"]
+            if name.startswith(target) and _BOUNDARY.match(name[len(target):]) \
+                    and not any(x in name for x in exclude):
+                return entry
+        return None
+
+    def find(self, target, exclude=()):
+        """대상 이름에 맞는 항목 {"name", "url", "coord", "expires_at"} (없으면 None)"""
+        self._ensure_fresh()
+        with self._lock:
+            entry = self._lookup(target, exclude)
+            self._resolved[target] = entry
+            self._update_ttl()
+        return entry
+
+    def resolve(self, targets, exclude=()):
+        """{cid: 대상 이름} → {cid: 스트림 URL} (목록 요청은 캐시가 만료됐을 때만 1번)"""
+        self._ensure_fresh()
+        urls = {}
+        with self._lock:
+            for cid, target in targets.items():
+                entry = self._lookup(target, exclude)
+                self._resolved[target] = entry
+                if entry is not None:
+                    urls[cid] = entry["url"]
+                else:
+                    print(f"⚠️ '{target}' CCTV를 목록에서 찾지 못했습니다.")
+            self._update_ttl()
+        return urls
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,72 @@
+import time
+import cv2
+import numpy as np
+
+
+class FrameChangeGate:
+    """
+    ROI 안의 저해상도 프레임 차이로 추론 여부를 결정하는 게이트.
+    - 마지막으로 추론한 프레임(기준 프레임)과 현재 프레임을 160x90 그레이로 줄여 비교
+    - ROI 안에서 밝기 차이가 pixel_delta를 넘는 픽셀 비율이 threshold 미만이면
+      추론을 건너뛰고 이전 분할 결과를 그대로 사용 (평균 차이와 달리 차량 한 대의 출입도 놓치지 않음)
+    - 단, 마지막 추론 후 max_staleness초가 지나면 장면이 그대로여도 강제로 추론
+    기준 프레임은 추론할 때만 갱신하므로 아주 느린 변화도 누적되어 결국 감지됩니다.
+    """
+
+    def __init__(self, kernel, size=(160, 90), threshold=0.002, pixel_delta=20, max_staleness=5.0):
+        self.kernel = kernel  # ROI 마스크는 OccupancyKernel과 공유
+        self.size = size
+        self.threshold = threshold
+        self.pixel_delta = pixel_delta
+        self.max_staleness = max_staleness
+        self._refs = {}   # {cid: (기준 프레임, 추론 시각)}
+        self._rois = {}   # {cid: (bool ROI 마스크 (size 해상도), ROI 면적)}
+        self._stats = {}  # {cid: [검사 수, 건너뛴 수]}
+
+    def _roi(self, cid):
+        if cid not in self._rois:
+            w, h = self.size
+            roi = None
+            for direct in self.kernel.directions(cid):
+                roi_bool, _ = self.kernel.roi(cid, direct, (h, w))
+                roi = roi_bool.copy() if roi is None else (roi | roi_bool)
+            if roi is None or not roi.any():
+                roi = np.ones((h, w), dtype=bool)  # ROI가 없으면 화면 전체
+            self._rois[cid] = (roi, int(np.count_nonzero(roi)))
+        return self._rois[cid]
+
+    def invalidate(self, cid=None):
+        """ROI가 바뀌었을 때 캐시 삭제"""
+        if cid is None:
+            self._rois.clear()
+        else:
+            self._rois.pop(cid, None)
+
+    def check(self, cid, frame, now=None):
+        """추론이 필요하면 True (이때 현재 프레임을 새 기준으로 저장), 이전 결과를 재사용하면 False"""
+        now = time.monotonic() if now is None else now
+        small = cv2.cvtColor(cv2.resize(frame, self.size, interpolation=cv2.INTER_LINEAR), cv2.COLOR_BGR2GRAY)
+        stats = self._stats.setdefault(cid, [0, 0])
+        stats[0] += 1
+
+        ref = self._refs.get(cid)
+        if ref is not None and now - ref[1] < self.max_staleness:
+            roi, area = self._roi(cid)
+            changed = np.count_nonzero((cv2.absdiff(small, ref[0]) > self.pixel_delta) & roi) / area
+            if changed < self.threshold:
+                stats[1] += 1
+                return False
+
+        self._refs[cid] = (small, now)
+        return True
+
+    def forget(self, cid):
+        """채널 제거/URL 교체 시 기준 프레임 삭제 (다음 프레임은 무조건 추론)"""
+        self._refs.pop(cid, None)
+
+    def stats(self):
+        return {
+            cid: {"checked": checked, "skipped": skipped,
+                  "skip_ratio": round(skipped / checked, 3) if checked else 0.0}
+            for cid, (checked, skipped) in self._stats.items()
+        }
@@ -0,0 +1,30 @@
+import os
+import json
+
+# 채널 구성 파일 하나를 로컬 주소 전송기(local/url_sender.py)와 두 서버가 함께 읽음
+# {채널: {"cctv": ITS CCTV 이름, "camera": ROI 마스크 카메라 이름(상행선/하행선 폴더의 {camera}_mask.png)}}
+DEFAULT_CHANNELS_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                                     "channels.json")
+CHANNELS_PATH = os.environ.get("CHANNELS_CONFIG", DEFAULT_CHANNELS_PATH)
+
+
+def load_channels(path=None):
+    """채널 구성 파일 → {cid: {"cctv", "camera"}}. camera를 생략하면 CCTV 이름에서 노선 접두어를 뗀 이름"""
+    with open(path or CHANNELS_PATH, encoding="utf-8") as f:
+        raw = json.load(f)
+    channels = {}
+    for cid, config in raw.items():
+        cctv = config["cctv"]
+        camera = config.get("camera") or cctv.split("]", 1)[-1].split("(", 1)[0].strip()
+        channels[int(cid)] = {"cctv": cctv, "camera": camera}
+    return channels
+
+
+def channel_cameras(channels):
+    """{cid: 마스크 카메라 이름} (MaskRegistry용)"""
+    return {cid: config["camera"] for cid, config in channels.items()}
+
+
+def channel_targets(channels):
+    """{cid: ITS CCTV 이름} (CctvCatalog.resolve용)"""
+    return {cid: config["cctv"] for cid, config in channels.items()}
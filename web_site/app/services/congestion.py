@@ -0,0 +1,123 @@
+import os
+import math
+import time
+import threading
+from collections import deque
+from datetime import datetime
+
+# 혼잡도 구간 기본값 (0~1). CONGESTION_THRESHOLDS="0.25,0.5"로 변경 가능
+# 기본값은 main2.py의 기존 구간(0.25 / 0.5). main.py는 자체 기본값 0.3 / 0.6을 넘겨 기존 구간을 유지함
+# 주의: 예전에는 프레임 한 장의 원시 점유율로 상태를 정했지만, 이제는 원근 보정 점유율의 EMA 평활값 기준이므로
+#       같은 구간이어도 상태가 늦게 / 덜 바뀌고, 화면 위쪽(먼 곳) 픽셀 비중이 커져 원시 점유율과 값이 달라질 수 있음
+LEVELS = ("smooth", "moderate", "heavy")
+LABELS = {
+    "en": {"smooth": "Smooth", "moderate": "Moderate", "heavy": "Heavy"},  # main.py
+    "ko": {"smooth": "원활", "moderate": "서행", "heavy": "정체"},           # main2.py
+}
+THRESHOLDS = tuple(float(v) for v in os.environ.get("CONGESTION_THRESHOLDS", "0.25,0.5").split(","))
+HYSTERESIS = float(os.environ.get("CONGESTION_HYSTERESIS", 0.05))   # 구간 경계 위아래 여유 폭
+SMOOTHING_SEC = float(os.environ.get("CONGESTION_SMOOTHING_SEC", 5.0))  # EMA 시간 상수 (초)
+MIN_DWELL_SEC = float(os.environ.get("CONGESTION_MIN_DWELL_SEC", 10.0))  # 상태를 바꾼 뒤 최소 유지 시간
+
+
+def level_of(value, thresholds=THRESHOLDS):
+    """히스테리시스 없이 값이 속한 구간"""
+    index = 0
+    while index < len(thresholds) and value >= thresholds[index]:
+        index += 1
+    return LEVELS[index]
+
+
+class _DirectionState:
+    __slots__ = ("ema", "level", "updated", "since")
+
+    def __init__(self, value, level, now):
+        self.ema = value
+        self.level = level      # LEVELS 인덱스
+        self.updated = now
+        self.since = now        # 현재 상태에 들어온 시각
+
+
+class CongestionTracker:
+    """
+    채널/방향별 혼잡도 상태 기계 (프레임당 O(1) 갱신).
+    - 점유율은 시간 기반 EMA로 평활 (프레임 간격이 들쭉날쭉해도 같은 시간 상수: alpha = 1 - exp(-dt / tau))
+    - 구간 경계 ± hysteresis를 넘어야 상태가 바뀌고, 바뀐 뒤 min_dwell초 동안은 다시 바뀌지 않음
+    - 상태가 실제로 바뀔 때만 이벤트를 남김 (최근 max_events개 링 버퍼, seq로 이어 읽기)
+    결과 저장 쓰레드(인코딩 쓰레드 풀 / 워커 결과 수집 쓰레드)에서도 호출되므로 잠금으로 보호합니다.
+    """
+
+    def __init__(self, thresholds=THRESHOLDS, hysteresis=HYSTERESIS, smoothing_sec=SMOOTHING_SEC,
+                 min_dwell_sec=MIN_DWELL_SEC, max_events=500):
+        self.thresholds = tuple(thresholds)
+        self.hysteresis = hysteresis
+        self.smoothing_sec = smoothing_sec
+        self.min_dwell_sec = min_dwell_sec
+        self._lock = threading.Lock()
+        self._states = {}  # {(cid, direct): _DirectionState}
+        self._events = deque(maxlen=max_events)
+        self._seq = 0
+
+    def _target(self, level, value):
+        h = self.hysteresis
+        while level < len(self.thresholds) and value >= self.thresholds[level] + h:
+            level += 1
+        while level > 0 and value < self.thresholds[level - 1] - h:
+            level -= 1
+        return level
+
+    def update(self, cid, direct, value, now=None):
+        """새 점유율(0~1) 반영 → (평활 점유율, 상태 키)"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            state = self._states.get((cid, direct))
+            if state is None:
+                state = _DirectionState(value, LEVELS.index(level_of(value, self.thresholds)), now)
+                self._states[(cid, direct)] = state
+                return value, LEVELS[state.level]
+            dt = max(0.0, now - state.updated)
+            alpha = 1.0 - math.exp(-dt / self.smoothing_sec) if self.smoothing_sec > 0 else 1.0
+            state.ema += alpha * (value - state.ema)
+            state.updated = now
+            target = self._target(state.level, state.ema)
+            if target != state.level and now - state.since >= self.min_dwell_sec:
+                self._seq += 1
+                self._events.append({
+                    "seq": self._seq,
+                    "channel_id": cid,
+                    "direction": direct,
+                    "from": LEVELS[state.level],
+                    "to": LEVELS[target],
+                    "occupancy_rate_smoothed": round(state.ema * 100, 1),
+                    "held_sec": round(now - state.since, 1),
+                    "timestamp": datetime.now().isoformat(),
+                })
+                print(f"🚦 [채널 {cid} {direct}] {LEVELS[state.level]} → {LEVELS[target]} "
+                      f"({state.ema * 100:.1f}%)")
+                state.level = target
+                state.since = now
+            return state.ema, LEVELS[state.level]
+
+    def forget(self, cid):
+        """채널 제거 / 스트림 교체 시 상태 초기화"""
+        with self._lock:
+            for key in [k for k in self._states if k[0] == cid]:
+                del self._states[key]
+
+    def events(self, since=0, cid=None):
+        """seq가 since보다 큰 상태 전환 이벤트 (오래된 순)"""
+        with self._lock:
+            return [e for e in self._events if e["seq"] > since and (cid is None or e["channel_id"] == cid)]
+
+    def snapshot(self):
+        """{cid: {direct: {"level", "occupancy_rate_smoothed", "held_sec"}}}"""
+        now = time.monotonic()
+        out = {}
+        with self._lock:
+            for (cid, direct), state in self._states.items():
+                out.setdefault(cid, {})[direct] = {
+                    "level": LEVELS[state.level],
+                    "occupancy_rate_smoothed": round(state.ema * 100, 1),
+                    "held_sec": round(now - state.since, 1),
+                }
+        return out
@@ -0,0 +1,110 @@
+import os
+import shutil
+import subprocess
+import numpy as np
+
+FFMPEG_BIN = os.environ.get("FFMPEG_BIN", "ffmpeg")
+FFPROBE_BIN = os.environ.get("FFPROBE_BIN", "ffprobe")
+
+
+def probe_size(url, timeout_ms=10000):
+    """스트림 원본 해상도 (W, H). ffprobe가 없으면 OpenCV로 한 번 열어서 확인"""
+    if shutil.which(FFPROBE_BIN):
+        try:
+            out = subprocess.run(
+                [FFPROBE_BIN, "-v", "error", "-rw_timeout", str(timeout_ms * 1000),
+                 "-select_streams", "v:0", "-show_entries", "stream=width,height",
+                 "-of", "csv=p=0:s=x", url],
+                capture_output=True, timeout=timeout_ms / 1000 + 5, check=True)
+            w, h = out.stdout.decode().strip().splitlines()[0].split("x")[:2]
+            return int(w), int(h)
+        except (subprocess.SubprocessError, ValueError, IndexError):
+            return None
+    import cv2
+    cap = cv2.VideoCapture(url)
+    try:
+        w, h = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        return (w, h) if w > 0 and h > 0 else None
+    finally:
+        cap.release()
+
+
+class FfmpegCapture:
+    """
+    FFmpeg 서브프로세스 파이프 디코더 (cv2.VideoCapture의 grab / retrieve / isOpened / release 부분 호환).
+    - keyframes_only: 디코더 단계에서 키프레임 외에는 디코딩 자체를 건너뜀 (-skip_frame nokey)
+    - every=k: k번째 프레임만 변환/전송 (select 필터)
+    - size=(W, H): 스케일을 FFmpeg 안에서 bgr24 변환과 함께 처리 → 파이썬에는 추론/표시 해상도 프레임만 전달
+    - 파이프 출력은 readinto로 프레임 배열에 바로 읽음 (중간 bytes 객체 / 복사 없음)
+
+    retrieve()가 돌려준 프레임의 소유권은 호출한 쪽으로 넘어갑니다. 프레임마다 새 배열에 읽으므로
+    최신 프레임 슬롯, 추론/인코딩 중인 배치가 프레임을 얼마나 오래 들고 있어도 내용이 바뀌지 않습니다.
+    (큰 배열 할당 비용은 readinto 자체에 비해 무시할 수준이라 버퍼를 돌려 쓰지 않음)
+    """
+
+    def __init__(self, url, size=None, every=1, keyframes_only=False, timeout_ms=10000):
+        self.url = url
+        self.size = tuple(size) if size else probe_size(url, timeout_ms)
+        self.proc = None
+        self._frame = None
+        if self.size is None:
+            return
+        w, h = self.size
+        self._shape = (h, w, 3)
+        self._frame_bytes = w * h * 3
+
+        cmd = [FFMPEG_BIN, "-hide_banner", "-loglevel", "error", "-nostdin",
+               "-fflags", "nobuffer", "-rw_timeout", str(timeout_ms * 1000)]
+        if keyframes_only:
+            cmd += ["-skip_frame", "nokey"]
+        cmd += ["-i", url, "-an", "-sn", "-threads", "1"]
+        filters = []
+        if every > 1:
+            filters.append(f"select='not(mod(n\\,{every}))'")
+        filters.append(f"scale={w}:{h}")
+        cmd += ["-vf", ",".join(filters), "-fps_mode", "passthrough",
+                "-pix_fmt", "bgr24", "-f", "rawvideo", "pipe:1"]
+        try:
+            self.proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                         stdin=subprocess.DEVNULL, bufsize=0)
+        except OSError:
+            self.proc = None
+
+    def isOpened(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def set(self, prop, value):
+        return False  # 버퍼 크기 등은 FFmpeg 옵션으로 처리
+
+    def grab(self):
+        """다음 (선택된) 프레임 하나를 버퍼로 읽음. 스트림이 끝나거나 끊기면 False"""
+        if not self.isOpened():
+            return False
+        buf = np.empty(self._shape, dtype=np.uint8)  # 소비자에게 넘길 새 프레임 (돌려 쓰지 않음)
+        view = memoryview(buf).cast("B")
+        filled = 0
+        while filled < self._frame_bytes:
+            n = self.proc.stdout.readinto(view[filled:])
+            if not n:
+                self._frame = None
+                return False
+            filled += n
+        self._frame = buf
+        return True
+
+    def retrieve(self):
+        frame, self._frame = self._frame, None
+        return (frame is not None), frame
+
+    def read(self):
+        return self.retrieve() if self.grab() else (False, None)
+
+    def release(self):
+        if self.proc is not None:
+            self.proc.kill()
+            try:
+                self.proc.wait(timeout=2)
+            except subprocess.TimeoutExpired:
+                pass
+            self.proc.stdout.close()
+            self.proc = None
@@ -0,0 +1,34 @@
+import struct
+
+# /predict_batch 본문: [u32 채널 ID][u32 JPEG 길이][JPEG 바이트] 반복 (네트워크 바이트 순서)
+# multipart 파서 없이 memoryview로 잘라 쓰므로 프레임 수만큼 복사/파싱 비용이 늘지 않음
+HEADER = struct.Struct("!II")
+CONTENT_TYPE = "application/x-frame-batch"
+
+
+def pack_frames(items):
+    """{cid: jpeg bytes} 또는 [(cid, jpeg)] → 요청 본문 bytes"""
+    if isinstance(items, dict):
+        items = items.items()
+    parts = []
+    for cid, jpeg in items:
+        parts.append(HEADER.pack(int(cid), len(jpeg)))
+        parts.append(jpeg)
+    return b"".join(parts)
+
+
+def unpack_frames(body):
+    """요청 본문 → [(cid, JPEG memoryview)]. 길이가 맞지 않으면 ValueError"""
+    view = memoryview(body)
+    items = []
+    offset = 0
+    while offset < len(view):
+        if offset + HEADER.size > len(view):
+            raise ValueError(f"헤더가 잘렸습니다 (offset {offset})")
+        cid, length = HEADER.unpack_from(view, offset)
+        offset += HEADER.size
+        if offset + length > len(view):
+            raise ValueError(f"채널 {cid}의 JPEG 길이({length})가 본문을 넘습니다")
+        items.append((cid, view[offset:offset + length]))
+        offset += length
+    return items
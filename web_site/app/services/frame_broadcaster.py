@@ -0,0 +1,76 @@
+import asyncio
+
+
+class FrameBroadcaster:
+    """
+    채널별 최신 JPEG를 raw bytes + 버전 번호로 보관하고, 새 프레임이 들어올 때만
+    asyncio.Condition으로 구독자 전원에게 한 번에 알리는 MJPEG 팬아웃.
+    multipart 파트(헤더 + JPEG)는 발행 시 한 번만 만들어 모든 구독자가 같은 bytes를 그대로 전송합니다.
+    채널별 시청자 수를 세어 두므로, 분석 루프는 시청자가 없는 채널의 시각화/인코딩을 건너뛸 수 있습니다.
+    """
+
+    def __init__(self):
+        self._loop = None
+        self._parts = {}  # {cid: (version, multipart 파트 bytes)}
+        self._conds = {}  # {cid: asyncio.Condition}
+        self._viewers = {}  # {cid: 현재 구독 중인 시청자 수}
+
+    def bind(self, loop):
+        """이벤트 루프 등록 (startup/lifespan에서 호출). 다른 쓰레드의 publish는 이 루프로 넘겨짐"""
+        self._loop = loop
+
+    def _cond(self, cid):
+        cond = self._conds.get(cid)
+        if cond is None:
+            cond = self._conds[cid] = asyncio.Condition()
+        return cond
+
+    def publish(self, cid, jpeg_bytes):
+        """새 JPEG 발행. 이벤트 루프 쓰레드와 인코딩 쓰레드 어디서든 호출 가능"""
+        part = b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + jpeg_bytes + b'\r\n'
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is not None and running is self._loop:
+            self._set(cid, part)
+        elif self._loop is not None:
+            try:
+                self._loop.call_soon_threadsafe(self._set, cid, part)
+            except RuntimeError:
+                pass  # 종료 중 이벤트 루프가 이미 닫힌 경우
+
+    def _set(self, cid, part):
+        version = self._parts.get(cid, (0, None))[0] + 1
+        self._parts[cid] = (version, part)
+        asyncio.ensure_future(self._notify(cid))
+
+    async def _notify(self, cid):
+        cond = self._cond(cid)
+        async with cond:
+            cond.notify_all()
+
+    def version(self, cid):
+        return self._parts.get(cid, (0, None))[0]
+
+    def viewer_count(self, cid):
+        """현재 /video_feed/{cid}를 보고 있는 시청자 수 (어느 쓰레드에서든 읽기 가능)"""
+        return self._viewers.get(cid, 0)
+
+    async def subscribe(self, cid):
+        """새 프레임이 발행될 때마다 multipart 파트를 yield (같은 프레임은 다시 보내지 않음)"""
+        cond = self._cond(cid)
+        seen = 0
+        self._viewers[cid] = self._viewers.get(cid, 0) + 1
+        try:
+            while True:
+                async with cond:
+                    await cond.wait_for(lambda: self.version(cid) > seen)
+                    seen, part = self._parts[cid]
+                yield part
+        finally:
+            self._viewers[cid] -= 1
+            if self._viewers[cid] == 0:
+                # 렌더링이 멈추므로, 다음 시청자가 오래된 프레임을 받지 않도록 비워 둠
+                del self._viewers[cid]
+                self._parts.pop(cid, None)
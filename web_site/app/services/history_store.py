@@ -0,0 +1,399 @@
+import os
+import math
+import time
+import threading
+from datetime import datetime
+import numpy as np
+
+METRICS = ("up", "low", "vehicle_total_count")
+ROLLUP_STEPS = {"1s": 1, "1m": 60, "15m": 900}
+# p95는 버킷별 고정 구간 히스토그램(폭 1 = 1%p / 차량 1대)으로 계산 → 메모리 고정, 증분 갱신
+HIST_BINS = 201
+
+# 영속화 레코드: 채널 ID, epoch 초, up/low 점유율(%), 차량 수
+RECORD_DTYPE = np.dtype([("cid", "<i4"), ("ts", "<f8"), ("up", "<f4"), ("low", "<f4"), ("count", "<f4")])
+
+
+class RingSeries:
+    """numpy 배열 기반 고정 크기 링 버퍼 (타임스탬프 + 값 행)"""
+
+    def __init__(self, capacity, n_cols):
+        self.capacity = capacity
+        self.ts = np.zeros(capacity, dtype=np.float64)
+        self.values = np.full((capacity, n_cols), np.nan, dtype=np.float32)
+        self.head = 0  # 다음에 쓸 위치
+        self.size = 0
+
+    def append(self, ts, row):
+        self.ts[self.head] = ts
+        self.values[self.head] = row
+        self.head = (self.head + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def oldest(self):
+        if self.size == 0:
+            return None
+        return self.ts[(self.head - self.size) % self.capacity]
+
+    def state(self):
+        return {"ts": self.ts.copy(), "values": self.values.copy(), "pos": np.array([self.head, self.size])}
+
+    def load_state(self, state):
+        if state["ts"].shape != self.ts.shape or state["values"].shape != self.values.shape:
+            raise ValueError("링 버퍼 크기가 스냅숏과 다릅니다")
+        self.ts[:] = state["ts"]
+        self.values[:] = state["values"]
+        self.head, self.size = (int(v) for v in state["pos"])
+
+    def range(self, t0, t1):
+        """[t0, t1] 구간의 (ts, values)를 시간순으로 반환"""
+        if self.size == 0:
+            return self.ts[:0], self.values[:0]
+        order = (np.arange(self.size) + self.head - self.size) % self.capacity
+        ts = self.ts[order]
+        lo, hi = np.searchsorted(ts, t0, "left"), np.searchsorted(ts, t1, "right")
+        sel = order[lo:hi]
+        return self.ts[sel], self.values[sel]
+
+
+class Rollup:
+    """step 초 단위 버킷으로 mean/max/p95를 증분 유지하는 롤업 (닫힌 버킷만 링 버퍼에 저장)"""
+
+    def __init__(self, step, capacity, n_metrics):
+        self.step = step
+        self.n = n_metrics
+        # 열 구성: [샘플 수, mean×n, max×n, p95×n]
+        self.series = RingSeries(capacity, 1 + 3 * n_metrics)
+        self.bucket = None
+        self.count = 0
+        self.sums = np.zeros(n_metrics, dtype=np.float64)
+        self.valid = np.zeros(n_metrics, dtype=np.int64)
+        self.maxs = np.full(n_metrics, -np.inf, dtype=np.float64)
+        self.hist = np.zeros((n_metrics, HIST_BINS), dtype=np.int32)
+        self._rows = np.arange(n_metrics)
+
+    def add(self, ts, row):
+        bucket = math.floor(ts / self.step) * self.step
+        if self.bucket is not None and bucket != self.bucket:
+            self.flush()
+        self.bucket = bucket
+        self.count += 1
+        ok = ~np.isnan(row)
+        self.sums[ok] += row[ok]
+        self.valid += ok
+        np.maximum(self.maxs, np.where(ok, row, -np.inf), out=self.maxs)
+        bins = np.clip(np.nan_to_num(row, nan=0.0), 0, HIST_BINS - 1).astype(np.intp)
+        self.hist[self._rows[ok], bins[ok]] += 1
+
+    def _current_row(self):
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.where(self.valid > 0, self.sums / np.maximum(self.valid, 1), np.nan)
+        maxs = np.where(self.valid > 0, self.maxs, np.nan)
+        cum = np.cumsum(self.hist, axis=1)
+        p95 = np.argmax(cum >= np.ceil(0.95 * self.valid)[:, None], axis=1).astype(np.float64)
+        p95 = np.where(self.valid > 0, p95, np.nan)
+        return np.concatenate(([self.count], mean, maxs, p95))
+
+    def flush(self):
+        if self.bucket is None or self.count == 0:
+            return
+        self.series.append(self.bucket, self._current_row())
+        self.count = 0
+        self.sums[:] = 0
+        self.valid[:] = 0
+        self.maxs[:] = -np.inf
+        self.hist[:] = 0
+
+    def state(self):
+        """닫힌 버킷 링 + 진행 중인 버킷의 누적값 (스냅숏용 복사본)"""
+        state = {f"series.{key}": value for key, value in self.series.state().items()}
+        state.update(bucket=np.array([np.nan if self.bucket is None else self.bucket, self.count]),
+                     sums=self.sums.copy(), valid=self.valid.copy(), maxs=self.maxs.copy(), hist=self.hist.copy())
+        return state
+
+    def load_state(self, state):
+        self.series.load_state({key[len("series."):]: value for key, value in state.items()
+                                if key.startswith("series.")})
+        bucket, count = state["bucket"]
+        self.bucket = None if np.isnan(bucket) else float(bucket)
+        self.count = int(count)
+        for name in ("sums", "valid", "maxs", "hist"):
+            getattr(self, name)[:] = state[name]
+
+    def range(self, t0, t1):
+        """닫힌 버킷 + 현재 진행 중인 버킷까지 포함"""
+        ts, values = self.series.range(t0, t1)
+        if self.bucket is not None and self.count and t0 <= self.bucket <= t1:
+            ts = np.append(ts, self.bucket)
+            values = np.vstack([values, self._current_row()[None, :].astype(np.float32)])
+        return ts, values
+
+
+class ChannelHistory:
+    def __init__(self, raw_capacity, rollup_capacity):
+        self.raw = RingSeries(raw_capacity, len(METRICS))
+        self.rollups = {name: Rollup(step, rollup_capacity[name], len(METRICS))
+                        for name, step in ROLLUP_STEPS.items()}
+
+    def add(self, ts, row):
+        self.raw.append(ts, row)
+        for rollup in self.rollups.values():
+            rollup.add(ts, row)
+
+    def state(self):
+        state = {f"raw.{key}": value for key, value in self.raw.state().items()}
+        for name, rollup in self.rollups.items():
+            state.update({f"{name}.{key}": value for key, value in rollup.state().items()})
+        return state
+
+    def load_state(self, state):
+        self.raw.load_state({key[len("raw."):]: value for key, value in state.items() if key.startswith("raw.")})
+        for name, rollup in self.rollups.items():
+            prefix = f"{name}."
+            rollup.load_state({key[len(prefix):]: value for key, value in state.items() if key.startswith(prefix)})
+
+
+def parse_time(value, default):
+    """epoch 초(숫자) 또는 ISO 8601 문자열 → epoch 초"""
+    if value is None or value == "":
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def parse_step(value):
+    """"raw" | "1s" | "1m" | "15m" | 초(숫자) → 초 (raw는 0)"""
+    if value is None or value == "" or value == "raw":
+        return 0.0
+    if value in ROLLUP_STEPS:
+        return float(ROLLUP_STEPS[value])
+    units = {"s": 1, "m": 60, "h": 3600}
+    if value[-1] in units:
+        return float(value[:-1]) * units[value[-1]]
+    return float(value)
+
+
+class OccupancyHistoryStore:
+    """
+    채널별 up/low occupancy_rate, vehicle_total_count 시계열 저장소 (프로세스 내, 메모리 상한 고정).
+    - 원본 샘플: 링 버퍼 (기본 36,000개 ≈ 10Hz 1시간)
+    - 1s / 1m / 15m 롤업: mean / max / p95를 샘플마다 증분 갱신
+    - persist_path 지정 시 고정 크기 바이너리 레코드를 append-only로 기록하고, 시작 시 다시 읽어 복원
+    - compact_sec마다 / 종료 시 메모리 링 버퍼 전체를 스냅숏(persist_path.snap.npz)으로 쓰고 로그를 비움
+      → 파일 크기는 링 버퍼 용량 + compact_sec 동안의 레코드로 고정, 복원은 스냅숏 + 그 이후 로그만 읽음
+    """
+
+    def __init__(self, persist_path=None, raw_capacity=36000, rollup_capacity=None, compact_sec=3600.0):
+        self.raw_capacity = raw_capacity
+        # 기본 보관 기간: 1s → 6시간, 1m → 7일, 15m → 30일
+        self.rollup_capacity = rollup_capacity or {"1s": 21600, "1m": 10080, "15m": 2880}
+        # 가장 긴 롤업 보관 기간보다 오래된 레코드는 복원할 필요가 없음
+        self.retention_sec = max(cap * ROLLUP_STEPS[name] for name, cap in self.rollup_capacity.items())
+        self.channels = {}
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._file = None
+        self._last_flush = 0.0
+        self._last_ts = 0.0  # 기록된 가장 최근 샘플 시각 (스냅숏에 포함된 범위)
+        self.persist_path = persist_path
+        self._snapshot_path = f"{persist_path}.snap.npz" if persist_path else None
+        self._closed = threading.Event()
+        if persist_path:
+            self._replay(persist_path)
+            self._file = open(persist_path, "ab")
+            self.compact()  # 예전 형식(로그만 있는 큰 파일)도 바로 스냅숏으로 정리
+            if compact_sec > 0:
+                threading.Thread(target=self._compact_loop, args=(compact_sec,), name="history-compact",
+                                 daemon=True).start()
+
+    def _channel(self, cid):
+        ch = self.channels.get(cid)
+        if ch is None:
+            ch = self.channels[cid] = ChannelHistory(self.raw_capacity, self.rollup_capacity)
+        return ch
+
+    def _replay(self, path):
+        """스냅숏을 읽은 뒤, 그 이후이면서 보관 기간 안의 로그 레코드만 다시 적용"""
+        cutoff = time.time() - self.retention_sec
+        until = cutoff
+        if os.path.exists(self._snapshot_path):
+            try:
+                until = max(cutoff, self._load_snapshot(self._snapshot_path))
+            except Exception as e:
+                print(f"⚠️ 점유율 이력 스냅숏 복원 실패 (로그만 사용): {e}")
+                self.channels = {}
+        replayed = 0
+        # .old는 스냅숏을 쓰는 도중 종료된 경우에만 남음 → 스냅숏에 이미 들어간 레코드(until 이하)는 건너뜀
+        for log_path, since in ((f"{path}.old", until), (path, cutoff)):
+            if not os.path.exists(log_path):
+                continue
+            size = os.path.getsize(log_path) // RECORD_DTYPE.itemsize * RECORD_DTYPE.itemsize
+            records = np.fromfile(log_path, dtype=RECORD_DTYPE, count=size // RECORD_DTYPE.itemsize)
+            records = records[records["ts"] > since]
+            for rec in records:
+                row = np.array([rec["up"], rec["low"], rec["count"]], dtype=np.float64)
+                self._channel(int(rec["cid"])).add(float(rec["ts"]), row)
+            if len(records):
+                self._last_ts = max(self._last_ts, float(records["ts"].max()))
+            replayed += len(records)
+        print(f"✅ 점유율 이력 복원: 채널 {len(self.channels)}개, 로그 {replayed}건 ({path})")
+
+    def _load_snapshot(self, path):
+        """스냅숏의 채널별 링 버퍼를 복원하고 스냅숏 시각을 반환"""
+        with np.load(path) as data:
+            until = float(data["until"])
+            states = {}
+            for key in data.files:
+                if key == "until":
+                    continue
+                cid, _, name = key.partition("/")
+                states.setdefault(int(cid), {})[name] = data[key]
+        for cid, state in states.items():
+            self._channel(cid).load_state(state)
+        self._last_ts = until
+        return until
+
+    def compact(self):
+        """
+        메모리 링 버퍼 전체를 스냅숏으로 쓰고 로그를 새로 시작.
+        잠금 안에서는 상태 복사와 로그 교체만 하고, 파일 쓰기는 잠금 밖에서 수행 (add를 막지 않음)
+        """
+        if self._file is None:
+            return
+        with self._compact_lock:
+            with self._lock:
+                if self._file is None:
+                    return
+                until = self._last_ts
+                arrays = {f"{cid}/{key}": value for cid, ch in self.channels.items()
+                          for key, value in ch.state().items()}
+                self._file.close()
+                os.replace(self.persist_path, f"{self.persist_path}.old")
+                self._file = open(self.persist_path, "ab")
+            arrays["until"] = np.array(until)
+            tmp = f"{self._snapshot_path}.tmp"
+            with open(tmp, "wb") as f:
+                np.savez(f, **arrays)
+            os.replace(tmp, self._snapshot_path)
+            os.remove(f"{self.persist_path}.old")
+
+    def _compact_loop(self, interval):
+        while not self._closed.wait(interval):
+            try:
+                self.compact()
+            except Exception as e:
+                print(f"⚠️ 점유율 이력 스냅숏 실패: {e}")
+
+    def add(self, cid, ts, up, low, vehicle_count):
+        """샘플 1개 추가. 방향 ROI가 없으면 up/low에 None"""
+        row = np.array([np.nan if up is None else up,
+                        np.nan if low is None else low,
+                        vehicle_count], dtype=np.float64)
+        with self._lock:
+            self._channel(cid).add(ts, row)
+            self._last_ts = max(self._last_ts, ts)
+            if self._file is not None:
+                rec = np.array([(cid, ts, row[0], row[1], row[2])], dtype=RECORD_DTYPE)
+                self._file.write(rec.tobytes())
+                if ts - self._last_flush >= 1.0:
+                    self._file.flush()
+                    self._last_flush = ts
+
+    def add_result(self, cid, result):
+        """latest_results 형식의 결과 dict를 그대로 기록"""
+        data = result.get("results", {})
+        self.add(cid, time.time(),
+                 data.get("up", {}).get("occupancy_rate"),
+                 data.get("low", {}).get("occupancy_rate"),
+                 result.get("vehicle_total_count", 0))
+
+    def query(self, cid, t0, t1, step=0.0):
+        """
+        [t0, t1] 구간 조회. step 이하 해상도의 롤업 중 가장 굵은 것을 사용하고,
+        보관 기간이 모자라면 더 굵은 롤업으로 넘어감. step이 롤업 간격보다 크면 다시 묶음
+        (이때 mean은 샘플 수 가중 평균, max는 최대값, p95는 구성 버킷 p95의 최대값으로 근사)
+        """
+        with self._lock:
+            ch = self.channels.get(cid)
+            if ch is None:
+                return None
+            tiers = sorted(ROLLUP_STEPS.items(), key=lambda kv: kv[1])
+            if step < 1 and (ch.raw.oldest() is not None and ch.raw.oldest() <= t0):
+                ts, values = ch.raw.range(t0, t1)
+                return self._format_raw(cid, ts, values)
+
+            chosen = None
+            for name, tier_step in tiers:
+                if tier_step > max(step, 1):
+                    break
+                chosen = name
+            chosen = chosen or tiers[0][0]
+            names = [n for n, _ in tiers]
+            for name in names[names.index(chosen):]:
+                oldest = ch.rollups[name].series.oldest()
+                chosen = name
+                if oldest is None or oldest <= t0:
+                    break
+            rollup = ch.rollups[chosen]
+            ts, values = rollup.range(t0, t1)
+            out_step = max(step, rollup.step)
+            if out_step > rollup.step and len(ts):
+                ts, values = self._regroup(ts, values, out_step)
+            return self._format_rollup(cid, chosen, out_step, ts, values)
+
+    @staticmethod
+    def _regroup(ts, values, step):
+        n = len(METRICS)
+        keys = np.floor(ts / step) * step
+        uniq, inverse = np.unique(keys, return_inverse=True)
+        counts = values[:, 0].astype(np.float64)
+        out = np.full((len(uniq), 1 + 3 * n), np.nan, dtype=np.float64)
+        out[:, 0] = np.bincount(inverse, weights=counts, minlength=len(uniq))
+        for j in range(n):
+            mean = values[:, 1 + j].astype(np.float64)
+            ok = ~np.isnan(mean)
+            w = np.where(ok, counts, 0.0)
+            num = np.bincount(inverse, weights=np.where(ok, mean, 0.0) * w, minlength=len(uniq))
+            den = np.bincount(inverse, weights=w, minlength=len(uniq))
+            with np.errstate(invalid="ignore", divide="ignore"):
+                out[:, 1 + j] = np.where(den > 0, num / np.maximum(den, 1e-12), np.nan)
+            for col in (1 + n + j, 1 + 2 * n + j):
+                agg = np.full(len(uniq), -np.inf)
+                np.maximum.at(agg, inverse, np.nan_to_num(values[:, col], nan=-np.inf))
+                out[:, col] = np.where(np.isinf(agg), np.nan, agg)
+        return uniq, out
+
+    @staticmethod
+    def _to_list(arr):
+        return [None if math.isnan(v) else round(float(v), 2) for v in arr]
+
+    def _format_raw(self, cid, ts, values):
+        out = {"channel_id": cid, "resolution": "raw", "step": 0, "t": ts.tolist()}
+        for j, name in enumerate(METRICS):
+            out[name] = self._to_list(values[:, j])
+        return out
+
+    def _format_rollup(self, cid, resolution, step, ts, values):
+        n = len(METRICS)
+        out = {"channel_id": cid, "resolution": resolution, "step": step,
+               "t": ts.tolist(), "samples": [int(c) for c in values[:, 0]]}
+        for j, name in enumerate(METRICS):
+            out[name] = {
+                "mean": self._to_list(values[:, 1 + j]),
+                "max": self._to_list(values[:, 1 + n + j]),
+                "p95": self._to_list(values[:, 1 + 2 * n + j]),
+            }
+        return out
+
+    def close(self):
+        self._closed.set()
+        try:
+            self.compact()
+        except Exception as e:
+            print(f"⚠️ 점유율 이력 스냅숏 실패: {e}")
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -0,0 +1,120 @@
+import os
+import abc
+import shutil
+import importlib.util
+
+
+def _has_module(name):
+    return importlib.util.find_spec(name) is not None
+
+
+def export_model(pt_path, fmt, imgsz, cache_dir=None):
+    """
+    .pt 가중치를 ONNX / OpenVINO로 한 번만 변환하고 캐시 경로를 반환.
+    캐시가 원본 .pt보다 최신이면 변환을 건너뜁니다.
+    """
+    from ultralytics import YOLO
+
+    cache_dir = cache_dir or os.path.dirname(os.path.abspath(pt_path))
+    stem = os.path.splitext(os.path.basename(pt_path))[0]
+    if fmt == "onnx":
+        cached = os.path.join(cache_dir, f"{stem}_{imgsz}.onnx")
+    else:
+        cached = os.path.join(cache_dir, f"{stem}_{imgsz}_{fmt}_model")
+
+    if os.path.exists(cached) and os.path.getmtime(cached) >= os.path.getmtime(pt_path):
+        print(f"✅ 변환된 모델 캐시 사용: {cached}")
+        return cached
+
+    print(f"⏳ {fmt} 변환 중 (최초 1회, imgsz={imgsz})...")
+    # dynamic=True: 채널 수에 따라 배치 크기가 바뀌므로 배치 축을 고정하지 않음
+    exported = YOLO(pt_path).export(format=fmt, imgsz=imgsz, dynamic=True)
+    os.makedirs(cache_dir, exist_ok=True)
+    if os.path.exists(cached):
+        shutil.rmtree(cached) if os.path.isdir(cached) else os.remove(cached)
+    shutil.move(str(exported), cached)
+    print(f"✅ {fmt} 변환 완료: {cached}")
+    return cached
+
+
+class InferenceEngine(abc.ABC):
+    """분석 루프가 호출하는 추론 인터페이스. predict는 Ultralytics Results 리스트를 반환합니다."""
+
+    name = "base"
+    device = "cpu"
+    half = False
+
+    @abc.abstractmethod
+    def predict(self, frames, imgsz, conf=0.25, iou=0.7):
+        """프레임 리스트(BGR ndarray) → 같은 순서의 Results 리스트"""
+
+
+class TorchEngine(InferenceEngine):
+    """PyTorch(.pt) 백엔드. GPU가 있으면 FP16으로 실행"""
+
+    name = "torch"
+
+    def __init__(self, pt_path, device=None, half=None):
+        import torch
+        from ultralytics import YOLO
+
+        cuda = torch.cuda.is_available()
+        self.device = device or ("cuda:0" if cuda else "cpu")
+        on_gpu = self.device.startswith("cuda")
+        self.half = on_gpu if half is None else (half and on_gpu)
+
+        self.model = YOLO(pt_path)
+        self.model.to(self.device)
+        if self.half:
+            self.model.half()  # 모델 가중치를 FP16으로 고정
+
+    def predict(self, frames, imgsz, conf=0.25, iou=0.7):
+        return self.model.predict(source=frames, imgsz=imgsz, conf=conf, iou=iou,
+                                  device=self.device, half=self.half, verbose=False)
+
+
+class ExportedEngine(InferenceEngine):
+    """ONNX Runtime / OpenVINO 백엔드 (CPU 전용 노드용, 그래프 최적화 런타임)"""
+
+    def __init__(self, pt_path, fmt, imgsz, cache_dir=None):
+        from ultralytics import YOLO
+
+        self.name = fmt
+        self.path = export_model(pt_path, fmt, imgsz, cache_dir)
+        self.model = YOLO(self.path, task="segment")
+
+    def predict(self, frames, imgsz, conf=0.25, iou=0.7):
+        return self.model.predict(source=frames, imgsz=imgsz, conf=conf, iou=iou,
+                                  device="cpu", verbose=False)
+
+
+def create_engine(pt_path, imgsz, backend=None, cache_dir=None):
+    """
+    실행 환경에 맞는 엔진을 선택.
+    backend: "auto" | "torch" | "onnx" | "openvino" (미지정 시 INFERENCE_BACKEND 환경변수, 기본 auto)
+    auto: GPU → torch, CPU → onnxruntime → openvino → torch 순
+    """
+    backend = (backend or os.environ.get("INFERENCE_BACKEND", "auto")).lower()
+
+    if backend == "auto":
+        import torch
+        if torch.cuda.is_available():
+            backend = "torch"
+        elif _has_module("onnxruntime"):
+            backend = "onnx"
+        elif _has_module("openvino"):
+            backend = "openvino"
+        else:
+            backend = "torch"
+
+    if backend in ("onnx", "openvino"):
+        try:
+            engine = ExportedEngine(pt_path, backend, imgsz, cache_dir)
+            print(f"✅ 추론 엔진: {engine.name} ({engine.path})")
+            return engine
+        except Exception as e:
+            print(f"⚠️ {backend} 엔진 준비 실패, PyTorch로 대체합니다: {e}")
+
+    engine = TorchEngine(pt_path)
+    print(f"✅ 추론 엔진: torch ({engine.device}, half={engine.half})")
+    return engine
@@ -0,0 +1,242 @@
+import os
+import time
+import queue
+import threading
+import multiprocessing as mp
+from app.services.shm_ring import SharedFrameRing
+
+
+def _worker_main(worker_id, ring_spec, pt_path, imgsz, roi_masks, horizons, jpeg_quality, num_threads,
+                 job_queue, result_queue):
+    """워커 프로세스: 자기 모델을 들고 공유 메모리 슬롯에서 프레임을 읽어 추론 + 점유율 + JPEG까지 처리"""
+    # 여러 워커가 코어를 나눠 쓰도록 라이브러리 쓰레드 수를 먼저 제한
+    os.environ["OMP_NUM_THREADS"] = str(num_threads)
+    import cv2
+    import torch
+    from app.services.inference_engine import create_engine
+    from app.services.occupancy import OccupancyKernel
+    from app.services.overlay_renderer import OverlayRenderer
+
+    torch.set_num_threads(num_threads)
+    cv2.setNumThreads(1)
+
+    engine = create_engine(pt_path, imgsz=imgsz)
+    ring = SharedFrameRing.attach(*ring_spec)
+    kernel = OccupancyKernel(horizons=horizons)
+    kernel.load(roi_masks)
+    renderer = OverlayRenderer(kernel)
+    print(f"✅ [워커 {worker_id}] 준비 완료 ({engine.name})")
+    result_queue.put(("ready", worker_id))
+
+    try:
+        while True:
+            job = job_queue.get()
+            if job is None:
+                break
+            job_id, slots, cids, renders = job
+            outputs = []
+            timings = []   # [(단계, 초)] → 부모 프로세스의 PipelineMetrics에 반영
+            failures = []  # 인코딩 실패 채널
+            try:
+                frames = [ring.frames[s] for s in slots]  # 공유 메모리 뷰 (복사 없음)
+                t0 = time.perf_counter()
+                results = engine.predict(frames, imgsz=imgsz)
+                timings.append(("predict", time.perf_counter() - t0))
+                for cid, render, frame, res in zip(cids, renders, frames, results):
+                    t0 = time.perf_counter()
+                    masks = res.masks.data if res.masks is not None else None
+                    rates, union = kernel.analyze(cid, masks)
+                    occupancy = {d: float(v) for d, v in rates.items()}
+                    weighted = kernel.weighted(cid, union)
+                    count = len(res.boxes) if res.boxes is not None else 0
+                    timings.append(("occupancy", time.perf_counter() - t0))
+                    jpeg = None
+                    if render:  # 시청자가 없는 채널은 시각화/인코딩 생략
+                        t0 = time.perf_counter()
+                        annotated = renderer.render(cid, frame, union)
+                        t1 = time.perf_counter()
+                        ok, buffer = cv2.imencode('.jpg', annotated, [int(cv2.IMWRITE_JPEG_QUALITY), jpeg_quality])
+                        timings += [("render", t1 - t0), ("encode", time.perf_counter() - t1)]
+                        if ok:
+                            jpeg = buffer.tobytes()
+                        else:
+                            failures.append(cid)
+                    outputs.append((cid, occupancy, weighted, count, jpeg))
+            except Exception as e:
+                print(f"⚠️ [워커 {worker_id}] 추론 오류: {e}")
+            # 결과가 없어도 슬롯은 반드시 돌려줌
+            result_queue.put(("result", job_id, outputs, (timings, failures)))
+    finally:
+        ring.close()
+
+
+class InferenceWorkerPool:
+    """
+    공유 메모리 링 버퍼 + 추론 워커 프로세스 풀.
+    GIL에 묶이지 않도록 추론/점유율/인코딩을 워커 프로세스에서 수행하고,
+    결과만 가벼운 큐로 FastAPI 프로세스에 돌려줍니다.
+    - 워커마다 작업 큐를 따로 두고 작업 번호 → (워커, 슬롯)을 기록해 두므로,
+      워커가 죽으면 결과 수집 쓰레드가 그 워커가 들고 있던 슬롯을 회수하고 워커를 다시 띄움
+    - 재시작이 max_restarts번을 넘어 살아 있는 워커가 없으면 failed=True (호출 쪽에서 프로세스 내 추론으로 전환)
+    """
+
+    def __init__(self, num_workers, pt_path, imgsz, roi_masks, on_result,
+                 slots_per_worker=16, jpeg_quality=65, metrics=None, horizons=None,
+                 max_restarts=3, check_sec=1.0):
+        self.num_workers = num_workers
+        self.on_result = on_result  # on_result(cid, occupancy, weighted, vehicle_count, jpeg_bytes)
+        self.metrics = metrics      # 워커가 보낸 단계별 시간을 반영할 PipelineMetrics
+        self.max_restarts = max_restarts
+        self.check_sec = check_sec  # 결과가 없어도 이 간격으로 워커 생존 확인
+        self.ring = SharedFrameRing(num_workers * slots_per_worker, (imgsz, imgsz, 3))
+
+        # torch/CUDA는 fork와 궁합이 나쁘므로 spawn 사용
+        self._ctx = mp.get_context("spawn")
+        self.results = self._ctx.Queue()
+        num_threads = max(1, (os.cpu_count() or 1) // num_workers)
+        self._worker_args = (self.ring.spec, pt_path, imgsz, roi_masks, horizons, jpeg_quality, num_threads)
+        self._lock = threading.Lock()
+        self._in_flight = {}  # {작업 번호: (워커 번호, 슬롯 목록)}
+        self._next_job = 0
+        self._closing = False
+        self.failed = False
+        self.counters = {"worker_deaths": 0, "restarts": 0, "reclaimed_slots": 0}
+        self.workers = [None] * num_workers  # [(프로세스, 작업 큐)] (영구 종료된 워커는 None)
+
+        # 첫 워커가 ONNX/OpenVINO 변환 캐시를 만든 뒤 나머지를 띄워 같은 파일을 동시에 변환하지 않도록 함
+        self._start_worker(0)
+        self._wait_ready(0)
+        for i in range(1, num_workers):
+            self._start_worker(i)
+
+        self._collector = threading.Thread(target=self._collect, name="inference-results", daemon=True)
+        self._collector.start()
+
+    def _start_worker(self, worker_id):
+        jobs = self._ctx.Queue()
+        process = self._ctx.Process(target=_worker_main, name=f"inference-worker-{worker_id}", daemon=True,
+                                    args=(worker_id, *self._worker_args, jobs, self.results))
+        process.start()
+        self.workers[worker_id] = (process, jobs)
+
+    def _wait_ready(self, worker_id):
+        """첫 워커 준비 대기 (모델 로드 중 죽으면 무한 대기하지 않고 예외)"""
+        process, _ = self.workers[worker_id]
+        while True:
+            try:
+                msg = self.results.get(timeout=self.check_sec)
+            except queue.Empty:
+                if not process.is_alive():
+                    raise RuntimeError(f"추론 워커 {worker_id}가 준비 중 종료되었습니다 (exitcode {process.exitcode})")
+                continue
+            if msg == ("ready", worker_id):
+                return
+
+    def wait_free(self, n, timeout=None):
+        return self.ring.wait_free(min(n, self.ring.n_slots), timeout=timeout)
+
+    def submit(self, batch):
+        """
+        [(cid, frame, render)] 배치를 빈 슬롯에 쓰고 처리 중인 작업이 가장 적은 워커에 전달. 슬롯이 부족하면 남는 프레임은 버림.
+        render가 False인 채널은 워커에서 시각화/JPEG 인코딩을 건너뜀
+        """
+        slots = self.ring.acquire(len(batch))
+        if not slots:
+            return 0
+        cids, renders = [], []
+        for slot, (cid, frame, render) in zip(slots, batch):
+            self.ring.frames[slot][...] = frame
+            cids.append(cid)
+            renders.append(render)
+        # 워커 선택 / 작업 등록 / 전달을 한 잠금 안에서 해야 죽은 워커의 큐에 넣고 잃어버리는 일이 없음
+        with self._lock:
+            busy = {i: 0 for i, worker in enumerate(self.workers) if worker is not None}
+            if not busy:
+                worker_id = None
+            else:
+                for wid, _ in self._in_flight.values():
+                    if wid in busy:
+                        busy[wid] += 1
+                worker_id = min(busy, key=busy.get)
+                job_id = self._next_job
+                self._next_job += 1
+                self._in_flight[job_id] = (worker_id, slots)
+                self.workers[worker_id][1].put((job_id, slots, cids, renders))
+        if worker_id is None:
+            self.ring.release(slots)
+            return 0
+        return len(slots)
+
+    def _collect(self):
+        while True:
+            try:
+                msg = self.results.get(timeout=self.check_sec)
+            except queue.Empty:
+                msg = ()
+            if msg is None:
+                break
+            if msg and msg[0] == "result":
+                self._on_result(msg)
+            if not self._closing:
+                self._check_workers()
+
+    def _on_result(self, msg):
+        _, job_id, outputs, (timings, failures) = msg
+        with self._lock:
+            job = self._in_flight.pop(job_id, None)
+        if job is None:
+            return  # 죽은 워커로 판단해 이미 슬롯을 회수한 작업
+        self.ring.release(job[1])
+        if self.metrics is not None:
+            for stage, seconds in timings:
+                self.metrics.observe(stage, seconds)
+            for cid in failures:
+                self.metrics.inc("encode_failures", cid)
+        for cid, occupancy, weighted, count, jpeg in outputs:
+            self.on_result(cid, occupancy, weighted, count, jpeg)
+
+    def _check_workers(self):
+        """죽은 워커가 들고 있던 슬롯을 회수하고, 재시작 한도 안이면 다시 띄움"""
+        for worker_id, worker in enumerate(self.workers):
+            if worker is None or worker[0].is_alive():
+                continue
+            process = worker[0]
+            with self._lock:
+                lost = [job_id for job_id, (wid, _) in self._in_flight.items() if wid == worker_id]
+                slots = [slot for job_id in lost for slot in self._in_flight.pop(job_id)[1]]
+                self.workers[worker_id] = None  # 새 워커가 뜨기 전까지 submit 대상에서 제외
+            self.ring.release(slots)
+            self.counters["worker_deaths"] += 1
+            self.counters["reclaimed_slots"] += len(slots)
+            print(f"❌ [워커 {worker_id}] 비정상 종료 (exitcode {process.exitcode}) → 처리 중이던 작업 {len(lost)}개, "
+                  f"슬롯 {len(slots)}개 회수")
+            if self.counters["restarts"] < self.max_restarts:
+                self.counters["restarts"] += 1
+                print(f"🔄 [워커 {worker_id}] 재시작 ({self.counters['restarts']}/{self.max_restarts})")
+                try:
+                    self._start_worker(worker_id)
+                except Exception as e:
+                    print(f"❌ [워커 {worker_id}] 재시작 실패: {e}")
+        if all(worker is None for worker in self.workers) and not self.failed:
+            self.failed = True
+            print("❌ 살아 있는 추론 워커가 없습니다 (재시작 한도 초과).")
+
+    def stats(self):
+        with self._lock:
+            in_flight = sum(len(slots) for _, slots in self._in_flight.values())
+        return {"alive": sum(1 for worker in self.workers if worker is not None and worker[0].is_alive()),
+                "workers": self.num_workers, "free_slots": self.ring.free_count(), "in_flight_slots": in_flight,
+                "failed": self.failed, **self.counters}
+
+    def close(self):
+        self._closing = True
+        workers = [worker for worker in self.workers if worker is not None]
+        for _, jobs in workers:
+            jobs.put(None)
+        for process, _ in workers:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self.results.put(None)
+        self._collector.join(timeout=self.check_sec + 1)
+        self.ring.close()
@@ -0,0 +1,191 @@
+import os
+import re
+import json
+import mmap
+import struct
+import cv2
+import numpy as np
+
+from app.services.channel_config import load_channels, channel_cameras
+
+# 카메라 이름 폴더 구조: {base}/상행선/{카메라}_mask.png, {base}/하행선/{카메라}_mask.PNG (확장자 대소문자 섞여 있음)
+DIRECTION_DIRS = {"up": "상행선", "low": "하행선"}
+# 기존 배포 경로 형식: {base}/{채널}_{up|low}.png
+_LEGACY_NAME = re.compile(r"^(\d+)_(up|low)\.png$", re.IGNORECASE)
+_CAMERA_NAME = re.compile(r"^(.+)_mask\.png$", re.IGNORECASE)
+
+_MAGIC = b"ROIMASK1"
+_HEADER_LEN = struct.Struct("<I")
+
+
+class MaskRegistry:
+    """
+    카메라 이름 / 채널 ID → 방향별(up/low) ROI 마스크 레지스트리.
+    - 상행선/하행선 폴더의 카메라 이름 마스크와 기존 {채널}_{방향}.png를 모두 찾음 (둘 다 있으면 기존 형식 우선)
+    - 대상 해상도(resolution)별로 한 번만 PNG 디코딩 + 리사이즈 + 이진화한 뒤 비트 단위로 압축(np.packbits)해
+      캐시 파일 하나에 저장. 다음 시작부터는 파일을 mmap으로 열어 비트만 풀기 때문에 수 ms 안에 로드
+      (1280x720 마스크 1장 = 115KB, 수백 대 카메라도 페이지 캐시에서 공유)
+    - 캐시 헤더에 원본 파일의 (크기, 수정 시각)을 기록해 두고, reload_if_changed()가 stat만으로 변경을 감지해 다시 컴파일
+    masks()는 load_all_masks와 같은 {"{cid}_{direct}": 0/255 uint8 마스크} 형식이라 OccupancyKernel.load에 바로 넘길 수 있습니다.
+    채널 → 카메라 이름은 channels.json(app/services/channel_config.py)에서 읽고, 마스크가 없는 채널은
+    다른 카메라 마스크로 대신하지 않고 missing()으로 보고합니다.
+    """
+
+    def __init__(self, base_path, channels=None, resolution=(1280, 720), cache_dir=None):
+        self.base_path = base_path
+        self.channels = dict(channel_cameras(load_channels()) if channels is None else channels)
+        self.resolution = tuple(resolution)
+        self.cache_dir = cache_dir or base_path
+        self._masks = {}      # {(cid, direct): 0/255 uint8 마스크}
+        self._signature = {}  # {"cid_direct": [경로, 크기, mtime_ns]}
+
+    @property
+    def cache_path(self):
+        w, h = self.resolution
+        return os.path.join(self.cache_dir, f".roi_masks_{w}x{h}.bin")
+
+    # ---------- 원본 탐색 ----------
+    def _camera_channels(self):
+        """{카메라 이름: [채널...]} (같은 카메라를 여러 채널이 볼 수 있음)"""
+        by_camera = {}
+        for cid, camera in self.channels.items():
+            by_camera.setdefault(camera, []).append(cid)
+        return by_camera
+
+    def scan(self):
+        """{(cid, direct): 원본 경로} (파일 내용은 읽지 않음)"""
+        sources = {}
+        if not os.path.isdir(self.base_path):
+            return sources
+        by_camera = self._camera_channels()
+        for direct, folder in DIRECTION_DIRS.items():
+            folder_path = os.path.join(self.base_path, folder)
+            if not os.path.isdir(folder_path):
+                continue
+            for name in sorted(os.listdir(folder_path)):
+                match = _CAMERA_NAME.match(name)
+                if match and match.group(1) in by_camera:
+                    for cid in by_camera[match.group(1)]:
+                        sources[(cid, direct)] = os.path.join(folder_path, name)
+        for name in sorted(os.listdir(self.base_path)):
+            match = _LEGACY_NAME.match(name)
+            if match:
+                sources[(int(match.group(1)), match.group(2).lower())] = os.path.join(self.base_path, name)
+        return sources
+
+    @staticmethod
+    def _signature_of(sources):
+        signature = {}
+        for (cid, direct), path in sources.items():
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            signature[f"{cid}_{direct}"] = [path, st.st_size, st.st_mtime_ns]
+        return signature
+
+    # ---------- 컴파일 / 캐시 ----------
+    def _compile(self, sources):
+        w, h = self.resolution
+        masks = {}
+        for key, path in sources.items():
+            # 한글 경로도 읽을 수 있도록 imdecode 사용 (RGBA PNG는 그레이스케일로 변환)
+            img = cv2.imdecode(np.fromfile(path, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+            if img is None:
+                print(f"⚠️ 마스크 읽기 실패: {path}")
+                continue
+            img = cv2.resize(img, (w, h), interpolation=cv2.INTER_AREA)
+            masks[key] = np.where(img > 127, 255, 0).astype(np.uint8)
+        return masks
+
+    def _write_cache(self, masks, signature):
+        w, h = self.resolution
+        entries, blobs, offset = {}, [], 0
+        for (cid, direct), mask in masks.items():
+            packed = np.packbits(mask > 127)
+            entries[f"{cid}_{direct}"] = [offset, packed.size]
+            blobs.append(packed.tobytes())
+            offset += packed.size
+        header = json.dumps({"resolution": [w, h], "entries": entries, "signature": signature}).encode()
+        tmp = self.cache_path + ".tmp"
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(tmp, "wb") as f:
+                f.write(_MAGIC + _HEADER_LEN.pack(len(header)) + header)
+                for blob in blobs:
+                    f.write(blob)
+            os.replace(tmp, self.cache_path)  # 읽는 쪽이 쓰다 만 파일을 보지 않도록
+        except OSError as e:
+            print(f"⚠️ 마스크 캐시 저장 실패 ({e}) → 메모리에서만 사용")
+
+    def _read_cache(self, signature):
+        """캐시가 현재 원본과 같으면 {(cid, direct): 마스크}, 아니면 None"""
+        try:
+            with open(self.cache_path, "rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+        with mm:
+            if mm[:len(_MAGIC)] != _MAGIC:
+                return None
+            start = len(_MAGIC) + _HEADER_LEN.size
+            (header_len,) = _HEADER_LEN.unpack_from(mm, len(_MAGIC))
+            header = json.loads(mm[start:start + header_len])
+            if header["signature"] != signature or tuple(header["resolution"]) != self.resolution:
+                return None
+            w, h = self.resolution
+            data = start + header_len
+            masks = {}
+            for key, (offset, size) in header["entries"].items():
+                packed = np.frombuffer(mm, dtype=np.uint8, count=size, offset=data + offset)
+                mask = np.unpackbits(packed, count=w * h).reshape(h, w)
+                del packed  # mmap을 닫기 전에 버퍼 참조 해제
+                mask *= 255
+                cid, direct = key.rsplit("_", 1)
+                masks[(int(cid), direct)] = mask
+        return masks
+
+    def load(self):
+        """캐시가 최신이면 mmap 캐시에서, 아니면 PNG에서 컴파일 후 캐시 저장. 로드한 마스크 수 반환"""
+        sources = self.scan()
+        signature = self._signature_of(sources)
+        masks = self._read_cache(signature)
+        if masks is None:
+            masks = self._compile(sources)
+            self._write_cache(masks, signature)
+            print(f"🛠️ ROI 마스크 {len(masks)}개 컴파일 → {self.cache_path}")
+        self._masks = masks
+        self._signature = signature
+        for cid in self.missing():
+            print(f"❌ [채널 {cid}] '{self.channels[cid]}' ROI 마스크가 없습니다 → 점유율/혼잡도를 계산하지 않습니다 "
+                  f"({self.base_path}/{{상행선,하행선}}/{self.channels[cid]}_mask.png)")
+        return len(masks)
+
+    def reload_if_changed(self):
+        """원본이 추가/수정/삭제됐으면 다시 로드하고 바뀐 (cid, direct) 목록 반환 (변경 없으면 빈 리스트)"""
+        signature = self._signature_of(self.scan())
+        if signature == self._signature:
+            return []
+        old = self._masks
+        self.load()
+        changed = [key for key in set(old) | set(self._masks)
+                   if key not in old or key not in self._masks or not np.array_equal(old[key], self._masks[key])]
+        return changed
+
+    # ---------- 조회 ----------
+    def get(self, cid, direct):
+        return self._masks.get((cid, direct))
+
+    def camera(self, name):
+        """카메라 이름 → {direct: 마스크}"""
+        cids = self._camera_channels().get(name)
+        return {direct: mask for (c, direct), mask in self._masks.items() if c == cids[0]} if cids else {}
+
+    def missing(self):
+        """구성된 채널 중 어느 방향의 마스크도 없는 채널 목록"""
+        loaded = {cid for cid, _ in self._masks}
+        return sorted(cid for cid in self.channels if cid not in loaded)
+
+    def masks(self):
+        """{"{cid}_{direct}": 마스크} (OccupancyKernel.load / 워커 풀 전달 형식)"""
+        return {f"{cid}_{direct}": mask for (cid, direct), mask in self._masks.items()}
@@ -0,0 +1,88 @@
+import threading
+import cv2
+import numpy as np
+
+DISPLAY_SIZE = (480, 270)  # (W, H) 대시보드 표시 해상도
+
+
+class OverlayRenderer:
+    """
+    Results.plot() 대체용 경량 오버레이 렌더러.
+    - 점유율 계산에서 이미 만든 차량 합집합 마스크를 그대로 받아 표시 해상도에서만 그림
+    - 색 합성은 cv2.addWeighted + np.copyto(where=) 벡터 연산 한 번
+    - up/low ROI 외곽선은 채널별로 한 번만 추출해서 캐시
+    - 버퍼는 쓰레드별로 미리 할당해 재사용 (인코딩 쓰레드 풀에서 동시에 호출 가능)
+    """
+
+    def __init__(self, kernel, size=DISPLAY_SIZE, color=(0, 0, 255), alpha=0.45,
+                 roi_colors=None):
+        self.kernel = kernel  # ROI 원본은 OccupancyKernel과 공유
+        self.size = size
+        self.alpha = alpha
+        self.color = np.array(color, dtype=np.uint8)
+        self.roi_colors = roi_colors or {"up": (255, 170, 0), "low": (0, 220, 255)}
+        self._contours = {}  # {cid: [(direct, contours)]}
+        self._contours_lock = threading.Lock()  # 인코딩 쓰레드들과 마스크 핫 리로드 사이 외곽선 캐시 보호
+        self._local = threading.local()
+
+    def _buffers(self):
+        buffers = getattr(self._local, "buffers", None)
+        if buffers is None:
+            w, h = self.size
+            color_layer = np.empty((h, w, 3), dtype=np.uint8)
+            color_layer[:] = self.color
+            buffers = {
+                "frame": np.empty((h, w, 3), dtype=np.uint8),
+                "blend": np.empty((h, w, 3), dtype=np.uint8),
+                "color": color_layer,
+                "mask_u8": np.empty((h, w), dtype=np.uint8),
+                "mask": np.empty((h, w, 1), dtype=bool),
+            }
+            self._local.buffers = buffers
+        return buffers
+
+    def roi_contours(self, cid):
+        contours = self._contours.get(cid)
+        if contours is None:
+            # 잠금 안에서 만들고 저장해야 invalidate 직전 ROI로 만든 외곽선이 다시 캐시되지 않음
+            with self._contours_lock:
+                contours = self._contours.get(cid)
+                if contours is None:
+                    w, h = self.size
+                    contours = []
+                    for direct in self.kernel.directions(cid):
+                        roi_bool, _ = self.kernel.roi(cid, direct, (h, w))
+                        found, _ = cv2.findContours(roi_bool.astype(np.uint8), cv2.RETR_EXTERNAL,
+                                                    cv2.CHAIN_APPROX_SIMPLE)
+                        contours.append((direct, found))
+                    self._contours[cid] = contours
+        return contours
+
+    def invalidate(self, cid=None):
+        """ROI 마스크가 바뀌었을 때 외곽선 캐시 삭제"""
+        with self._contours_lock:
+            if cid is None:
+                self._contours.clear()
+            else:
+                self._contours.pop(cid, None)
+
+    def render(self, cid, frame, union=None):
+        """
+        frame(BGR, 임의 크기)을 표시 해상도로 줄이고 차량 마스크/ROI 외곽선을 그린 이미지를 반환.
+        union: OccupancyKernel.union()의 bool 마스크 (입력 전체를 늘리는 같은 좌표계). 반환 버퍼는 재사용됩니다.
+        """
+        b = self._buffers()
+        out = b["frame"]
+        cv2.resize(frame, self.size, dst=out, interpolation=cv2.INTER_AREA)
+
+        if union is not None and union.any():
+            # 작은 마스크를 부드럽게 키운 뒤 임계값 → 계단 현상 없이 표시 해상도 마스크 생성
+            cv2.resize(union.view(np.uint8) * np.uint8(255), self.size, dst=b["mask_u8"],
+                       interpolation=cv2.INTER_LINEAR)
+            np.greater(b["mask_u8"], 127, out=b["mask"][..., 0])
+            cv2.addWeighted(out, 1.0 - self.alpha, b["color"], self.alpha, 0.0, dst=b["blend"])
+            np.copyto(out, b["blend"], where=b["mask"])
+
+        for direct, contours in self.roi_contours(cid):
+            cv2.drawContours(out, contours, -1, self.roi_colors.get(direct, (255, 255, 255)), 1)
+        return out
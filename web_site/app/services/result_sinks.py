@@ -0,0 +1,319 @@
+import os
+import csv
+import time
+import sqlite3
+import threading
+import importlib.util
+from collections import deque
+from datetime import datetime, timezone
+
+# pyarrow가 있을 때만 Parquet 싱크 사용 가능
+PARQUET_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+
+# 채널/방향당 한 행 (오프라인 분석용 long 형식)
+COLUMNS = ("ts", "channel_id", "direction", "occupancy_rate", "occupancy_rate_weighted",
+           "occupancy_rate_smoothed", "vehicles_per_min", "status", "vehicle_total_count")
+
+
+def flatten_result(ts, cid, result):
+    """latest_results 형식 결과 dict → 방향별 행 튜플 목록 (COLUMNS 순서)"""
+    rows = []
+    count = result.get("vehicle_total_count", 0)
+    for direct, data in result.get("results", {}).items():
+        rows.append((ts, cid, direct, data.get("occupancy_rate"), data.get("occupancy_rate_weighted"),
+                     data.get("occupancy_rate_smoothed"), data.get("vehicles_per_min"),
+                     data.get("status"), count))
+    return rows
+
+
+def _day(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y%m%d")
+
+
+# =========================
+# 싱크 (쓰기는 모두 writer 쓰레드 하나에서만 호출)
+# =========================
+class SqliteSink:
+    """SQLite (WAL) 싱크: 배치 하나를 트랜잭션 하나로 커밋, 읽기는 별도 연결이라 쓰기와 동시에 가능"""
+
+    name = "sqlite"
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")  # WAL에서는 커밋마다 fsync하지 않아도 DB가 깨지지 않음
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS results (
+            ts REAL, channel_id INTEGER, direction TEXT, occupancy_rate REAL, occupancy_rate_weighted REAL,
+            occupancy_rate_smoothed REAL, vehicles_per_min REAL, status TEXT, vehicle_total_count INTEGER)""")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS results_channel_ts ON results (channel_id, ts)")
+        self.conn.commit()
+
+    def write(self, rows):
+        with self.conn:
+            self.conn.executemany(f"INSERT INTO results VALUES ({', '.join('?' * len(COLUMNS))})", rows)
+
+    def query(self, cid, t0, t1, limit=10000):
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        try:
+            cur = conn.execute("SELECT * FROM results WHERE channel_id = ? AND ts BETWEEN ? AND ? "
+                               "ORDER BY ts LIMIT ?", (cid, t0, t1, limit))
+            return [dict(zip(COLUMNS, row)) for row in cur]
+        finally:
+            conn.close()
+
+    def close(self):
+        self.conn.close()
+
+
+class CsvSink:
+    """날짜(UTC)별 CSV 파일 싱크: results_YYYYMMDD.csv에 배치마다 이어 쓰고 flush"""
+
+    name = "csv"
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._file = None
+        self._writer = None
+        self._day = None
+
+    def _path(self, day):
+        return os.path.join(self.directory, f"results_{day}.csv")
+
+    def _open(self, day):
+        if self._file is not None:
+            self._file.close()
+        path = self._path(day)
+        new = not os.path.exists(path)
+        self._file = open(path, "a", newline="", encoding="utf-8")
+        self._writer = csv.writer(self._file)
+        if new:
+            self._writer.writerow(COLUMNS)
+        self._day = day
+
+    def write(self, rows):
+        for row in rows:
+            day = _day(row[0])
+            if day != self._day:
+                self._open(day)
+            self._writer.writerow(row)
+        if self._file is not None:
+            self._file.flush()
+
+    def query(self, cid, t0, t1, limit=10000):
+        out = []
+        day, end = int(t0 // 86400), int(t1 // 86400)
+        while day <= end and len(out) < limit:
+            path = self._path(_day(day * 86400))
+            day += 1
+            if not os.path.exists(path):
+                continue
+            with open(path, newline="", encoding="utf-8") as f:
+                for rec in csv.DictReader(f):
+                    ts = float(rec["ts"])
+                    if int(rec["channel_id"]) == cid and t0 <= ts <= t1:
+                        out.append(self._typed(rec))
+                        if len(out) >= limit:
+                            break
+        return out
+
+    @staticmethod
+    def _typed(rec):
+        row = {}
+        for key, value in rec.items():
+            if key in ("direction", "status"):
+                row[key] = value or None
+            elif key in ("channel_id", "vehicle_total_count"):
+                row[key] = int(value) if value else None
+            else:
+                row[key] = float(value) if value else None
+        return row
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class ParquetSink:
+    """
+    Parquet 싱크: Parquet 파일은 이어 쓸 수 없으므로 행을 모아 두었다가
+    rows_per_file개 또는 roll_sec초마다 새 파일(results_YYYYMMDD_HHMMSS_n.parquet)로 씀.
+    조회는 파일과 아직 파일로 쓰지 않은 버퍼 행을 합쳐서 반환 (버퍼는 writer 쓰레드와 잠금으로 공유)
+    """
+
+    name = "parquet"
+
+    def __init__(self, directory, rows_per_file=50000, roll_sec=300.0):
+        import pyarrow
+        import pyarrow.parquet
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self.directory = directory
+        self.rows_per_file = rows_per_file
+        self.roll_sec = roll_sec
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._rows = []
+        self._opened = time.monotonic()
+        self._seq = 0
+
+    def write(self, rows):
+        with self._lock:
+            self._rows.extend(rows)
+            if len(self._rows) >= self.rows_per_file or time.monotonic() - self._opened >= self.roll_sec:
+                self._roll()
+
+    def _roll(self):
+        if not self._rows:
+            return
+        table = self._pa.Table.from_pydict({name: [row[i] for row in self._rows] for i, name in enumerate(COLUMNS)})
+        stamp = datetime.fromtimestamp(self._rows[0][0], timezone.utc).strftime("%Y%m%d_%H%M%S")
+        self._seq += 1
+        path = os.path.join(self.directory, f"results_{stamp}_{self._seq}.parquet")
+        self._pq.write_table(table, path + ".tmp")
+        os.replace(path + ".tmp", path)  # 읽는 쪽이 쓰다 만 파일을 보지 않도록
+        self._rows = []
+        self._opened = time.monotonic()
+
+    def query(self, cid, t0, t1, limit=10000):
+        # 파일 목록과 버퍼를 같은 잠금 안에서 잡아야 그 사이 _roll()된 행이 빠지거나 두 번 나오지 않음
+        with self._lock:
+            files = sorted(os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                           if name.endswith(".parquet"))
+            buffered = [dict(zip(COLUMNS, row)) for row in self._rows if row[1] == cid and t0 <= row[0] <= t1]
+        out = []
+        if files:
+            table = self._pq.read_table(files, filters=[("channel_id", "=", cid), ("ts", ">=", t0), ("ts", "<=", t1)])
+            out = table.sort_by("ts").slice(0, limit).to_pylist()
+        if buffered:
+            out = sorted(out + buffered, key=lambda row: row["ts"])[:limit]
+        return out
+
+    def close(self):
+        with self._lock:
+            self._roll()
+
+
+def create_sinks(spec):
+    """"sqlite:경로,csv:폴더,parquet:폴더" → 싱크 목록 (지원하지 않는 항목은 경고 후 건너뜀)"""
+    sinks = []
+    for item in filter(None, (part.strip() for part in (spec or "").split(","))):
+        kind, _, target = item.partition(":")
+        if kind == "sqlite":
+            sinks.append(SqliteSink(target or "results.db"))
+        elif kind == "csv":
+            sinks.append(CsvSink(target or "results_csv"))
+        elif kind == "parquet":
+            if not PARQUET_AVAILABLE:
+                print("⚠️ pyarrow가 없어 Parquet 싱크를 건너뜁니다 (pip install pyarrow)")
+                continue
+            sinks.append(ParquetSink(target or "results_parquet"))
+        else:
+            print(f"⚠️ 알 수 없는 결과 싱크: {item}")
+    return sinks
+
+
+# =========================
+# 비동기 배치 기록기
+# =========================
+class ResultSinkWriter:
+    """
+    분석 루프 → 결과 싱크 기록기.
+    - submit()은 (시각, 채널, 결과 dict 참조)를 제한된 큐에 넣기만 함 (잠금 한 번, 디스크 I/O 없음, 절대 기다리지 않음)
+    - 큐가 가득 차면 drop_policy에 따라 가장 오래된 것("oldest") 또는 새로 들어온 것("newest")을 버리고 dropped로 집계
+      → 디스크가 느려도 추론 루프는 밀리지 않음
+    - 기록 쓰레드 하나가 batch_size개가 모이거나 flush_sec가 지나면 쌓인 것을 전부 꺼내 싱크마다 한 번씩 기록
+      (group commit: 디스크가 밀릴수록 배치가 커져 행당 비용이 줄어듦)
+    - 싱크 하나가 실패해도 다른 싱크와 이후 배치는 계속 기록 (errors로 집계)
+    결과 dict는 갱신될 때마다 새로 만들어지므로(publish_result) 복사 없이 참조만 보관합니다.
+    """
+
+    def __init__(self, sinks, max_queue=20000, batch_size=500, flush_sec=1.0, drop_policy="oldest"):
+        if drop_policy not in ("oldest", "newest"):
+            raise ValueError(f"drop_policy는 oldest 또는 newest: {drop_policy}")
+        self.sinks = list(sinks)
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_sec = flush_sec
+        self.drop_policy = drop_policy
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self.counters = {"submitted": 0, "written": 0, "dropped": 0, "errors": 0, "batches": 0}
+        self.last_batch_sec = 0.0
+        self._thread = threading.Thread(target=self._run, name="result-sink-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, cid, result, ts=None):
+        item = (time.time() if ts is None else ts, cid, result)
+        with self._cond:
+            if self._closed:
+                return
+            self.counters["submitted"] += 1
+            if len(self._queue) >= self.max_queue:
+                self.counters["dropped"] += 1
+                if self.drop_policy == "newest":
+                    return
+                self._queue.popleft()
+            self._queue.append(item)
+            if len(self._queue) >= self.batch_size:
+                self._cond.notify()
+
+    def _take(self):
+        """batch_size개가 모이거나 flush_sec가 지날 때까지 기다렸다가 큐를 통째로 꺼냄"""
+        deadline = time.monotonic() + self.flush_sec
+        with self._cond:
+            while not self._closed and len(self._queue) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            items = list(self._queue)
+            self._queue.clear()
+            return items
+
+    def _run(self):
+        while True:
+            items = self._take()
+            if items:
+                self._write(items)
+            elif self._closed:
+                return
+
+    def _write(self, items):
+        t0 = time.perf_counter()
+        rows = [row for ts, cid, result in items for row in flatten_result(ts, cid, result)]
+        for sink in self.sinks:
+            try:
+                sink.write(rows)
+            except Exception as e:
+                self.counters["errors"] += 1
+                print(f"⚠️ 결과 싱크({sink.name}) 기록 실패: {e}")
+        self.counters["written"] += len(items)
+        self.counters["batches"] += 1
+        self.last_batch_sec = time.perf_counter() - t0
+
+    def query(self, cid, t0, t1, limit=10000):
+        """조회 가능한 첫 싱크(설정 순서)에서 [t0, t1] 구간 행 목록. 싱크가 없으면 None"""
+        return self.sinks[0].query(cid, t0, t1, limit) if self.sinks else None
+
+    def stats(self):
+        with self._cond:
+            queued = len(self._queue)
+        return {"sinks": [sink.name for sink in self.sinks], "queued": queued, "max_queue": self.max_queue,
+                "last_batch_ms": round(self.last_batch_sec * 1000, 2), **self.counters}
+
+    def close(self, timeout=5.0):
+        """남은 결과를 기록한 뒤 싱크 닫기"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout)
+        for sink in self.sinks:
+            try:
+                sink.close()
+            except Exception as e:
+                print(f"⚠️ 결과 싱크({sink.name}) 닫기 실패: {e}")
@@ -0,0 +1,173 @@
+import math
+import threading
+import cv2
+import numpy as np
+from app.services.occupancy import OccupancyKernel
+
+
+class RoiCropper:
+    """
+    도로 영역(up ∪ low ROI의 bounding box)만 잘라 정사각형 letterbox로 만드는 전처리 단계.
+    - bounding box는 ROI 원본 마스크에서 채널별로 한 번만 계산 (프레임 크기에 무관한 0~1 비율 좌표)
+    - 자른 영역은 비율을 유지한 채 size x size 캔버스 가운데에 배치 (나머지는 pad_value, Ultralytics와 동일한 114)
+      → 모델 입력이 이미 imgsz 정사각형이라 Ultralytics 쪽 letterbox는 아무것도 하지 않음
+    - 같은 변환을 적용한 ROI 마스크를 자체 OccupancyKernel에 등록해 두므로 점유율은 캔버스 좌표에서 바로 계산
+    - 오버레이용 합집합 마스크는 uncrop()으로 원본 프레임 좌표에 되돌림
+    같은 imgsz라도 도로 밖 픽셀에 해상도를 쓰지 않으므로, 정확도를 유지하면서 imgsz를 낮출 수 있습니다.
+    """
+
+    def __init__(self, kernel, size, margin=0.03, pad_value=114):
+        self.source = kernel          # 원본 프레임 좌표의 ROI (OccupancyKernel 공유)
+        self.kernel = OccupancyKernel(stride=kernel.stride, threshold=kernel.threshold)  # 캔버스 좌표의 ROI
+        self.size = size
+        self.margin = margin          # 경계에 걸친 차량이 잘리지 않도록 box를 넓히는 비율
+        self.pad_value = pad_value
+        self._lock = threading.RLock()  # crop(추론 쓰레드) / 마스크 핫 리로드 / uncrop(인코딩 쓰레드) 사이 캐시 보호
+        self._boxes = {}      # {cid: (x0, y0, x1, y1) 0~1 비율}
+        self._layouts = {}    # {cid: (cw, ch, px, py)} 캔버스 안 배치 (프레임 해상도와 무관)
+        self._geometry = {}   # {(cid, h, w): (bx0, by0, bx1, by1, cw, ch, px, py)}
+        self._registered = {}  # {cid: 캔버스 ROI를 만든 layout}
+
+    def box(self, cid):
+        """up ∪ low ROI bounding box (0~1 비율, margin 포함). ROI가 없으면 프레임 전체"""
+        with self._lock, self.source._lock:
+            box = self._boxes.get(cid)
+            if box is None:
+                x0 = y0 = 1.0
+                x1 = y1 = 0.0
+                for direct in self.source.directions(cid):
+                    src = self.source.roi_sources[(cid, direct)]
+                    points = cv2.findNonZero((src > 127).astype(np.uint8))
+                    if points is None:
+                        continue
+                    x, y, w, h = cv2.boundingRect(points)
+                    sh, sw = src.shape[:2]
+                    x0, y0 = min(x0, x / sw), min(y0, y / sh)
+                    x1, y1 = max(x1, (x + w) / sw), max(y1, (y + h) / sh)
+                if x1 <= x0 or y1 <= y0:
+                    box = (0.0, 0.0, 1.0, 1.0)
+                else:
+                    m = self.margin
+                    box = (max(0.0, x0 - m), max(0.0, y0 - m), min(1.0, x1 + m), min(1.0, y1 + m))
+                self._boxes[cid] = box
+            return box
+
+    def invalidate(self, cid=None):
+        """ROI 마스크가 바뀌었을 때 box / 변환 / 캔버스 ROI 캐시 삭제"""
+        with self._lock:
+            if cid is None:
+                self._boxes.clear()
+                self._layouts.clear()
+                self._geometry.clear()
+                self._registered.clear()
+            else:
+                self._boxes.pop(cid, None)
+                self._layouts.pop(cid, None)
+                self._registered.pop(cid, None)
+                for key in [k for k in self._geometry if k[0] == cid]:
+                    del self._geometry[key]
+
+    def layout(self, cid, shape):
+        """
+        캔버스 안 배치 (cw, ch, px, py). 채널별로 처음 본 프레임의 비율로 한 번만 정함
+        → 엣지 JPEG / 원본 스트림처럼 해상도가 번갈아 들어와도 캔버스 ROI를 다시 만들지 않음
+          (ROI 마스크도 프레임 크기에 맞춰 늘려 쓰므로, 비율이 다른 프레임은 같은 배치에 맞춰 늘림)
+        """
+        with self._lock:
+            lay = self._layouts.get(cid)
+            if lay is None:
+                x0, y0, x1, y1 = self.box(cid)
+                h, w = shape[:2]
+                bw, bh = (x1 - x0) * w, (y1 - y0) * h
+                scale = self.size / max(bw, bh)
+                cw = min(self.size, max(1, round(bw * scale)))
+                ch = min(self.size, max(1, round(bh * scale)))
+                lay = (cw, ch, (self.size - cw) // 2, (self.size - ch) // 2)
+                self._layouts[cid] = lay
+            return lay
+
+    def geometry(self, cid, shape):
+        """(h, w) 프레임 → (자를 영역 bx0, by0, bx1, by1, 캔버스 안 크기 cw, ch, 위치 px, py). (cid, h, w)별 캐시"""
+        with self._lock:
+            h, w = shape[:2]
+            key = (cid, h, w)
+            geo = self._geometry.get(key)
+            if geo is None:
+                x0, y0, x1, y1 = self.box(cid)
+                bx0, by0 = int(x0 * w), int(y0 * h)
+                bx1, by1 = max(bx0 + 1, math.ceil(x1 * w)), max(by0 + 1, math.ceil(y1 * h))
+                geo = (bx0, by0, bx1, by1) + self.layout(cid, shape)
+                self._geometry[key] = geo
+            return geo
+
+    def _register(self, cid, lay):
+        """원본 ROI에 프레임과 같은 crop + letterbox를 적용해 캔버스 좌표 ROI로 등록 (배치가 바뀔 때만)"""
+        # 잠금 순서: crop 캐시 → 원본 커널 → 캔버스 커널 (원본 ROI를 읽는 동안 핫 리로드가 끼어들지 않도록)
+        with self._lock, self.source._lock:
+            if self._registered.get(cid) == lay:
+                return
+            x0, y0, x1, y1 = self.box(cid)
+            cw, ch, px, py = lay
+            for direct in self.kernel.directions(cid):
+                if (cid, direct) not in self.source.roi_sources:  # 원본에서 삭제된 방향
+                    self.kernel.remove_roi(cid, direct)
+            for direct in self.source.directions(cid):
+                src = self.source.roi_sources[(cid, direct)]
+                sh, sw = src.shape[:2]
+                part = src[int(y0 * sh):max(int(y0 * sh) + 1, math.ceil(y1 * sh)),
+                           int(x0 * sw):max(int(x0 * sw) + 1, math.ceil(x1 * sw))]
+                canvas = np.zeros((self.size, self.size), dtype=np.uint8)
+                canvas[py:py + ch, px:px + cw] = cv2.resize(part, (cw, ch), interpolation=cv2.INTER_NEAREST)
+                self.kernel.set_roi(cid, direct, canvas)
+                # 원근 가중치도 같은 세로 구간을 잘라 캔버스 행으로 옮김 (소실선은 원본 ROI 전체 모양 기준)
+                profile = self.source.profile(cid, direct)
+                r0 = int(y0 * sh)
+                r1 = max(r0 + 1, math.ceil(y1 * sh))
+                rows = np.zeros(self.size, dtype=np.float32)
+                rows[py:py + ch] = np.interp((np.arange(ch) + 0.5) * (r1 - r0) / ch - 0.5 + r0,
+                                             np.arange(len(profile)), profile)
+                self.kernel.set_weights(cid, direct, rows)
+            self._registered[cid] = lay
+
+    def crop(self, cid, frame, out=None):
+        """frame(BGR) → size x size letterbox 캔버스. out을 주면 그 버퍼(예: 공유 메모리 슬롯)에 바로 씀"""
+        geo = self.geometry(cid, frame.shape)
+        self._register(cid, geo[4:])
+        bx0, by0, bx1, by1, cw, ch, px, py = geo
+        canvas = out if out is not None else np.empty((self.size, self.size, 3), dtype=np.uint8)
+        canvas[:py] = self.pad_value
+        canvas[py + ch:] = self.pad_value
+        canvas[py:py + ch, :px] = self.pad_value
+        canvas[py:py + ch, px + cw:] = self.pad_value
+        # 자르기는 복사 없는 view, 리사이즈 결과는 캔버스 안쪽 영역에 바로 기록
+        cv2.resize(frame[by0:by1, bx0:bx1], (cw, ch), dst=canvas[py:py + ch, px:px + cw],
+                   interpolation=cv2.INTER_LINEAR)
+        return canvas
+
+    def analyze(self, cid, masks):
+        """캔버스 좌표 인스턴스 마스크 → (방향별 점유율, 캔버스 좌표 합집합). crop() 이후에 호출"""
+        return self.kernel.analyze(cid, masks)
+
+    def weighted(self, cid, union):
+        """캔버스 좌표 합집합 → 방향별 원근 보정 점유율 (analyze 이후에 호출)"""
+        return self.kernel.weighted(cid, union)
+
+    def uncrop(self, cid, union, shape):
+        """캔버스 좌표 합집합 마스크 → (h, w) 원본 프레임 좌표 bool 마스크 (도로 box 밖은 False)"""
+        h, w = shape[:2]
+        out = np.zeros((h, w), dtype=bool)
+        if union is None:
+            return out
+        lay = self._registered.get(cid)
+        if lay is None:
+            return out
+        x0, y0, x1, y1 = self.box(cid)
+        cw, ch, px, py = lay
+        f = union.shape[0] / self.size
+        part = union[int(py * f):max(int(py * f) + 1, round((py + ch) * f)),
+                     int(px * f):max(int(px * f) + 1, round((px + cw) * f))]
+        ox0, oy0 = int(x0 * w), int(y0 * h)
+        ox1, oy1 = max(ox0 + 1, math.ceil(x1 * w)), max(oy0 + 1, math.ceil(y1 * h))
+        out[oy0:oy1, ox0:ox1] = cv2.resize(part.view(np.uint8), (ox1 - ox0, oy1 - oy0),
+                                           interpolation=cv2.INTER_NEAREST) > 0
+        return out
@@ -0,0 +1,61 @@
+import threading
+from multiprocessing import shared_memory
+import numpy as np
+
+
+class SharedFrameRing:
+    """
+    multiprocessing.shared_memory 위의 고정 크기 프레임 링 버퍼.
+    부모 프로세스가 슬롯에 프레임을 쓰면 워커 프로세스는 같은 메모리를 numpy 뷰로 바로 읽습니다 (복사/피클 없음).
+    """
+
+    def __init__(self, n_slots, shape, name=None):
+        self.n_slots = n_slots
+        self.shape = tuple(shape)
+        size = n_slots * int(np.prod(self.shape))
+        self._owner = name is None
+        if self._owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self.frames = np.ndarray((n_slots,) + self.shape, dtype=np.uint8, buffer=self.shm.buf)
+
+        # 빈 슬롯 관리는 부모 프로세스에서만 사용
+        self._cond = threading.Condition()
+        self._free = list(range(n_slots)) if self._owner else []
+
+    @property
+    def spec(self):
+        """워커 프로세스에서 attach할 때 넘기는 정보"""
+        return self.shm.name, self.n_slots, self.shape
+
+    @classmethod
+    def attach(cls, name, n_slots, shape):
+        return cls(n_slots, shape, name=name)
+
+    # ---------- 슬롯 관리 (부모 프로세스) ----------
+    def free_count(self):
+        with self._cond:
+            return len(self._free)
+
+    def wait_free(self, n, timeout=None):
+        """빈 슬롯이 n개 이상 생길 때까지 대기"""
+        with self._cond:
+            return self._cond.wait_for(lambda: len(self._free) >= n, timeout=timeout)
+
+    def acquire(self, n):
+        with self._cond:
+            n = min(n, len(self._free))
+            slots, self._free = self._free[:n], self._free[n:]
+            return slots
+
+    def release(self, slots):
+        with self._cond:
+            self._free.extend(slots)
+            self._cond.notify_all()
+
+    def close(self):
+        self.frames = None
+        self.shm.close()
+        if self._owner:
+            self.shm.unlink()
@@ -0,0 +1,249 @@
+import time
+from collections import deque
+import numpy as np
+
+from app.services.occupancy import PROTO_STRIDE
+
+
+def _expand(boxes, buffer):
+    pad = (boxes[:, 2:] - boxes[:, :2]) * buffer
+    return np.concatenate([boxes[:, :2] - pad, boxes[:, 2:] + pad], axis=1)
+
+
+def iou_matrix(a, b, buffer=0.0):
+    """
+    (T, 4), (D, 4) xyxy 박스 → (T, D) IoU (브로드캐스트 한 번).
+    buffer > 0이면 양쪽 박스를 크기 비율만큼 넓혀서 비교 (buffered IoU: 프레임 간격이 길어 겹침이 적어도 연결)
+    """
+    if len(a) == 0 or len(b) == 0:
+        return np.zeros((len(a), len(b)), dtype=np.float32)
+    if buffer > 0:
+        a, b = _expand(a, buffer), _expand(b, buffer)
+    x0 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y0 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x1 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y1 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x1 - x0, 0, None) * np.clip(y1 - y0, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-6)
+
+
+def letterbox_params(orig_shape, input_shape):
+    """
+    원본 프레임 (h, w) → 모델 입력 (h, w) letterbox 변환 (gain_x, gain_y, pad_x, pad_y).
+    Ultralytics LetterBox / ops.scale_boxes와 같은 반올림 (마스크는 패딩을 포함한 입력 해상도)
+    """
+    ih, iw = orig_shape[:2]
+    mh, mw = input_shape[:2]
+    gain = min(mh / ih, mw / iw)
+    new_h, new_w = round(ih * gain), round(iw * gain)
+    pad_x, pad_y = round((mw - new_w) / 2 - 0.1), round((mh - new_h) / 2 - 0.1)
+    return new_w / iw, new_h / ih, pad_x, pad_y
+
+
+def greedy_match(iou, threshold):
+    """IoU가 큰 쌍부터 하나씩 짝지음 → [(트랙 인덱스, 검출 인덱스)]"""
+    if iou.size == 0:
+        return []
+    rows, cols = np.nonzero(iou >= threshold)
+    order = np.argsort(-iou[rows, cols], kind="stable")
+    used_rows, used_cols, pairs = set(), set(), []
+    for k in order:
+        r, c = rows[k], cols[k]
+        if r not in used_rows and c not in used_cols:
+            used_rows.add(r)
+            used_cols.add(c)
+            pairs.append((r, c))
+    return pairs
+
+
+class Track:
+    __slots__ = ("track_id", "box", "velocity", "mask", "hits", "last_seen", "direction", "counted")
+
+    def __init__(self, track_id, box, mask, now):
+        self.track_id = track_id
+        self.box = box            # 합집합 마스크 좌표 xyxy (float)
+        self.velocity = np.zeros(2, dtype=np.float32)  # 박스 중심 이동 속도 (px/초)
+        self.mask = mask          # 박스 영역만 잘라 둔 bool 마스크 (없으면 None)
+        self.hits = 1
+        self.last_seen = now
+        self.direction = None
+        self.counted = False
+
+    def predicted(self, now):
+        dx, dy = self.velocity * (now - self.last_seen)
+        return self.box + np.array([dx, dy, dx, dy], dtype=np.float32)
+
+
+class VehicleTracker:
+    """
+    채널 하나의 경량 다중 객체 추적기 (IoU + ByteTrack식 2단계 연결, 프레임당 박스 수 기준 벡터 연산).
+    - 좌표계는 점유율 계산과 같은 합집합 마스크 해상도 (masks.data[:, ::stride, ::stride])
+    - 1단계: 등속 예측한 트랙 ↔ 점수 높은 검출, 2단계: 남은 트랙 ↔ 점수 낮은 검출 (가려진 차량 유지)
+      박스는 buffer 비율만큼 넓혀서 비교 (아직 속도를 모르는 새 트랙, 키프레임 간격이 긴 경우에도 연결)
+      새 트랙은 점수 높은 검출에서만 생성, max_age_sec 동안 못 찾으면 삭제
+    - min_hits번 이상 연결된 트랙이 방향 ROI(박스 아래 중앙)에 처음 들어오면 한 대로 집계 → 방향별 대/분
+    - propagate(): 추론을 건너뛰는 프레임에서 트랙 마스크를 예측 위치로 옮겨 합집합을 만듦 (키프레임 사이 점유율)
+    """
+
+    def __init__(self, iou_threshold=0.3, buffer=0.5, high_score=0.5, max_age_sec=1.5, min_hits=2,
+                 flow_window_sec=60.0, stride=PROTO_STRIDE, mask_threshold=0.5):
+        self.iou_threshold = iou_threshold
+        self.buffer = buffer
+        self.high_score = high_score
+        self.max_age_sec = max_age_sec
+        self.min_hits = min_hits
+        self.flow_window_sec = flow_window_sec
+        self.stride = stride
+        self.mask_threshold = mask_threshold
+        self.tracks = []
+        self.shape = None          # 합집합 마스크 (h, w)
+        self._next_id = 1
+        self._started = None
+        self._counts = {}          # {direct: deque(집계 시각)}
+        self._union = None
+        self._frame_no = 0
+
+    # ---------- 입력 변환 ----------
+    def detections(self, res):
+        """ultralytics 결과 → (합집합 좌표 박스 (N, 4), 점수 (N,), 인스턴스 bool 마스크 (N, h, w) 또는 None)"""
+        if res.boxes is None or len(res.boxes) == 0 or res.masks is None:
+            return np.zeros((0, 4), np.float32), np.zeros(0, np.float32), None
+        full_shape = tuple(res.masks.data.shape[1:])  # 패딩을 포함한 letterbox 입력 해상도
+        masks = res.masks.data[:, ::self.stride, ::self.stride]
+        masks = masks.cpu().numpy() if hasattr(masks, "detach") else np.asarray(masks)
+        masks = masks > self.mask_threshold
+        boxes = res.boxes.xyxy
+        scores = res.boxes.conf
+        boxes = (boxes.cpu().numpy() if hasattr(boxes, "detach") else np.asarray(boxes)).astype(np.float32)
+        scores = (scores.cpu().numpy() if hasattr(scores, "detach") else np.asarray(scores)).astype(np.float32)
+        # 박스는 원본 이미지(crop 캔버스 / 프레임) 좌표 → letterbox gain / pad를 적용해 마스크 좌표로 옮긴 뒤 stride로 나눔
+        # (비정사각 프레임은 마스크 위아래 / 좌우에 패딩이 있으므로 단순 비율 변환으로는 어긋남)
+        gx, gy, px, py = letterbox_params(res.orig_shape, full_shape)
+        boxes = (boxes * np.array([gx, gy, gx, gy], dtype=np.float32) + np.array([px, py, px, py], dtype=np.float32))
+        boxes /= self.stride
+        return boxes, scores, masks
+
+    def _crop_mask(self, masks, i, box):
+        if masks is None:
+            return None
+        h, w = masks.shape[1:]
+        x0, y0 = max(0, int(box[0])), max(0, int(box[1]))
+        x1, y1 = min(w, int(np.ceil(box[2]))), min(h, int(np.ceil(box[3])))
+        if x1 <= x0 or y1 <= y0:
+            return None
+        return masks[i, y0:y1, x0:x1].copy()
+
+    # ---------- 갱신 ----------
+    def update(self, boxes, scores, masks, rois, now=None):
+        """
+        추론 결과로 트랙 갱신. rois: {direct: 합집합 해상도 bool ROI} (방향별 집계용).
+        반환: 확정된(min_hits 이상) 활성 트랙 수
+        """
+        now = time.monotonic() if now is None else now
+        if self._started is None:
+            self._started = now
+        if masks is not None:
+            self.shape = masks.shape[1:]
+        tracks = self.tracks
+        predicted = np.array([t.predicted(now) for t in tracks], dtype=np.float32).reshape(-1, 4)
+
+        high = np.flatnonzero(scores >= self.high_score)
+        low = np.flatnonzero(scores < self.high_score)
+        matched_tracks, matched_dets = set(), set()
+        for det_idx in (high, low):
+            free = [i for i in range(len(tracks)) if i not in matched_tracks]
+            if not free or len(det_idx) == 0:
+                continue
+            iou = iou_matrix(predicted[free], boxes[det_idx], self.buffer)
+            for r, c in greedy_match(iou, self.iou_threshold):
+                ti, di = free[r], det_idx[c]
+                self._apply(tracks[ti], boxes[di], self._crop_mask(masks, di, boxes[di]), now)
+                matched_tracks.add(ti)
+                matched_dets.add(di)
+
+        for di in high:
+            if di not in matched_dets:
+                tracks.append(Track(self._next_id, boxes[di].copy(), self._crop_mask(masks, di, boxes[di]), now))
+                self._next_id += 1
+        self.tracks = [t for t in tracks if now - t.last_seen <= self.max_age_sec]
+        self._count(rois, now)
+        return sum(1 for t in self.tracks if t.hits >= self.min_hits and t.last_seen == now)
+
+    def _apply(self, track, box, mask, now):
+        dt = now - track.last_seen
+        if dt > 0:
+            shift = ((box[:2] + box[2:]) - (track.box[:2] + track.box[2:])) / 2 / dt
+            track.velocity = 0.5 * track.velocity + 0.5 * shift.astype(np.float32)
+        track.box = box.copy()
+        if mask is not None:
+            track.mask = mask
+        track.hits += 1
+        track.last_seen = now
+
+    def _count(self, rois, now):
+        for track in self.tracks:
+            if track.counted or track.hits < self.min_hits or track.last_seen != now:
+                continue
+            x = int((track.box[0] + track.box[2]) / 2)
+            y = int(track.box[3]) - 1  # 박스 아래 중앙 = 차량이 도로에 닿는 지점
+            for direct, roi in rois.items():
+                h, w = roi.shape
+                if 0 <= y < h and 0 <= x < w and roi[y, x]:
+                    track.direction = direct
+                    track.counted = True
+                    self._counts.setdefault(direct, deque()).append(now)
+                    break
+
+    # ---------- 조회 ----------
+    def flow(self, now=None):
+        """{direct: 최근 flow_window_sec 동안 집계된 차량 수를 분당으로 환산한 값}"""
+        now = time.monotonic() if now is None else now
+        if self._started is None:
+            return {}
+        window = max(1.0, min(self.flow_window_sec, now - self._started))
+        rates = {}
+        for direct, stamps in self._counts.items():
+            while stamps and now - stamps[0] > self.flow_window_sec:
+                stamps.popleft()
+            rates[direct] = len(stamps) * 60.0 / window
+        return rates
+
+    def active_count(self):
+        return sum(1 for t in self.tracks if t.hits >= self.min_hits)
+
+    def can_propagate(self, now=None):
+        now = time.monotonic() if now is None else now
+        return self.shape is not None and any(now - t.last_seen <= self.max_age_sec for t in self.tracks)
+
+    def needs_segmentation(self, every, now=None):
+        """every번째 프레임이거나 옮길 트랙이 없으면 True (호출할 때마다 프레임 번호 증가)"""
+        self._frame_no += 1
+        return every <= 1 or self._frame_no % every == 0 or not self.can_propagate(now)
+
+    def propagate(self, now=None):
+        """
+        추론 없이 트랙 마스크를 등속 예측 위치로 옮겨 합집합 bool 마스크를 만듦 (합집합 해상도, 버퍼 재사용).
+        반환 버퍼는 다음 호출 때 덮어쓰입니다.
+        """
+        now = time.monotonic() if now is None else now
+        h, w = self.shape
+        if self._union is None or self._union.shape != (h, w):
+            self._union = np.zeros((h, w), dtype=bool)
+        union = self._union
+        union.fill(False)
+        for track in self.tracks:
+            if track.mask is None or track.hits < self.min_hits:
+                continue
+            box = track.predicted(now)
+            mh, mw = track.mask.shape
+            x0, y0 = int(round(box[0])), int(round(box[1]))
+            # 화면 밖으로 나간 부분은 잘라서 붙임
+            sx0, sy0 = max(0, -x0), max(0, -y0)
+            dx0, dy0 = max(0, x0), max(0, y0)
+            dx1, dy1 = min(w, x0 + mw), min(h, y0 + mh)
+            if dx1 <= dx0 or dy1 <= dy0:
+                continue
+            union[dy0:dy1, dx0:dx1] |= track.mask[sy0:sy0 + (dy1 - dy0), sx0:sx0 + (dx1 - dx0)]
+        return union
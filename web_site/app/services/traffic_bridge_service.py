@@ -1,13 +1,47 @@
 import asyncio
+import importlib.util
 import cv2
 import httpx
 from datetime import datetime
+from app.services.frame_batch import pack_frames, CONTENT_TYPE
+
+# h2 패키지가 있으면 HTTP/2 (연결 하나에 여러 채널 요청을 다중화), 없으면 HTTP/1.1 keep-alive 풀
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
 
 class TrafficBridgeService:
-    def __init__(self, colab_url):
+    """
+    엣지 → 코랩 /predict 브릿지.
+    - httpx.AsyncClient 하나를 서비스 수명 동안 재사용 (터널 TCP+TLS 핸드셰이크를 프레임마다 하지 않음)
+    - 채널별 동시 요청 수는 max_in_flight로 제한하고, 코랩 응답이 밀리면 대기 중인 프레임을 최신 것으로 덮어씀
+      (latest-frame-wins: 오래된 프레임이 줄을 서서 지연이 쌓이지 않음, 덮어쓴 프레임은 dropped로 집계)
+    - analyze_channel은 프레임을 캡처/인코딩해서 전송 대기열에 넣고, 가장 최근에 받은 결과를 바로 반환
+    - batch=True면 채널별로 보내지 않고 대기 중인 모든 채널 프레임을 /predict_batch 요청 하나로 묶어 보냄
+      (틱마다 요청 1개: 앞 요청의 응답이 오면 그동안 쌓인 채널별 최신 프레임을 다음 요청으로)
+    - 종료 시 aclose()로 전송 태스크 / 연결 풀 / VideoCapture 정리
+    """
+
+    def __init__(self, colab_url, max_in_flight=1, timeout=10.0, max_connections=16, http2=None, batch=False):
         self.colab_url = f"{colab_url.rstrip('/')}/predict"
+        self.batch_url = f"{colab_url.rstrip('/')}/predict_batch"
+        self.batch = batch
         self.latest_results = {}
         self.caps = {}
+        self.max_in_flight = max_in_flight
+        self.http2 = HTTP2_AVAILABLE if http2 is None else http2
+        self.limits = httpx.Limits(max_connections=max_connections,
+                                   max_keepalive_connections=max_connections, keepalive_expiry=60.0)
+        self.timeout = httpx.Timeout(timeout, connect=5.0)
+        self.client = None
+        self._pending = {}   # {cid: 아직 보내지 못한 최신 JPEG} (채널당 1장)
+        self._senders = {}   # {cid: set(전송 태스크)}
+        self._batch_task = None
+        self.stats = {}      # {cid: {"sent", "dropped", "errors"}}
+
+    def _get_client(self):
+        if self.client is None:
+            self.client = httpx.AsyncClient(http2=self.http2, limits=self.limits, timeout=self.timeout)
+        return self.client
 
     async def analyze_channel(self, channel_id, m3u8_url):
         # 1. VideoCapture 초기화 및 지연 방지 설정
@@ -25,7 +59,7 @@ class TrafficBridgeService:
             # 5~10프레임 정도 건너뛰면 현재 시점의 실시간 프레임에 도달합니다.
             for _ in range(5):
                 cap.grab()
-            
+
             # 건너뛴 직후의 가장 최신 프레임 하나만 실제로 가져옵니다.
             success, frame = cap.retrieve()
 
@@ -39,31 +73,118 @@ class TrafficBridgeService:
             # 640x360 해상도는 AI 분석에 충분하면서도 전송이 매우 빠릅니다.
             frame = cv2.resize(frame, (320, 180))
             _, buffer = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), 50])
-            
-            # 4. 코랩 전송
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                files = {'file': ('frame.jpg', buffer.tobytes(), 'image/jpeg')}
+
+            # 4. 코랩 전송 (대기열에 넣기만 하고 응답은 기다리지 않음)
+            self.submit(channel_id, buffer.tobytes())
+            return self.latest_results.get(channel_id)
+
+        except Exception as e:
+            print(f"❌ [채널 {channel_id}] 분석 중 예외 발생: {str(e)}")
+            return None
+
+    def submit(self, channel_id, jpeg):
+        """JPEG 한 장을 채널 전송 대기열에 넣음 (대기 중인 이전 프레임은 버림)"""
+        stats = self.stats.setdefault(channel_id, {"sent": 0, "dropped": 0, "errors": 0})
+        if channel_id in self._pending:
+            stats["dropped"] += 1
+        self._pending[channel_id] = jpeg
+        if self.batch:
+            if self._batch_task is None or self._batch_task.done():
+                self._batch_task = asyncio.create_task(self._batch_loop())
+            return
+        senders = self._senders.setdefault(channel_id, set())
+        if len(senders) < self.max_in_flight:
+            task = asyncio.create_task(self._send_loop(channel_id))
+            senders.add(task)
+            task.add_done_callback(senders.discard)
+
+    async def _send_loop(self, channel_id):
+        """대기 중인 프레임이 없어질 때까지 하나씩 꺼내 전송 (채널당 최대 max_in_flight개 동시 실행)"""
+        client = self._get_client()
+        stats = self.stats[channel_id]
+        while channel_id in self._pending:
+            jpeg = self._pending.pop(channel_id)
+            try:
+                files = {'file': ('frame.jpg', jpeg, 'image/jpeg')}
                 data = {'channel_id': str(channel_id)}
-                
                 response = await client.post(self.colab_url, files=files, data=data)
-                
+
                 if response.status_code == 200:
-                    result = response.json()
+                    result = response.json()  # 터널 오류 페이지 등 JSON이 아니면 ValueError
+                    if not isinstance(result, dict):
+                        raise ValueError(f"예상하지 못한 응답 형식: {type(result).__name__}")
+                    stats["sent"] += 1
                     # 실시간 갱신 데이터 저장
                     self.latest_results[channel_id] = {
                         "results": result.get('results', {"up": 0, "low": 0}),
                         "encoded_image": result.get('encoded_image', ""),
                         "timestamp": datetime.now().isoformat()
                     }
-                    return self.latest_results[channel_id]
                 else:
+                    stats["errors"] += 1
                     print(f"❌ [채널 {channel_id}] 코랩 응답 오류: {response.status_code}")
-                
-        except httpx.ConnectError:
-            print(f"❌ [채널 {channel_id}] 코랩 연결 실패. Ngrok 주소를 확인하세요.")
-        except Exception as e:
-            print(f"❌ [채널 {channel_id}] 분석 중 예외 발생: {str(e)}")
-            return None
+            except httpx.ConnectError:
+                stats["errors"] += 1
+                print(f"❌ [채널 {channel_id}] 코랩 연결 실패. Ngrok 주소를 확인하세요.")
+                await asyncio.sleep(1.0)  # 터널이 끊긴 동안 연결 시도가 몰리지 않도록
+            except (httpx.HTTPError, ValueError) as e:
+                # 응답 파싱 실패도 전송 실패로 집계 (예외로 전송 태스크가 죽지 않도록)
+                stats["errors"] += 1
+                print(f"❌ [채널 {channel_id}] 코랩 요청 실패: {e!r}")
+
+    async def _batch_loop(self):
+        """대기 중인 채널 프레임을 모두 꺼내 /predict_batch 한 번으로 전송 (응답이 오기 전에 들어온 프레임은 다음 틱)"""
+        client = self._get_client()
+        while self._pending:
+            frames, self._pending = self._pending, {}
+            try:
+                response = await client.post(self.batch_url, content=pack_frames(frames),
+                                             headers={"Content-Type": CONTENT_TYPE})
+                if response.status_code == 200:
+                    now = datetime.now().isoformat()
+                    results = response.json()  # 터널 오류 페이지 등 JSON이 아니면 ValueError
+                    if not isinstance(results, dict):
+                        raise ValueError(f"예상하지 못한 응답 형식: {type(results).__name__}")
+                    for cid in frames:
+                        result = results.get(str(cid))
+                        if result is None:
+                            continue
+                        self.stats[cid]["sent"] += 1
+                        self.latest_results[cid] = {
+                            "results": result.get('results', {"up": 0, "low": 0}),
+                            "encoded_image": "",
+                            "timestamp": now
+                        }
+                else:
+                    for cid in frames:
+                        self.stats[cid]["errors"] += 1
+                    print(f"❌ 코랩 배치 응답 오류: {response.status_code}")
+            except httpx.ConnectError:
+                for cid in frames:
+                    self.stats[cid]["errors"] += 1
+                print("❌ 코랩 연결 실패. Ngrok 주소를 확인하세요.")
+                await asyncio.sleep(1.0)
+            except (httpx.HTTPError, ValueError) as e:
+                # 응답 파싱 실패도 배치 전체 전송 실패로 집계 (예외로 배치 태스크가 죽지 않도록)
+                for cid in frames:
+                    self.stats[cid]["errors"] += 1
+                print(f"❌ 코랩 배치 요청 실패: {e!r}")
 
     def get_latest_data(self, channel_id):
-        return self.latest_results.get(channel_id)
\ No newline at end of file
+        return self.latest_results.get(channel_id)
+
+    async def aclose(self):
+        """전송 중인 요청 취소 후 연결 풀과 스트림 해제"""
+        tasks = [task for senders in self._senders.values() for task in senders]
+        if self._batch_task is not None:
+            tasks.append(self._batch_task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._pending.clear()
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+        for cap in self.caps.values():
+            cap.release()
+        self.caps.clear()
@@ -0,0 +1,85 @@
+import json
+import asyncio
+import threading
+
+
+class TrafficFeed:
+    """
+    분석 결과(수치 데이터)를 갱신 시점에 JSON bytes로 한 번만 만들어 두는 저장소.
+    - 채널 조회 / 전체 조회(bulk)는 미리 만든 bytes를 그대로 응답 (요청마다 dict 복사/직렬화 없음)
+    - SSE 스트림은 연결 시 전체 스냅샷을 보내고, 이후에는 바뀐 채널만 모아서 push
+    """
+
+    def __init__(self, keepalive_sec=15.0):
+        self.keepalive_sec = keepalive_sec
+        self._lock = threading.Lock()
+        self._payloads = {}  # {cid: (version, json bytes)}
+        self._version = 0    # 전체 갱신 카운터
+        self._bulk = None    # (version, bulk json bytes) 캐시
+        self._loop = None
+        self._cond = None
+
+    def bind(self, loop):
+        """이벤트 루프 등록 (startup/lifespan에서 호출)"""
+        self._loop = loop
+        self._cond = asyncio.Condition()
+
+    def publish(self, cid, data):
+        """결과 dict를 JSON bytes로 만들어 저장. 어느 쓰레드에서든 호출 가능"""
+        payload = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        with self._lock:
+            self._version += 1
+            self._payloads[cid] = (self._version, payload)
+        if self._loop is not None:
+            try:
+                self._loop.call_soon_threadsafe(lambda: asyncio.ensure_future(self._notify()))
+            except RuntimeError:
+                pass  # 종료 중 이벤트 루프가 이미 닫힌 경우
+
+    def forget(self, cid):
+        """분석이 끝난 채널의 결과 제거 (버전을 올려 전체 조회 캐시를 다시 만들게 함)"""
+        with self._lock:
+            if self._payloads.pop(cid, None) is not None:
+                self._version += 1
+
+    async def _notify(self):
+        async with self._cond:
+            self._cond.notify_all()
+
+    def get(self, cid):
+        item = self._payloads.get(cid)
+        return item[1] if item is not None else None
+
+    def _join(self, items):
+        """{cid: payload} → 채널 ID를 키로 하는 JSON 객체 bytes (재직렬화 없이 이어 붙임)"""
+        return b"{" + b",".join(b'"%d":' % cid + payload for cid, payload in items) + b"}"
+
+    def bulk(self):
+        """전체 채널 JSON bytes (갱신이 없으면 캐시 재사용)"""
+        with self._lock:
+            if self._bulk is None or self._bulk[0] != self._version:
+                items = sorted((cid, p) for cid, (_, p) in self._payloads.items())
+                self._bulk = (self._version, self._join(items))
+            return self._bulk[1]
+
+    def _changed_since(self, seen):
+        with self._lock:
+            version = self._version
+            items = sorted((cid, p) for cid, (v, p) in self._payloads.items() if v > seen)
+        return version, items
+
+    async def stream(self):
+        """SSE 이벤트 스트림: 처음에는 전체, 이후에는 바뀐 채널만 `event: traffic`으로 전송"""
+        seen = 0
+        while True:
+            version, items = self._changed_since(seen)
+            if items:
+                seen = version
+                yield b"event: traffic\ndata: " + self._join(items) + b"\n\n"
+                continue
+            try:
+                async with self._cond:
+                    await asyncio.wait_for(self._cond.wait_for(lambda: self._version > seen),
+                                           timeout=self.keepalive_sec)
+            except asyncio.TimeoutError:
+                yield b": keepalive\n\n"  # 프록시가 연결을 끊지 않도록 주석 라인 전송
@@ -0,0 +1,130 @@
+"""
+OverlayRenderer vs Ultralytics Results.plot() 벤치마크
+
+실행 (web_site 폴더에서):
+    python -m bench.overlay_bench --mask-dir ../mask --frames 200 --vehicles 25
+
+속도와 함께 같은 Results로 두 방식의 결과가 같은지도 확인합니다:
+기존 전체 해상도 plot()을 480x270으로 줄인 이미지와 렌더러 출력(같은 색/투명도, ROI 외곽선 없음)을 비교해
+MAE / PSNR, 색이 입혀진 영역의 IoU를 출력하고, 최악 프레임이 기준을 벗어나면 실패(종료 코드 1)합니다.
+"""
+import os
+import time
+import argparse
+import cv2
+import numpy as np
+import torch
+from ultralytics.engine.results import Results
+from ultralytics.utils.plotting import colors
+from app.services.occupancy import OccupancyKernel
+from app.services.overlay_renderer import OverlayRenderer
+
+
+def synthetic_result(rng, frame, n, mask_hw):
+    """타원 모양 차량 마스크 n개를 가진 Results 생성 (모델 없이 plot() 비교용)"""
+    h, w = mask_hw
+    masks = np.zeros((n, h, w), dtype=np.uint8)
+    boxes = []
+    for i in range(n):
+        cx, cy = int(rng.integers(0, w)), int(rng.integers(0, h))
+        ax, ay = int(rng.integers(4, 30)), int(rng.integers(3, 18))
+        cv2.ellipse(masks[i], (cx, cy), (ax, ay), 0, 0, 360, 1, -1)
+        sx, sy = frame.shape[1] / w, frame.shape[0] / h
+        boxes.append([(cx - ax) * sx, (cy - ay) * sy, (cx + ax) * sx, (cy + ay) * sy, 0.9, 0])
+    return Results(frame, path="bench", names={0: "car", 1: "truck", 2: "bus"},
+                   boxes=torch.tensor(boxes, dtype=torch.float32),
+                   masks=torch.from_numpy(masks))
+
+
+def tinted(image, base, threshold=30):
+    """원본(base)보다 채널 합 기준 threshold 이상 바뀐 픽셀 = 마스크 색이 입혀진 영역"""
+    return np.abs(image.astype(np.int16) - base).sum(axis=2) > threshold
+
+
+def equivalence(results, frame, size):
+    """[(MAE, PSNR, 색 영역 IoU)] — 기존 plot() 축소본 vs 렌더러 출력 (프레임별)"""
+    kernel = OccupancyKernel()  # ROI 없는 커널 → 외곽선 없이 차량 마스크만 비교
+    # plot()은 클래스 색(모두 0번 클래스)을 0.5 투명도로 입힘
+    renderer = OverlayRenderer(kernel, size=size, color=colors(0, True), alpha=0.5)
+    small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+    out = []
+    for res in results:
+        baseline = cv2.resize(res.plot(boxes=False, masks=True), size, interpolation=cv2.INTER_AREA)
+        rendered = renderer.render(1, frame, kernel.union(res.masks.data))
+        diff = baseline.astype(np.float64) - rendered
+        mae = np.abs(diff).mean()
+        mse = (diff ** 2).mean()
+        psnr = 10 * np.log10(255.0 ** 2 / mse) if mse > 0 else float("inf")
+        a, b = tinted(baseline, small), tinted(rendered, small)
+        union = np.count_nonzero(a | b)
+        iou = np.count_nonzero(a & b) / union if union else 1.0
+        out.append((mae, psnr, iou))
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mask-dir", default="../mask")
+    parser.add_argument("--camera", default="서초")
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--vehicles", type=int, default=25)
+    parser.add_argument("--frame-size", default="1920x1080")
+    # 프레임과 가로세로 비율이 다르면 plot()이 마스크를 letterbox로 보고 위아래를 잘라 비교가 어긋남
+    parser.add_argument("--mask-size", default="320x180", help="res.masks.data 해상도 (WxH, 프레임과 같은 비율)")
+    parser.add_argument("--check-frames", type=int, default=20, help="동등성 비교에 쓸 프레임 수")
+    # 렌더러는 점유율 계산용 stride-4 합집합을 키워 그리므로 경계가 조금 거칠어짐 → 그만큼의 여유를 둔 기준
+    parser.add_argument("--max-mae", type=float, default=5.0)
+    parser.add_argument("--min-psnr", type=float, default=24.0)
+    parser.add_argument("--min-iou", type=float, default=0.75)
+    args = parser.parse_args()
+
+    fw, fh = map(int, args.frame_size.split("x"))
+    mw, mh = map(int, args.mask_size.split("x"))
+    rng = np.random.default_rng(0)
+
+    kernel = OccupancyKernel()
+    for direct, folder in (("up", "상행선"), ("low", "하행선")):
+        for ext in ("png", "PNG"):
+            path = os.path.join(args.mask_dir, folder, f"{args.camera}_mask.{ext}")
+            if os.path.exists(path):
+                kernel.set_roi(1, direct, cv2.imread(path, cv2.IMREAD_GRAYSCALE))
+    renderer = OverlayRenderer(kernel)
+
+    frame = rng.integers(0, 255, (fh, fw, 3), dtype=np.uint8)
+    results = [synthetic_result(rng, frame, args.vehicles, (mh, mw)) for _ in range(args.frames)]
+
+    # 1) 기존 방식: res.plot() + 480x270 리사이즈
+    t0 = time.perf_counter()
+    for res in results:
+        cv2.resize(res.plot(boxes=False, masks=True), (480, 270))
+    plot_ms = (time.perf_counter() - t0) * 1000 / len(results)
+
+    # 2) 새 방식: 점유율 계산에서 만든 합집합 재사용 + 표시 해상도에서 합성
+    unions = [kernel.union(res.masks.data).copy() for res in results]
+    t0 = time.perf_counter()
+    for union in unions:
+        renderer.render(1, frame, union)
+    render_ms = (time.perf_counter() - t0) * 1000 / len(results)
+
+    print(f"frames={args.frames} vehicles={args.vehicles} frame={fw}x{fh} masks={mw}x{mh}")
+    print(f"Results.plot + resize : {plot_ms:8.2f} ms/frame")
+    print(f"OverlayRenderer.render: {render_ms:8.2f} ms/frame  (x{plot_ms / render_ms:.1f})")
+
+    # 3) 동등성: 같은 Results에서 두 방식의 표시 해상도 결과 비교
+    checks = np.array(equivalence(results[:args.check_frames], frame, renderer.size))
+    mae, psnr, iou = checks[:, 0], checks[:, 1], checks[:, 2]
+    print(f"equivalence ({len(checks)} frames, {renderer.size[0]}x{renderer.size[1]}): "
+          f"MAE mean {mae.mean():.2f} / max {mae.max():.2f}, "
+          f"PSNR mean {psnr.mean():.2f} / min {psnr.min():.2f} dB, "
+          f"tint IoU mean {iou.mean():.3f} / min {iou.min():.3f}")
+    failed = [name for name, bad in (("MAE", mae.max() > args.max_mae), ("PSNR", psnr.min() < args.min_psnr),
+                                     ("IoU", iou.min() < args.min_iou)) if bad]
+    if failed:
+        print(f"❌ 동등성 기준 미달: {', '.join(failed)} "
+              f"(MAE <= {args.max_mae}, PSNR >= {args.min_psnr}, IoU >= {args.min_iou})")
+        raise SystemExit(1)
+    print("✅ 동등성 기준 통과")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,485 @@
+"""
+분석 파이프라인 오프라인 리플레이 벤치마크 (GPU / 네트워크 없이 커밋 간 처리량 비교용)
+
+로컬 영상 파일 또는 합성 프레임을 채널 N개로 재생하면서
+main.py / main2.py와 같은 서비스 객체로 캡처 → 추론 → 점유율 → 차량 추적 → 혼잡도 → 이력 → 오버레이 → JPEG 인코딩
+경로를 그대로 태우고 (벤치 채널 i는 channels.json의 i번째 채널 카메라 ROI 마스크 사용),
+단계별 지연 백분위수 / 채널별 fps / 최대 RSS / CPU 사용률을 JSON으로 출력합니다.
+
+실행 (web_site 폴더에서):
+    # main2.py 방식 (동적 배치), 합성 프레임 6채널, 최대 속도
+    python -m bench.replay_bench --model best_v8m.pt --synthetic 6 --frames 100
+    # main.py 방식 (채널별 단건 추론), 로컬 영상 2개를 실시간 속도로 재생
+    python -m bench.replay_bench --model best_v8m.pt --video a.mp4 b.mp4 --mode stream --realtime
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from app.services.capture_service import CaptureService, ChannelCapture
+from app.services.batch_scheduler import DynamicBatcher
+from app.services.inference_engine import create_engine
+from app.services.occupancy import OccupancyKernel
+from app.services.overlay_renderer import OverlayRenderer
+from app.services.change_gate import FrameChangeGate
+from app.services.roi_crop import RoiCropper
+from app.services.ffmpeg_capture import FfmpegCapture
+from app.services.tracker import VehicleTracker
+from app.services.congestion import CongestionTracker, LABELS
+from app.services.history_store import OccupancyHistoryStore
+from app.services.mask_registry import MaskRegistry
+from app.services.channel_config import CHANNELS_PATH, load_channels, channel_cameras
+
+
+class StageTimer:
+    """단계별 소요 시간(ms) 원본 샘플 수집기 (리포트 시 정확한 백분위수 계산)"""
+
+    def __init__(self):
+        self.samples = {}
+        self.enabled = False  # 워밍업 동안은 기록하지 않음
+
+    def add(self, stage, ms):
+        if self.enabled:
+            self.samples.setdefault(stage, []).append(ms)  # list.append는 GIL 아래에서 쓰레드 안전
+
+    def report(self):
+        out = {}
+        for stage, values in self.samples.items():
+            arr = np.asarray(values)
+            out[stage] = {
+                "count": int(arr.size),
+                "mean": round(float(arr.mean()), 3),
+                "p50": round(float(np.percentile(arr, 50)), 3),
+                "p90": round(float(np.percentile(arr, 90)), 3),
+                "p99": round(float(np.percentile(arr, 99)), 3),
+                "max": round(float(arr.max()), 3),
+            }
+        return out
+
+
+def synthetic_frames(rng, size, n_frames=60, n_vehicles=20):
+    """도로 위를 움직이는 타원 차량 합성 프레임 (프레임마다 새로 그리지 않도록 미리 만들어 순환)"""
+    w, h = size
+    base = np.full((h, w, 3), 90, dtype=np.uint8)
+    base[: h // 4] = (200, 170, 140)  # 하늘 부분
+    cars = [(rng.uniform(0, w), rng.uniform(h * 0.3, h), rng.uniform(-8, 8) * w / 1920,
+             int(rng.integers(20, 70) * w / 1920), tuple(int(c) for c in rng.integers(0, 255, 3)))
+            for _ in range(n_vehicles)]
+    frames = []
+    for t in range(n_frames):
+        frame = base.copy()
+        for x, y, vx, r, color in cars:
+            cx = int((x + vx * t) % w)
+            cv2.ellipse(frame, (cx, int(y)), (r, max(4, r // 2)), 0, 0, 360, color, -1)
+        frames.append(frame)
+    return frames
+
+
+# 다시 열었는데 첫 프레임도 못 읽는 일이 이만큼 연속되면 재생 불가로 보고 중단 (없는 파일 / 깨진 영상)
+MAX_REOPEN_FAILURES = 3
+
+
+class VideoOpenError(Exception):
+    """리플레이 영상을 열 수 없거나 다시 열어도 프레임을 읽지 못함 (벤치를 실패로 종료)"""
+
+
+class ReplayCapture(ChannelCapture):
+    """ChannelCapture와 같은 슬롯/콜백 계약을 지키면서 로컬 영상(반복 재생) 또는 합성 프레임을 공급"""
+
+    def __init__(self, channel_id, source, timer, resize_to=None, on_frame=None, realtime=False, fps=30.0,
+                 backend="opencv", decode_every=1, keyframes_only=False):
+        super().__init__(channel_id, str(source) if isinstance(source, str) else "synthetic",
+                         resize_to=resize_to, on_frame=on_frame, backend=backend,
+                         decode_every=decode_every, keyframes_only=keyframes_only)
+        self.source = source  # 영상 경로 또는 합성 프레임 리스트
+        self.timer = timer
+        self.realtime = realtime
+        self.fps = fps
+        self.decoded = 0
+        self.error = None  # 재생 쓰레드가 멈춘 이유 (벤치 루프가 확인해서 중단)
+
+    def _open_source(self):
+        if self.backend == "ffmpeg":
+            cap = FfmpegCapture(self.source, size=self.resize_to, every=self.decode_every,
+                                keyframes_only=self.keyframes_only)
+        else:
+            cap = cv2.VideoCapture(self.source)
+        if not cap.isOpened():
+            cap.release()
+            raise VideoOpenError(f"[채널 {self.channel_id}] 영상을 열 수 없습니다: {self.source}")
+        return cap
+
+    def run(self):
+        try:
+            self._play()
+        except Exception as e:
+            self.error = e
+            print(f"❌ [채널 {self.channel_id}] 재생 중단: {e}")
+
+    def _play(self):
+        cap = self._open_source() if isinstance(self.source, str) else None
+        probe = cv2.VideoCapture(self.source) if cap is not None else None
+        if probe is not None:
+            if probe.get(cv2.CAP_PROP_FPS) > 0:
+                self.fps = probe.get(cv2.CAP_PROP_FPS) / self.decode_every
+            probe.release()
+        skip = self.decode_every - 1 if self.backend != "ffmpeg" else 0
+        interval = 1.0 / self.fps
+        next_due = time.perf_counter()
+        i = 0
+        failed_reopens = 0  # 다시 연 뒤 한 프레임도 읽지 못한 연속 횟수
+        try:
+            while not self._stop_event.is_set():
+                t0 = time.perf_counter()
+                if cap is not None:
+                    for _ in range(skip):
+                        cap.grab()
+                    success, frame = cap.read()
+                    if not success:  # 끝나면 처음부터 다시 재생
+                        cap.release()
+                        cap = None
+                        failed_reopens += 1
+                        if failed_reopens > MAX_REOPEN_FAILURES:
+                            raise VideoOpenError(f"[채널 {self.channel_id}] 다시 열어도 프레임을 읽지 못했습니다 "
+                                               f"({MAX_REOPEN_FAILURES}회 연속): {self.source}")
+                        cap = self._open_source()
+                        continue
+                    failed_reopens = 0
+                else:
+                    frame = self.source[i % len(self.source)]
+                    i += 1
+                t1 = time.perf_counter()
+                self.timer.add("decode", (t1 - t0) * 1000)
+                if self.resize_to is not None and (frame.shape[1], frame.shape[0]) != tuple(self.resize_to):
+                    frame = cv2.resize(frame, self.resize_to)
+                    self.timer.add("resize", (time.perf_counter() - t1) * 1000)
+                self.slot.write(frame)
+                self.decoded += 1
+                if self.on_frame is not None:
+                    self.on_frame(self.channel_id)
+                if self.realtime:
+                    next_due += interval
+                    self._stop_event.wait(max(0.0, next_due - time.perf_counter()))
+                elif cap is None:
+                    self._stop_event.wait(0.001)  # 합성 프레임은 디코딩 비용이 없으므로 무한 루프 방지
+        finally:
+            if cap is not None:
+                cap.release()
+
+
+def load_rois(kernel, mask_dir, channels_path, cids, resolution):
+    """
+    벤치 채널 i → channels.json의 i번째 채널(채널 ID 순, 모자라면 순환) 카메라 이름으로 서버와 같은 MaskRegistry 로드.
+    마스크 캐시는 임시 폴더에 쓰고, 마스크가 없는 방향은 처리량 측정을 위해 프레임 전체를 ROI로 사용
+    반환: {벤치 채널: 카메라 이름}
+    """
+    cameras = channel_cameras(load_channels(channels_path))
+    configured = sorted(cameras)
+    bench_cameras = {cid: cameras[configured[(cid - 1) % len(configured)]] for cid in cids}
+    with tempfile.TemporaryDirectory() as cache_dir:
+        registry = MaskRegistry(mask_dir, channels=bench_cameras, resolution=resolution, cache_dir=cache_dir)
+        registry.load()
+    kernel.load(registry.masks())
+    for cid in cids:
+        for direct in ("up", "low"):
+            if registry.get(cid, direct) is None:
+                kernel.set_roi(cid, direct, np.full((90, 160), 255, np.uint8))
+    if registry.missing():
+        print(f"⚠️ 벤치 채널 {registry.missing()}은 마스크 대신 프레임 전체를 ROI로 측정합니다")
+    return bench_cameras
+
+
+class Pipeline:
+    """main.py / main2.py의 분석 루프 한 바퀴와 같은 단계 구성과 서비스 객체 (단계마다 시간 기록)"""
+
+    def __init__(self, args, engine, kernel, timer):
+        self.args = args
+        self.engine = engine
+        self.kernel = kernel
+        self.timer = timer
+        self.cropper = RoiCropper(kernel, args.imgsz) if args.roi_crop else None
+        self.renderer = OverlayRenderer(kernel)
+        self.gate = FrameChangeGate(kernel, threshold=args.gate) if args.gate > 0 else None
+        self.congestion = CongestionTracker()
+        self.trackers = {}  # {cid: VehicleTracker} (main2.py vehicle_trackers와 같은 채널별 추적기)
+        self.history = OccupancyHistoryStore()  # 파일 없이 메모리 링 버퍼 + 롤업만
+        self.encoder = ThreadPoolExecutor(max_workers=args.encode_workers)
+        self.analyzed = {}
+        self.skipped = {}
+        self.batch_sizes = []
+
+    def filter(self, batch):
+        if self.gate is None:
+            return batch
+        t0 = time.perf_counter()
+        kept = []
+        for item in batch:
+            if self.gate.check(item[0], item[1]):
+                kept.append(item)
+            else:
+                self.skipped[item[0]] = self.skipped.get(item[0], 0) + 1
+        self.timer.add("gate", (time.perf_counter() - t0) * 1000)
+        return kept
+
+    def infer(self, batch):
+        """배치 [(cid, frame, seq, ts)] → 추론 + 점유율 + (인코딩 쓰레드로) 오버레이/JPEG"""
+        now = time.monotonic()
+        if self.timer.enabled:
+            self.batch_sizes.append(len(batch))
+        for _, _, _, ts in batch:
+            self.timer.add("frame_age", (now - ts) * 1000)  # 디코딩 후 추론 시작까지 (신선도)
+        t0 = time.perf_counter()
+        inputs = [frame for _, frame, _, _ in batch]
+        if self.cropper is not None:
+            inputs = [self.cropper.crop(cid, frame) for (cid, _, _, _), frame in zip(batch, inputs)]
+        t1 = time.perf_counter()
+        results = self.engine.predict(inputs, imgsz=self.args.imgsz)
+        t2 = time.perf_counter()
+        if self.cropper is not None:
+            self.timer.add("crop", (t1 - t0) * 1000)
+        self.timer.add("predict", (t2 - t1) * 1000)
+        self.timer.add("predict_per_frame", (t2 - t1) * 1000 / len(batch))
+
+        # crop 모드면 점유율/추적 모두 캔버스 좌표 커널 기준 (main2.py analyze_batch와 같음)
+        kernel = self.cropper.kernel if self.cropper is not None else self.kernel
+        now = time.monotonic()
+        for (cid, frame, _, _), res in zip(batch, results):
+            t0 = time.perf_counter()
+            masks = res.masks.data if res.masks is not None else None
+            occupancy, union = kernel.analyze(cid, masks)
+            weighted = kernel.weighted(cid, union)
+            t1 = time.perf_counter()
+            self.timer.add("occupancy", (t1 - t0) * 1000)
+            tracker = self.trackers.setdefault(cid, VehicleTracker())
+            boxes, scores, instances = tracker.detections(res)
+            rois = {} if union is None else {d: kernel.roi(cid, d, union.shape)[0] for d in kernel.directions(cid)}
+            tracker.update(boxes, scores, instances, rois, now)
+            flow = tracker.flow(now)
+            t2 = time.perf_counter()
+            self.timer.add("track", (t2 - t1) * 1000)
+            final_data = {}
+            for direct, occ_rate in occupancy.items():
+                smoothed, level = self.congestion.update(cid, direct, weighted.get(direct, occ_rate))
+                final_data[direct] = {"occupancy_rate": round(occ_rate * 100, 1),
+                                      "occupancy_rate_smoothed": round(smoothed * 100, 1),
+                                      "vehicles_per_min": round(flow.get(direct, 0.0), 1),
+                                      "status": LABELS["ko"][level]}
+            t3 = time.perf_counter()
+            self.timer.add("congestion", (t3 - t2) * 1000)
+            self.history.add_result(cid, {"channel_id": cid, "results": final_data,
+                                          "vehicle_total_count": len(res.boxes) if res.boxes is not None else 0})
+            self.timer.add("history", (time.perf_counter() - t3) * 1000)
+            self.analyzed[cid] = self.analyzed.get(cid, 0) + 1
+            if self.args.no_render:
+                continue
+            # 시청자가 있을 때만 (main2.py publish_analysis) 표시 해상도 합집합을 만들어 인코딩 쓰레드로 넘김
+            t0 = time.perf_counter()
+            if self.cropper is not None:
+                union = self.cropper.uncrop(cid, union, self.renderer.size[::-1])
+            elif union is not None:
+                union = union.copy()
+            self.timer.add("uncrop", (time.perf_counter() - t0) * 1000)
+            self.encoder.submit(self.encode, cid, frame, union)
+
+    def encode(self, cid, frame, union):
+        t0 = time.perf_counter()
+        annotated = self.renderer.render(cid, frame, union)
+        t1 = time.perf_counter()
+        cv2.imencode('.jpg', annotated, [int(cv2.IMWRITE_JPEG_QUALITY), self.args.jpeg_quality])
+        self.timer.add("render", (t1 - t0) * 1000)
+        self.timer.add("encode", (time.perf_counter() - t1) * 1000)
+
+
+async def run_batched(pipeline, batcher, loop_until):
+    """main2.py 방식: 동적 배처 → 배치 추론 (추론 전용 쓰레드)"""
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=1)
+    while not loop_until():
+        batch = pipeline.filter(await batcher.next_batch())
+        if batch:
+            await loop.run_in_executor(executor, pipeline.infer, batch)
+    executor.shutdown()
+
+
+async def run_stream(pipeline, capture, loop_until):
+    """main.py 방식: 채널별로 최신 프레임 1장씩 단건 추론"""
+    while not loop_until():
+        items = capture.collect_new_frames()
+        if not items:
+            await asyncio.sleep(0.001)
+            continue
+        for cid, frame, seq, ts in items:
+            capture.mark_seen(cid, seq)
+            batch = pipeline.filter([(cid, frame, seq, ts)])
+            if batch:
+                pipeline.infer(batch)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", required=True, help="YOLO 세그멘테이션 .pt 경로")
+    parser.add_argument("--backend", default=None, help="torch | onnx | openvino (기본: 자동 선택)")
+    parser.add_argument("--video", nargs="*", default=[], help="채널로 재생할 로컬 영상 파일들")
+    parser.add_argument("--synthetic", type=int, default=0, help="합성 프레임 채널 수")
+    parser.add_argument("--frame-size", default="1920x1080", help="합성 프레임 해상도 (WxH)")
+    parser.add_argument("--mode", choices=["batch", "stream"], default="batch",
+                        help="batch: main2.py 동적 배치, stream: main.py 채널별 단건 추론")
+    parser.add_argument("--imgsz", type=int, default=None, help="기본: batch 640, stream 320")
+    parser.add_argument("--max-batch", type=int, default=8)
+    parser.add_argument("--max-wait-ms", type=float, default=30)
+    parser.add_argument("--roi-crop", action="store_true", help="도로 ROI box만 잘라서 추론 (USE_ROI_CROP)")
+    parser.add_argument("--gate", type=float, default=0.0, help="프레임 차이 게이트 임계값 (0이면 끔)")
+    parser.add_argument("--no-render", action="store_true", help="오버레이/JPEG 생략 (시청자 없음)")
+    parser.add_argument("--encode-workers", type=int, default=4)
+    parser.add_argument("--jpeg-quality", type=int, default=65)
+    parser.add_argument("--realtime", action="store_true", help="원본 fps로 재생 (기본: 최대 속도)")
+    parser.add_argument("--capture-backend", choices=["opencv", "ffmpeg"], default="opencv",
+                        help="영상 파일 디코더 (CAPTURE_BACKEND)")
+    parser.add_argument("--decode-every", type=int, default=1, help="k번째 프레임만 사용 (DECODE_EVERY)")
+    parser.add_argument("--keyframes-only", action="store_true", help="키프레임만 디코딩 (KEYFRAMES_ONLY)")
+    parser.add_argument("--capture-size", default=None, help="디코딩 해상도 WxH (CAPTURE_SIZE)")
+    parser.add_argument("--fps", type=float, default=30.0, help="합성 프레임 재생 fps (--realtime)")
+    parser.add_argument("--frames", type=int, default=100, help="채널당 분석할 프레임 수")
+    parser.add_argument("--duration", type=float, default=None, help="측정 시간(초). 지정 시 --frames 무시")
+    parser.add_argument("--warmup", type=float, default=3.0, help="측정 전 워밍업 시간(초)")
+    parser.add_argument("--mask-dir", default=os.path.join(os.path.dirname(__file__), "..", "..", "mask"))
+    parser.add_argument("--channels", default=CHANNELS_PATH, help="채널 구성 파일 (CHANNELS_CONFIG, 기본 channels.json)")
+    parser.add_argument("--mask-resolution", default="1280x720", help="ROI 마스크 해상도 WxH (MASK_RESOLUTION)")
+    parser.add_argument("--output", default=None, help="결과 JSON 저장 경로 (기본: stdout)")
+    args = parser.parse_args()
+
+    sources = list(args.video)
+    if args.synthetic:
+        fw, fh = map(int, args.frame_size.split("x"))
+        rng = np.random.default_rng(0)
+        sources += [synthetic_frames(rng, (fw, fh)) for _ in range(args.synthetic)]
+    if not sources:
+        parser.error("--video 또는 --synthetic 중 하나는 필요합니다")
+    if args.imgsz is None:
+        args.imgsz = 640 if args.mode == "batch" else 320
+    cids = list(range(1, len(sources) + 1))
+
+    timer = StageTimer()
+    kernel = OccupancyKernel()
+    cameras = load_rois(kernel, args.mask_dir, args.channels, cids, tuple(map(int, args.mask_resolution.split("x"))))
+    engine = create_engine(args.model, imgsz=args.imgsz, backend=args.backend)
+    pipeline = Pipeline(args, engine, kernel, timer)
+
+    # main2.py와 같이 crop 모드가 아니면 캡처 쓰레드에서 imgsz 정사각형으로 미리 리사이즈 (main.py는 원본 그대로)
+    capture_size = tuple(map(int, args.capture_size.split("x"))) if args.capture_size else None
+    resize_to = (args.imgsz, args.imgsz) if args.mode == "batch" and not args.roi_crop else capture_size
+    capture = CaptureService(resize_to=resize_to)
+    batcher = DynamicBatcher(capture, max_batch_size=args.max_batch, max_wait_ms=args.max_wait_ms)
+    for cid, source in zip(cids, sources):
+        worker = ReplayCapture(cid, source, timer, resize_to=resize_to, on_frame=batcher.notify,
+                               realtime=args.realtime, fps=args.fps, backend=args.capture_backend,
+                               decode_every=args.decode_every, keyframes_only=args.keyframes_only)
+        capture.channels[cid] = worker
+        capture.last_seen[cid] = 0
+        worker.start()
+
+    state = {"start": None, "cpu": None}
+
+    def begin_measure():
+        pipeline.analyzed.clear()
+        pipeline.skipped.clear()
+        for worker in capture.channels.values():
+            worker.decoded = 0
+        timer.enabled = True
+        state["start"] = time.perf_counter()
+        state["cpu"] = os.times()
+
+    def loop_until():
+        for worker in capture.channels.values():
+            if worker.error is not None:  # 재생할 수 없는 영상이면 프레임을 끝없이 기다리지 않고 중단
+                raise worker.error
+        now = time.perf_counter()
+        if state["start"] is None:
+            if now - started >= args.warmup:
+                begin_measure()
+            return False
+        if args.duration is not None:
+            return now - state["start"] >= args.duration
+        return all(pipeline.analyzed.get(cid, 0) >= args.frames for cid in cids)
+
+    started = time.perf_counter()
+    runner = run_batched(pipeline, batcher, loop_until) if args.mode == "batch" \
+        else run_stream(pipeline, capture, loop_until)
+    try:
+        asyncio.run(runner)
+    except VideoOpenError as e:
+        # 재생할 수 없는 영상: 캡처 / 인코딩 쓰레드를 정리하고 실패로 종료
+        capture.stop_all()
+        pipeline.encoder.shutdown(wait=False)
+        print(f"❌ 벤치 중단: {e}", file=sys.stderr)
+        raise SystemExit(1)
+    pipeline.encoder.shutdown(wait=True)
+    wall = time.perf_counter() - state["start"]
+    cpu_end = os.times()
+    decoded = {cid: capture.channels[cid].decoded for cid in cids}
+    capture.stop_all()
+
+    cpu_sec = (cpu_end.user - state["cpu"].user) + (cpu_end.system - state["cpu"].system)
+    n_cpu = os.cpu_count() or 1
+    # Linux ru_maxrss 단위는 KB, macOS는 bytes
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_rss_mb = max_rss / (1024 * 1024) if sys.platform == "darwin" else max_rss / 1024
+
+    report = {
+        "git": git_revision(),
+        "host": {"platform": platform.platform(), "cpu_count": n_cpu, "python": platform.python_version()},
+        "config": {
+            "mode": args.mode, "engine": engine.name, "device": engine.device, "imgsz": args.imgsz,
+            "channels": len(cids), "sources": [s if isinstance(s, str) else "synthetic" for s in sources],
+            "cameras": cameras,
+            "roi_crop": args.roi_crop, "gate": args.gate, "render": not args.no_render,
+            "realtime": args.realtime, "capture_backend": args.capture_backend,
+            "decode_every": args.decode_every, "keyframes_only": args.keyframes_only,
+            "capture_size": args.capture_size, "max_batch": args.max_batch, "max_wait_ms": args.max_wait_ms,
+        },
+        "wall_sec": round(wall, 3),
+        "total_fps": round(sum(pipeline.analyzed.values()) / wall, 2),
+        "channels": {
+            cid: {
+                "analyzed": pipeline.analyzed.get(cid, 0),
+                "skipped": pipeline.skipped.get(cid, 0),
+                "decoded": decoded[cid],
+                "fps": round(pipeline.analyzed.get(cid, 0) / wall, 2),
+            }
+            for cid in cids
+        },
+        "stages_ms": timer.report(),
+        "batch_size": {"mean": round(float(np.mean(pipeline.batch_sizes)), 2) if pipeline.batch_sizes else 0.0,
+                       "max": max(pipeline.batch_sizes, default=0)},
+        "peak_rss_mb": round(peak_rss_mb, 1),
+        "cpu": {"seconds": round(cpu_sec, 2), "cores_used": round(cpu_sec / wall, 2),
+                "utilization": round(cpu_sec / wall / n_cpu, 3)},
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+        print(f"✅ 결과 저장: {args.output}")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
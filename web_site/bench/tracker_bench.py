@@ -0,0 +1,110 @@
+"""
+VehicleTracker 벤치마크 + 박스/마스크 정렬 확인
+
+실행 (web_site 폴더에서):
+    python -m bench.tracker_bench --frames 300 --vehicles 25 --frame-size 1920x1080 --imgsz 320
+
+Ultralytics와 같은 방식으로 합성 Results를 만듭니다: 차량 마스크는 패딩을 포함한 letterbox 입력 해상도에 그리고,
+박스는 ops.scale_boxes로 원본 프레임 좌표로 되돌림. 비정사각 프레임에서도 detections()가 박스를 마스크 좌표로
+정확히 옮기는지(stride 1에서 인스턴스 마스크의 외접 박스와 IoU), 추적 id 수가 실제 차량 수와 같은지 확인하고
+update() 시간을 출력합니다. 기준을 벗어나면 실패(종료 코드 1)합니다.
+"""
+import time
+import argparse
+import cv2
+import numpy as np
+import torch
+from ultralytics.engine.results import Results
+from ultralytics.utils import ops
+from app.services.tracker import VehicleTracker, iou_matrix
+
+
+def letterbox_shape(frame_hw, imgsz, stride=32):
+    """Ultralytics predict(auto=True)의 최소 패딩 letterbox 입력 해상도 (h, w)"""
+    h, w = frame_hw
+    gain = min(imgsz / h, imgsz / w)
+    nh, nw = round(h * gain), round(w * gain)
+    return int(np.ceil(nh / stride) * stride), int(np.ceil(nw / stride) * stride)
+
+
+def synthetic_results(rng, frame, n_frames, n_vehicles, input_hw):
+    """차량이 오른쪽으로 움직이는 n_frames개 Results (마스크: letterbox 입력 좌표, 박스: 원본 좌표)"""
+    ih, iw = input_hw
+    fh, fw = frame.shape[:2]
+    gain = min(ih / fh, iw / fw)
+    nh, nw = round(fh * gain), round(fw * gain)
+    pad_x, pad_y = round((iw - nw) / 2 - 0.1), round((ih - nh) / 2 - 0.1)
+    travel = nw / 3  # 화면 밖으로 나갔다 다시 들어오지 않도록 전체 이동 거리를 폭의 1/3로 제한
+    speed = travel / max(n_frames, 1)
+    cars = [(rng.uniform(pad_x + 15, pad_x + nw - travel - 15), rng.uniform(pad_y + 10, pad_y + nh - 10),
+             int(rng.integers(6, 14)), int(rng.integers(4, 8))) for _ in range(n_vehicles)]
+    out = []
+    for t in range(n_frames):
+        masks = np.zeros((n_vehicles, ih, iw), dtype=np.uint8)
+        boxes = []
+        for i, (x, y, ax, ay) in enumerate(cars):
+            cx = int(x + speed * t)
+            cy = int(y)
+            cv2.ellipse(masks[i], (cx, cy), (ax, ay), 0, 0, 360, 1, -1)
+            boxes.append([cx - ax, cy - ay, cx + ax + 1, cy + ay + 1])
+        boxes = ops.scale_boxes((ih, iw), np.array(boxes, dtype=np.float32), (fh, fw))
+        boxes = np.concatenate([boxes, np.full((n_vehicles, 1), 0.9), np.zeros((n_vehicles, 1))], axis=1)
+        out.append(Results(frame, path="bench", names={0: "car"},
+                           boxes=torch.tensor(boxes, dtype=torch.float32), masks=torch.from_numpy(masks)))
+    return out
+
+
+def alignment(res):
+    """stride 1에서 detections()가 옮긴 박스와 인스턴스 마스크 외접 박스의 최소 IoU"""
+    boxes, _, masks = VehicleTracker(stride=1).detections(res)
+    worst = 1.0
+    for box, mask in zip(boxes, masks):
+        ys, xs = np.nonzero(mask)
+        mask_box = np.array([[xs.min(), ys.min(), xs.max() + 1, ys.max() + 1]], dtype=np.float32)
+        worst = min(worst, float(iou_matrix(box[None], mask_box)[0, 0]))
+    return worst
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--vehicles", type=int, default=25)
+    parser.add_argument("--frame-size", default="1920x1080", help="원본 프레임 WxH (비정사각이면 마스크에 패딩이 생김)")
+    parser.add_argument("--imgsz", type=int, default=320)
+    parser.add_argument("--fps", type=float, default=10.0)
+    parser.add_argument("--min-iou", type=float, default=0.9)
+    args = parser.parse_args()
+
+    fw, fh = map(int, args.frame_size.split("x"))
+    input_hw = letterbox_shape((fh, fw), args.imgsz)
+    rng = np.random.default_rng(0)
+    frame = np.zeros((fh, fw, 3), dtype=np.uint8)
+    results = synthetic_results(rng, frame, args.frames, args.vehicles, input_hw)
+
+    aligned = min(alignment(res) for res in results[:20])
+
+    tracker = VehicleTracker()
+    elapsed = 0.0
+    for t, res in enumerate(results):
+        boxes, scores, masks = tracker.detections(res)
+        t0 = time.perf_counter()
+        tracker.update(boxes, scores, masks, {}, now=t / args.fps)
+        elapsed += time.perf_counter() - t0
+    ids = tracker._next_id - 1
+
+    print(f"frames={args.frames} vehicles={args.vehicles} frame={fw}x{fh} input={input_hw[1]}x{input_hw[0]}")
+    print(f"update: {elapsed * 1000 / len(results):.3f} ms/frame, track ids: {ids} (vehicles {args.vehicles})")
+    print(f"box / mask alignment IoU: min {aligned:.4f}")
+    failed = []
+    if aligned < args.min_iou:
+        failed.append(f"박스/마스크 정렬 IoU {aligned:.4f} < {args.min_iou}")
+    if ids != args.vehicles:
+        failed.append(f"추적 id {ids}개 ≠ 차량 {args.vehicles}대")
+    if failed:
+        print(f"❌ 확인 실패: {', '.join(failed)}")
+        raise SystemExit(1)
+    print("✅ 정렬 / 추적 확인 통과")
+
+
+if __name__ == "__main__":
+    main()
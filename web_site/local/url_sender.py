@@ -1,79 +1,128 @@
-import requests
-import urllib3
+import os
+import sys
 import time
 
-# 1. SSL 경고 무시 (보내주신 코드 반영)
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+# web_site 폴더의 app 패키지(CCTV 카탈로그)를 사용하기 위해 경로 추가
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.services.cctv_catalog import CctvCatalog, url_expiry
+from app.services.channel_config import load_channels, channel_targets
+
+REFRESH_MARGIN = 120    # 만료 2분 전에 새 주소로 교체 (서버가 새 스트림 첫 프레임을 받을 시간)
+MIN_INTERVAL = 30       # 실패/같은 주소가 돌아왔을 때 재시도 간격
+CHECK_INTERVAL = 300    # 만료가 멀어도 이 간격으로 서버 상태 확인 (서버 재시작 시 전체 재전송)
+UNSIGNED_TTL = 3600     # 만료 정보(wmsAuthSign)가 없는 주소는 기존처럼 1시간마다 갱신
+MAX_BACKOFF = 1800      # 목록에서 찾지 못한 채널의 재시도 간격 상한 (MIN_INTERVAL부터 실패마다 2배)
 
 class TrafficAnalysisService:
-    def __init__(self, api_key: str, colab_url: str):
+    def __init__(self, api_key: str, colab_url: str, api_url: str = None):
         self.api_key = api_key
-        self.api_url = "https://openapi.its.go.kr:9443/cctvInfo"
+        # 전국 CCTV 목록을 한 번 받아 이름 인덱스로 캐시 (연결 풀 세션, URL 만료에 맞춘 TTL)
+        self.catalog = CctvCatalog(api_key, api_url=api_url)
         self.colab_endpoint = f"{colab_url.rstrip('/')}/update_urls"
+        self.sent_urls = {}   # {채널: 서버에 마지막으로 보낸 URL}
+        self.expires_at = {}  # {채널: URL 만료 시각(epoch)}
+        self.failures = {}    # {채널: 목록에서 연속으로 찾지 못한 횟수}
+        self.retry_at = {}    # {채널: 다음 재시도 시각(epoch)} → 잘못된 이름 하나 때문에 30초마다 전체 목록을 받지 않도록
         
-        # 사용자가 정의한 채널 설정
-        self.channel_configs = {
-            1: {"target_name": "[경부선] 서초"},
-            2: {"target_name": "[경부선] 달래내2"},
-            3: {"target_name": "[경부선] 금곡교"},            
-            4: {"target_name": "[경부선] 판교3"},
-            5: {"target_name": "[경부선] 신갈분기점"},
-            6: {"target_name": "[경부선] 기흥"},
-        }
+        # 채널 설정 (서버의 ROI 마스크 매핑과 같은 web_site/channels.json, CHANNELS_CONFIG로 경로 변경)
+        self.channel_configs = load_channels()
 
     def get_all_mapped_urls(self):
-        """보내주신 로직과 동일하게 전체 리스트를 가져와 키워드 매핑"""
-        params = {
-            "apiKey": self.api_key,
-            "type": "ex", 
-            "cctvType": "1",
-            "minX": "126.0", "maxX": "130.0",
-            "minY": "34.0", "maxY": "38.0",
-            "getType": "json"
-        }
-
-        mapped_results = {}
+        """전체 목록 요청 1번 + 채널별 인덱스 조회로 {채널: URL} 매핑"""
         try:
-            # verify=False로 SSL 체크 건너뜀 (보내주신 로직 반영)
-            response = requests.get(self.api_url, params=params, verify=False, timeout=10)
-            data = response.json()
-            cctv_list = data.get("response", {}).get("data", [])
-
-            print(f"📡 API로부터 {len(cctv_list)}개의 CCTV 데이터를 수집했습니다.")
-
-            # 각 채널 설정 순회하며 검색
-            for ch_id, config in self.channel_configs.items():
-                target = config["target_name"]
-                for item in cctv_list:
-                    # 이름 필드(cctvname 또는 cctvName) 확인 로직 반영
-                    name = item.get("cctvname") or item.get("cctvName") or ""
-                    if target in name:
-                        url = item.get("cctvurl") or item.get("cctvUrl")
-                        if url:
-                            mapped_results[ch_id] = url
-                            print(f"✅ 채널 {ch_id} 매칭: {name}")
-                            break
-            
+            targets = channel_targets(self.channel_configs)
+            mapped_results = self.catalog.resolve(targets)
+            for ch_id in mapped_results:
+                print(f"✅ 채널 {ch_id} 매칭: {targets[ch_id]}")
             return mapped_results
 
         except Exception as e:
             print(f"❌ API 요청 오류: {e}")
             return None
 
-    def send_to_colab(self, urls: dict):
-        """검색된 URL들을 코랩 FastAPI 서버로 전송"""
-        if not urls:
-            print("⚠️ 전송할 데이터가 없습니다.")
-            return
-
+    def send_to_colab(self, urls: dict, replace: bool = False):
+        """검색된 URL들을 코랩 FastAPI 서버로 전송. 성공하면 서버의 활성 채널 목록, 실패하면 None"""
         try:
-            response = requests.post(self.colab_endpoint, json={"urls": urls}, timeout=10)
+            # 카탈로그와 같은 연결 풀 세션 재사용
+            response = self.catalog.session.post(self.colab_endpoint, json={"urls": urls, "replace": replace},
+                                                 timeout=10)
             if response.status_code == 200:
-                print(f"🚀 [{time.strftime('%H:%M:%S')}] 코랩 전송 성공!")
-            else:
-                print(f"⚠️ 전송 실패 ({response.status_code}): {response.text}")
+                body = response.json()
+                if urls:
+                    print(f"🚀 [{time.strftime('%H:%M:%S')}] 코랩 전송 성공! (채널 {sorted(urls)})")
+                    if body.get("missing_masks"):
+                        print(f"❌ 서버에 ROI 마스크가 없는 채널: {body['missing_masks']} (channels.json의 camera 확인)")
+                return {int(cid) for cid in body.get("active_channels", [])}
+            print(f"⚠️ 전송 실패 ({response.status_code}): {response.text}")
         except Exception as e:
             print(f"❌ 코랩 연결 실패: {e}")
+        return None
+
+    def refresh(self, full: bool = False):
+        """
+        만료가 임박한(REFRESH_MARGIN 이내) 채널이 있을 때만 목록을 새로 받아, 주소가 바뀐 채널만 전송.
+        full=True면 전체 채널을 replace로 전송 (시작 시 / 서버 재시작 감지 시)
+        """
+        now = time.time()
+        due = [ch_id for ch_id in self.channel_configs if full or self._next_due(ch_id) <= now]
+        if not due:
+            # 갱신할 채널이 없으면 빈 요청으로 서버 상태만 확인 (서버가 재시작되어 채널이 비었으면 전체 재전송)
+            active = self.send_to_colab({})
+            if active is not None and not set(self.sent_urls) <= active:
+                print("⚠️ 서버에 없는 채널이 있어 전체 주소를 다시 보냅니다.")
+                self.refresh(full=True)
+            return
+
+        try:
+            self.catalog.refresh()  # 목록 캐시 TTL과 무관하게 새 서명 주소를 받음
+        except Exception as e:
+            print(f"❌ API 요청 오류: {e}")
+            return
+        current_urls = self.get_all_mapped_urls()
+        if current_urls is None:
+            return
+        self._record_unresolved([ch_id for ch_id in due if ch_id not in current_urls])
+        if not current_urls:
+            return
+        if full:
+            changed = current_urls
+        else:
+            changed = {ch_id: url for ch_id, url in current_urls.items() if self.sent_urls.get(ch_id) != url}
+            if not changed:
+                print("ℹ️ 새 주소가 아직 발급되지 않았습니다.")
+                return
+        if self.send_to_colab(changed, replace=full) is None:
+            return
+        for ch_id, url in changed.items():
+            self.sent_urls[ch_id] = url
+            self.failures.pop(ch_id, None)
+            self.retry_at.pop(ch_id, None)
+            self.expires_at[ch_id] = url_expiry(url) or time.time() + UNSIGNED_TTL
+
+    def _next_due(self, ch_id):
+        """채널을 다시 받아야 하는 시각: 보낸 적 없으면 재시도 시각(백오프), 있으면 만료 - REFRESH_MARGIN"""
+        if ch_id not in self.sent_urls:
+            return self.retry_at.get(ch_id, 0)
+        return self.expires_at.get(ch_id, 0) - REFRESH_MARGIN
+
+    def _record_unresolved(self, missing):
+        """목록에서 찾지 못한 채널은 실패 횟수에 따라 재시도 간격을 MIN_INTERVAL부터 2배씩 늘림 (MAX_BACKOFF 상한)"""
+        now = time.time()
+        for ch_id in missing:
+            if ch_id in self.sent_urls:
+                continue  # 이전 주소가 아직 있으면 만료 시각 기준으로 계속 재시도
+            count = self.failures.get(ch_id, 0) + 1
+            self.failures[ch_id] = count
+            delay = min(MAX_BACKOFF, MIN_INTERVAL * 2 ** (count - 1))
+            self.retry_at[ch_id] = now + delay
+            print(f"⚠️ 채널 {ch_id} '{self.channel_configs[ch_id]['cctv']}'을(를) 목록에서 찾지 못했습니다. "
+                  f"{delay / 60:.1f}분 뒤 재시도 ({count}회 연속)")
+
+    def seconds_until_refresh(self):
+        """가장 먼저 갱신할 채널(만료 임박 / 백오프가 끝난 미해결 채널)까지 남은 시간 (MIN_INTERVAL ~ CHECK_INTERVAL)"""
+        now = time.time()
+        due = [self._next_due(ch_id) - now for ch_id in self.channel_configs]
+        return min(CHECK_INTERVAL, max(MIN_INTERVAL, min(due)))
 
 # ==========================================
 # 실행부
@@ -87,15 +136,11 @@ if __name__ == "__main__":
     service = TrafficAnalysisService(MY_API_KEY, MY_COLAB_URL)
 
     print("🚀 CCTV 주소 검색 및 전송 시작...")
-    
+    service.refresh(full=True)
+
     while True:
-        # 주소 매핑 실행
-        current_urls = service.get_all_mapped_urls()
-        
-        if current_urls:
-            # 코랩으로 전송
-            service.send_to_colab(current_urls)
-        
-        # 주소 만료 대비 1시간마다 반복
-        print(f"\n😴 다음 갱신까지 1시간 대기합니다.")
-        time.sleep(3600)
\ No newline at end of file
+        # 채널별 주소 만료 시각에 맞춰 만료 직전에만 갱신 (바뀐 채널만 전송 → 서버는 끊김 없이 교체)
+        delay = service.seconds_until_refresh()
+        print(f"\n😴 다음 확인까지 {delay / 60:.1f}분 대기합니다.")
+        time.sleep(delay)
+        service.refresh()
\ No newline at end of file
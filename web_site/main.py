@@ -1,130 +1,258 @@
 import os
 import cv2
+import time
 import asyncio
 import numpy as np
 import torch
-import base64
 import uvicorn
 import nest_asyncio
-from fastapi import FastAPI, Request
-from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from fastapi import FastAPI, Request, Query
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse, Response, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from datetime import datetime
-from ultralytics import YOLO
+from app.services.capture_service import CaptureService
+from app.services.inference_engine import create_engine
+from app.services.occupancy import OccupancyKernel
+from app.services.frame_broadcaster import FrameBroadcaster
+from app.services.overlay_renderer import OverlayRenderer
+from app.services.history_store import OccupancyHistoryStore, parse_time, parse_step
+from app.services.result_sinks import ResultSinkWriter, create_sinks
+from app.services.traffic_feed import TrafficFeed
+from app.services.change_gate import FrameChangeGate
+from app.services.roi_crop import RoiCropper
+from app.services.metrics import PipelineMetrics
+from app.services.mask_registry import MaskRegistry
+from app.services.channel_config import load_channels, channel_cameras
+from app.services.congestion import CongestionTracker, LABELS
+from app.services.tracker import VehicleTracker
 
 # =========================
 # 1) 초기 설정 & 경로
 # =========================
 BASE_PATH = os.getcwd() 
 YOLO_PT_PATH = "/content/drive/MyDrive/Colab_Notebooks/Segmentation_pro/model_save/best_v8m.pt"
-MASK_BASE_PATH = "/content/drive/MyDrive/Colab_Notebooks/Segmentation_pro/road_mask"
+MASK_BASE_PATH = os.environ.get("MASK_BASE_PATH", "/content/drive/MyDrive/Colab_Notebooks/Segmentation_pro/road_mask")
+# ROI 마스크를 미리 컴파일해 둘 해상도 (비트 압축 mmap 캐시) / 원본 변경 확인 주기
+MASK_RESOLUTION = tuple(map(int, os.environ.get("MASK_RESOLUTION", "1280x720").split("x")))
+MASK_RELOAD_SEC = float(os.environ.get("MASK_RELOAD_SEC", 10))
+# 원근 보정 점유율의 채널별 소실선 높이 (예: "1:0.05,5:0.42", 0~1 비율). 지정하지 않은 채널은 ROI 경계에서 추정
+PERSPECTIVE_HORIZONS = {int(k): float(v) for k, v in
+                        (item.split(":") for item in os.environ.get("PERSPECTIVE_HORIZONS", "").split(",") if item)}
 # HTML 파일이 있는 절대 경로 (사용자 환경에 맞춰 고정)
 FRONT_ABS_PATH = "/content/drive/MyDrive/Colab_Notebooks/Segmentation_pro/web_site/front"
 
-DEVICE = "cuda:0" if torch.cuda.is_available() else "cpu"
-USE_HALF = torch.cuda.is_available()
+IMG_SIZE = int(os.environ.get("IMG_SIZE", 320))
+# 1이면 도로 영역(up ∪ low ROI box)만 잘라 추론 → 같은 해상도를 도로에만 사용하므로 IMG_SIZE를 더 낮출 수 있음
+USE_ROI_CROP = os.environ.get("USE_ROI_CROP", "1") == "1"
+# 캡처 디코더: opencv | ffmpeg (FFmpeg 파이프 + 디코더 안 스케일, 키프레임만 / k번째 프레임만 디코딩 가능)
+CAPTURE_BACKEND = os.environ.get("CAPTURE_BACKEND", "opencv")
+DECODE_EVERY = int(os.environ.get("DECODE_EVERY", 1))              # k번째 프레임만 사용
+KEYFRAMES_ONLY = os.environ.get("KEYFRAMES_ONLY", "0") == "1"      # 키프레임만 디코딩 (HLS는 보통 1~2초 간격)
+# 디코딩 해상도 (WxH, 예: 960x540). 지정하지 않으면 원본 해상도
+CAPTURE_SIZE = tuple(map(int, os.environ["CAPTURE_SIZE"].split("x"))) if os.environ.get("CAPTURE_SIZE") else None
+CHANGE_THRESHOLD = float(os.environ.get("CHANGE_THRESHOLD", 0.002))  # ROI 안에서 바뀐 픽셀 비율 (0이면 게이트 끔)
+MAX_STALENESS_SEC = float(os.environ.get("MAX_STALENESS_SEC", 5.0))  # 장면이 그대로여도 강제 재추론 주기
+# k번째 프레임만 분할 추론, 사이 프레임은 차량 추적 마스크를 예측 위치로 옮겨 점유율 계산 (1이면 매 프레임 추론)
+SEGMENT_EVERY = int(os.environ.get("SEGMENT_EVERY", 1))
+# 혼잡도 구간 (Moderate / Heavy 시작 점유율). 이 서버의 기존 기본값 0.3 / 0.6 유지 (main2.py는 0.25 / 0.5)
+CONGESTION_THRESHOLDS = tuple(float(v) for v in os.environ.get("CONGESTION_THRESHOLDS", "0.3,0.6").split(","))
 
 app = FastAPI()
 nest_asyncio.apply()
 
 # 전역 상태
 cached_urls = {}       # {int: str} 형식으로 저장
-latest_results = {}    # 분석 결과 저장
+latest_results = {}    # 분석 결과 저장 (수치 데이터만)
+# 단계별 지연 히스토그램 + 채널별 카운터 (쓰레드별 shard에 잠금 없이 기록, /metrics로 노출)
+pipeline_metrics = PipelineMetrics()
+# 채널별 디코더 쓰레드 (재연결 백오프, 동시 열기 제한, URL 교체 시 이전 스트림 해제)
+capture_service = CaptureService(resize_to=CAPTURE_SIZE, metrics=pipeline_metrics, backend=CAPTURE_BACKEND,
+                                 decode_every=DECODE_EVERY, keyframes_only=KEYFRAMES_ONLY)
+analysis_tasks = {}    # {cid: 분석 태스크} (채널당 하나만 실행)
+mask_watch_task = None  # ROI 마스크 변경 감시 태스크
+frame_broadcaster = FrameBroadcaster()  # 채널별 최신 JPEG (raw bytes) 팬아웃
+# 수치 결과는 갱신 시 JSON bytes로 한 번만 만들어 두고 채널/전체 조회 및 SSE push에 재사용
+traffic_feed = TrafficFeed()
+# 채널별 점유율 이력 (메모리 상한 고정 링 버퍼 + 1s/1m/15m 롤업). HISTORY_PATH 지정 시 파일에도 누적
+# (HISTORY_COMPACT_SEC마다 / 종료 시 링 버퍼 스냅숏으로 정리해 파일 크기와 시작 시 복원 시간을 고정)
+history_store = OccupancyHistoryStore(persist_path=os.environ.get("HISTORY_PATH"),
+                                      compact_sec=float(os.environ.get("HISTORY_COMPACT_SEC", 3600)))
+# 결과 영구 기록 (RESULT_SINKS="sqlite:results.db,csv:results_csv,parquet:results_parquet").
+# 분석 루프는 제한된 큐에 넣기만 하고 기록 쓰레드가 묶어서 씀 (큐가 차면 RESULT_SINK_DROP 정책으로 버림)
+result_sinks = create_sinks(os.environ.get("RESULT_SINKS", ""))
+result_writer = ResultSinkWriter(result_sinks, max_queue=int(os.environ.get("RESULT_SINK_QUEUE", 20000)),
+                                 drop_policy=os.environ.get("RESULT_SINK_DROP", "oldest")) if result_sinks else None
 
 # =========================
 # 2) 모델 & 마스크 로드
 # =========================
-print(f"⏳ 모델 로딩 중 ({DEVICE})...")
-model = YOLO(YOLO_PT_PATH)
-model.to(DEVICE)
+print("⏳ 모델 로딩 중...")
+# GPU면 PyTorch, CPU 전용 노드면 ONNX Runtime / OpenVINO로 자동 선택 (INFERENCE_BACKEND로 강제 가능)
+engine = create_engine(YOLO_PT_PATH, imgsz=IMG_SIZE)
 print("✅ 모델 로드 완료")
 
+# 카메라 이름(상행선/하행선 폴더) + 기존 {채널}_{방향}.png 마스크 → 해상도별 비트 압축 캐시 (다음 시작부터 mmap 로드)
+# 채널 → 카메라 이름은 url_sender와 같은 channels.json에서 읽음 (CHANNELS_CONFIG로 경로 변경)
+mask_registry = MaskRegistry(MASK_BASE_PATH, channels=channel_cameras(load_channels()), resolution=MASK_RESOLUTION)
+
 def load_all_masks():
-    loaded = {}
     if not os.path.exists(MASK_BASE_PATH):
         print(f"⚠️ 마스크 경로 없음: {MASK_BASE_PATH}")
-        return loaded
-    for i in range(1, 7):
-        for direct in ['up', 'low']:
-            m_path = f"{MASK_BASE_PATH}/{i}_{direct}.png"
-            if os.path.exists(m_path):
-                mask_img = cv2.imread(m_path, cv2.IMREAD_GRAYSCALE)
-                if mask_img is not None:
-                    loaded[f"{i}_{direct}"] = mask_img
+        return {}
+    mask_registry.load()
+    loaded = mask_registry.masks()
     print(f"✅ ROI 마스크 {len(loaded)}개 로드 완료")
     return loaded
 
 preloaded_masks = load_all_masks()
+# ROI 마스크는 커널 안에서 (채널, 해상도)별로 한 번만 리사이즈되어 캐시됨
+occupancy_kernel = OccupancyKernel(horizons=PERSPECTIVE_HORIZONS)
+occupancy_kernel.load(preloaded_masks)
+# 점유율 계산에서 만든 합집합 마스크를 재사용해 480x270에서만 그리는 오버레이 (res.plot 대체)
+overlay_renderer = OverlayRenderer(occupancy_kernel)
+# 채널/방향별 EMA + 히스테리시스 + 최소 유지 시간 혼잡도 상태 (상태 기계는 main2.py와 공용, 바뀔 때만 이벤트)
+congestion = CongestionTracker(thresholds=CONGESTION_THRESHOLDS)
+# 장면 변화가 없으면 추론을 건너뛰고 이전 결과를 유지하는 게이트
+change_gate = FrameChangeGate(occupancy_kernel, threshold=CHANGE_THRESHOLD, max_staleness=MAX_STALENESS_SEC)
+# 도로 box crop + letterbox 전처리 (점유율은 같은 변환을 적용한 ROI로 캔버스 좌표에서 계산)
+roi_cropper = RoiCropper(occupancy_kernel, IMG_SIZE) if USE_ROI_CROP else None
+
+def apply_mask_changes(changed):
+    """바뀐 ROI 마스크를 커널에 반영하고 게이트 / 오버레이 / crop 캐시 무효화"""
+    for cid, direct in changed:
+        mask_img = mask_registry.get(cid, direct)
+        if mask_img is None:
+            occupancy_kernel.remove_roi(cid, direct)
+        else:
+            occupancy_kernel.set_roi(cid, direct, mask_img)
+        change_gate.invalidate(cid)
+        overlay_renderer.invalidate(cid)
+        if roi_cropper is not None:
+            roi_cropper.invalidate(cid)
+
+async def watch_masks():
+    """마스크 원본이 추가/수정/삭제되면 재시작 없이 다시 로드 (stat만 확인하므로 가벼움)"""
+    while True:
+        await asyncio.sleep(MASK_RELOAD_SEC)
+        try:
+            changed = await asyncio.to_thread(mask_registry.reload_if_changed)
+        except Exception as e:
+            print(f"⚠️ 마스크 다시 읽기 실패: {e}")
+            continue
+        if changed:
+            apply_mask_changes(changed)
+            print(f"🔄 ROI 마스크 갱신: {sorted(changed)}")
 
 # =========================
 # 3) 핵심 분석 로직
 # =========================
-async def analyze_stream(channel_id: int, url: str):
-    """개별 채널 분석 루프"""
-    cap = cv2.VideoCapture(url)
-    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
-    
-    print(f"🟢 [채널 {channel_id}] 분석 시작 (URL: {url[:30]}...)")
+async def analyze_stream(channel_id: int):
+    """개별 채널 분석 루프 (프레임은 디코더 쓰레드가 채워 둔 최신 프레임만 사용)"""
+    print(f"🟢 [채널 {channel_id}] 분석 시작")
+    # 차량 추적 (방향별 분당 통과 대수, SEGMENT_EVERY > 1이면 키프레임 사이 마스크 전파)
+    tracker = VehicleTracker()
     
     try:
         while channel_id in cached_urls:
-            # 1. 프레임 스킵 (최신 프레임 확보)
-            for _ in range(10): cap.grab()
-            success, frame = cap.retrieve()
-            if not success: 
-                print(f"⚠️ [채널 {channel_id}] 프레임 읽기 실패. 재시도 중...")
-                await asyncio.sleep(1)
+            # 1. 최신 프레임 확보 (연결/재연결/프레임 스킵은 캡처 서비스가 담당, 밀린 프레임은 frames_dropped로 집계)
+            item = capture_service.read_new(channel_id)
+            if item is None:
+                await asyncio.sleep(0.02)
                 continue
+            frame = item[0]
 
-            H, W = frame.shape[:2]
+            # 장면 변화가 없으면 이전 분할 결과를 그대로 두고 추론 생략
+            with pipeline_metrics.stage("gate"):
+                changed = change_gate.check(channel_id, frame)
+            if not changed:
+                pipeline_metrics.inc("frames_skipped", channel_id)
+                await asyncio.sleep(0.05)
+                continue
 
-            # 2. YOLO 추론 (imgsz=320 최적화)
-            res = model.predict(source=frame, conf=0.25, iou=0.6, imgsz=320,
-                               device=DEVICE, half=USE_HALF, verbose=False)[0]
+            now = time.monotonic()
+            # crop 모드면 점유율/추적 모두 캔버스 좌표 커널 기준
+            kernel = roi_cropper.kernel if roi_cropper is not None else occupancy_kernel
+            if not tracker.needs_segmentation(SEGMENT_EVERY, now):
+                # 2'. 키프레임 사이: 추론 없이 트랙 마스크를 등속 예측 위치로 옮긴 합집합으로 계산
+                with pipeline_metrics.stage("propagate"):
+                    union = tracker.propagate(now)
+                    occupancy = kernel.occupancy_from_union(channel_id, union)
+                    weighted = kernel.weighted(channel_id, union)
+                vehicle_count = tracker.active_count()
+                pipeline_metrics.inc("frames_propagated", channel_id)
+            else:
+                # 2. YOLO 추론 (imgsz=320 최적화, USE_ROI_CROP이면 도로 영역만 잘라서 입력)
+                model_input = frame
+                if roi_cropper is not None:
+                    with pipeline_metrics.stage("crop"):
+                        model_input = roi_cropper.crop(channel_id, frame)
+                with pipeline_metrics.stage("predict"):
+                    res = engine.predict(model_input, imgsz=IMG_SIZE, conf=0.25, iou=0.6)[0]
 
-            # 3. 세그멘테이션 분석
-            vehicle_union = np.zeros((H, W), dtype=bool)
-            if res.masks is not None:
-                masks = res.masks.data.detach().cpu().numpy()
-                for m in masks:
-                    m_resized = cv2.resize(m, (W, H), interpolation=cv2.INTER_NEAREST)
-                    vehicle_union |= (m_resized > 0.5)
+                # 3. 세그멘테이션 분석 (프레임 크기로 키우지 않고 마스크 해상도에서 바로 계산)
+                with pipeline_metrics.stage("occupancy"):
+                    masks = res.masks.data if res.masks is not None else None
+                    occupancy, union = kernel.analyze(channel_id, masks)
+                    # 원근 보정: 멀리 있는 차량 픽셀일수록 큰 가중치 (미리 만든 가중치 맵과 내적 한 번)
+                    weighted = kernel.weighted(channel_id, union)
+                with pipeline_metrics.stage("track"):
+                    boxes, scores, instances = tracker.detections(res)
+                    rois = {} if union is None else \
+                        {d: kernel.roi(channel_id, d, union.shape)[0] for d in kernel.directions(channel_id)}
+                    tracker.update(boxes, scores, instances, rois, now)
+                vehicle_count = len(res.boxes) if res.boxes is not None else 0
+                pipeline_metrics.inc("frames_analyzed", channel_id)
+            flow = tracker.flow(now)
 
             final_data = {}
-            for direct in ['up', 'low']:
-                key = f"{channel_id}_{direct}"
-                mask_src = preloaded_masks.get(key)
-                if mask_src is not None:
-                    roi_mask = cv2.resize(mask_src, (W, H), interpolation=cv2.INTER_NEAREST)
-                    roi_bool = (roi_mask > 127)
-                    occ_raw = np.sum(vehicle_union & roi_bool) / (np.sum(roi_bool) + 1e-8)
-                    
-                    status = "Smooth"
-                    if occ_raw > 0.6: status = "Heavy"
-                    elif occ_raw > 0.3: status = "Moderate"
-                    final_data[direct] = {"occupancy_rate": round(occ_raw * 100, 2), "status": status}
-
-            # 4. 시각화 및 이미지 압축 최적화
-            annotated_frame = res.plot(boxes=False, masks=True)
-            display_frame = cv2.resize(annotated_frame, (480, 270)) 
-            _, buffer = cv2.imencode('.jpg', display_frame, [int(cv2.IMWRITE_JPEG_QUALITY), 45])
-            img_str = base64.b64encode(buffer).decode('utf-8')
+            for direct, occ_raw in occupancy.items():
+                occ_weighted = weighted.get(direct, occ_raw)
+                # 상태는 원근 보정 점유율을 시간 평활한 값 기준 (프레임 한 장의 튐으로 바뀌지 않음)
+                smoothed, level = congestion.update(channel_id, direct, occ_weighted)
+                final_data[direct] = {"occupancy_rate": round(occ_raw * 100, 2),
+                                      "occupancy_rate_weighted": round(occ_weighted * 100, 2),
+                                      "occupancy_rate_smoothed": round(smoothed * 100, 2),
+                                      "vehicles_per_min": round(flow.get(direct, 0.0), 1),
+                                      "status": LABELS["en"][level]}
+
+            # 4. 시각화 및 이미지 압축 최적화 (영상을 보고 있는 시청자가 있을 때만)
+            if frame_broadcaster.viewer_count(channel_id) > 0:
+                try:
+                    with pipeline_metrics.stage("render"):
+                        if roi_cropper is not None:  # 캔버스 좌표 합집합을 원본 프레임 좌표로 되돌림
+                            union = roi_cropper.uncrop(channel_id, union, overlay_renderer.size[::-1])
+                        display_frame = overlay_renderer.render(channel_id, frame, union)
+                    with pipeline_metrics.stage("encode"):
+                        ok, buffer = cv2.imencode('.jpg', display_frame, [int(cv2.IMWRITE_JPEG_QUALITY), 45])
+                    if ok:
+                        frame_broadcaster.publish(channel_id, buffer.tobytes())
+                    else:
+                        pipeline_metrics.inc("encode_failures", channel_id)
+                except Exception as e:
+                    pipeline_metrics.inc("encode_failures", channel_id)
+                    print(f"⚠️ [채널 {channel_id}] 오버레이/인코딩 실패: {e}")
 
             # 5. 결과 저장
             latest_results[channel_id] = {
                 "channel_id": channel_id,
-                "vehicle_total_count": len(res.boxes) if res.boxes is not None else 0,
+                "vehicle_total_count": vehicle_count,
                 "results": final_data,
-                "encoded_image": img_str,
                 "timestamp": datetime.now().isoformat()
             }
+            traffic_feed.publish(channel_id, latest_results[channel_id])
+            history_store.add_result(channel_id, latest_results[channel_id])
+            if result_writer is not None:
+                result_writer.submit(channel_id, latest_results[channel_id])
             
             await asyncio.sleep(0.05) 
             
     finally:
-        cap.release()
+        change_gate.forget(channel_id)
+        congestion.forget(channel_id)
+        traffic_feed.forget(channel_id)
+        analysis_tasks.pop(channel_id, None)
         print(f"🔴 [채널 {channel_id}] 분석 종료")
 
 # =========================
@@ -133,46 +261,108 @@ async def analyze_stream(channel_id: int, url: str):
 
 class URLUpdate(BaseModel):
     urls: Dict[str, str]
+    replace: bool = False  # True면 보낸 채널만 남기고 나머지는 종료 (기본은 바뀐 채널만 보내는 병합)
 
 @app.post("/update_urls")
 async def update_urls(data: URLUpdate):
     """로컬 PC에서 보내는 CCTV 주소들을 업데이트하고 분석 태스크 시작"""
     global cached_urls
-    incoming_urls = data.urls
-    for cid_raw, url in incoming_urls.items():
+    incoming = {}
+    for cid_raw, url in data.urls.items():
         try:
-            cid = int(cid_raw)
-            if cid not in cached_urls or cached_urls[cid] != url:
-                cached_urls[cid] = url
-                asyncio.create_task(analyze_stream(cid, url))
+            incoming[int(cid_raw)] = url
         except ValueError:
             continue
+    if data.replace:
+        for cid in list(cached_urls):
+            if cid not in incoming:
+                del cached_urls[cid]  # 분석 태스크는 루프 조건에서 빠져나와 스스로 종료
+    for cid, url in incoming.items():
+        if cached_urls.get(cid) != url:
+            cached_urls[cid] = url
+            change_gate.forget(cid)
+    # URL이 바뀐 채널은 새 스트림의 첫 프레임이 들어올 때 교체 (분석 태스크는 채널당 하나를 계속 사용)
+    capture_service.sync(cached_urls)
+    for cid in cached_urls:
+        if cid not in analysis_tasks:
+            analysis_tasks[cid] = asyncio.create_task(analyze_stream(cid))
     print(f"📡 주소 업데이트 완료: 현재 {len(cached_urls)}개 채널 분석 중")
-    return {"status": "success", "active_channels": list(cached_urls.keys())}
+    # ROI 마스크가 없는 채널은 다른 카메라 마스크로 대신하지 않고 응답/로그로 알림
+    missing = sorted(cid for cid in cached_urls if not occupancy_kernel.directions(cid))
+    for cid in missing:
+        print(f"❌ [채널 {cid}] ROI 마스크가 없어 점유율/혼잡도를 계산하지 않습니다.")
+    return {"status": "success", "active_channels": list(cached_urls.keys()), "missing_masks": missing}
+
+@app.get("/api/v1/traffic")
+async def get_all_traffic_data():
+    """전체 채널 수치 데이터를 한 번에 반환 ({channel_id: 결과})"""
+    return Response(content=traffic_feed.bulk(), media_type="application/json")
+
+@app.get("/api/v1/traffic/stream")
+async def traffic_stream():
+    """SSE: 접속 시 전체 채널, 이후에는 바뀐 채널만 push (대시보드 폴링 대체)"""
+    return StreamingResponse(traffic_feed.stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.get("/api/v1/traffic/{channel_id}")
 async def get_traffic_data(channel_id: int):
     """JS 대시보드에서 수치 데이터(혼잡도 등)를 가져가는 API"""
-    data = latest_results.get(channel_id)
-    if data is None:
+    payload = traffic_feed.get(channel_id)
+    if payload is None:
         return JSONResponse(content={"error": "no data"}, status_code=503)
-    # 이미지 데이터는 제외하고 수치 데이터만 전송 (네트워크 절약)
-    output = data.copy()
-    if "encoded_image" in output: del output["encoded_image"]
-    return output
+    # 결과 갱신 시 미리 만든 JSON bytes를 그대로 전송 (요청마다 복사/직렬화 없음)
+    return Response(content=payload, media_type="application/json")
+
+@app.get("/api/v1/traffic/{channel_id}/history")
+async def get_traffic_history(channel_id: int, from_: Optional[str] = Query(None, alias="from"),
+                              to: Optional[str] = None, step: Optional[str] = None):
+    """점유율 이력 조회. from/to: epoch 초 또는 ISO 8601 (기본 최근 1시간), step: raw | 1s | 1m | 15m | 초"""
+    try:
+        t1 = parse_time(to, time.time())
+        t0 = parse_time(from_, t1 - 3600)
+        step_sec = parse_step(step)
+    except ValueError:
+        return JSONResponse(content={"error": "invalid from/to/step"}, status_code=400)
+    data = history_store.query(channel_id, t0, t1, step_sec)
+    if data is None:
+        return JSONResponse(content={"error": "no data"}, status_code=404)
+    return data
+
+@app.get("/api/v1/traffic/{channel_id}/records")
+async def get_traffic_records(channel_id: int, from_: Optional[str] = Query(None, alias="from"),
+                              to: Optional[str] = None, limit: int = Query(10000, ge=1, le=100000)):
+    """결과 싱크에 기록된 원본 결과 조회 (방향별 행, 오래된 순). from/to: epoch 초 또는 ISO 8601 (기본 최근 1시간)"""
+    if result_writer is None:
+        return JSONResponse(content={"error": "RESULT_SINKS가 설정되지 않았습니다"}, status_code=404)
+    try:
+        t1 = parse_time(to, time.time())
+        t0 = parse_time(from_, t1 - 3600)
+    except ValueError:
+        return JSONResponse(content={"error": "invalid from/to"}, status_code=400)
+    rows = await asyncio.to_thread(result_writer.query, channel_id, t0, t1, limit)
+    return {"channel_id": channel_id, "from": t0, "to": t1, "rows": rows}
+
+@app.get("/api/v1/congestion/events")
+async def get_congestion_events(since: int = 0, channel_id: Optional[int] = None):
+    """혼잡도 상태 전환 이벤트 (seq > since, 오래된 순). 마지막 seq를 since로 넘겨 이어 읽기"""
+    return {"events": congestion.events(since, channel_id), "states": congestion.snapshot()}
+
+@app.get("/api/v1/stats")
+async def get_engine_stats():
+    """채널별 추론 생략 비율 (프레임 차이 게이트), 스트림 연결 상태, 결과 싱크 큐/버림 현황"""
+    return {"gate": change_gate.stats(), "channels": capture_service.health(),
+            "sinks": result_writer.stats() if result_writer is not None else None}
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus 텍스트 형식: 단계별 지연 히스토그램, 채널별 카운터"""
+    return PlainTextResponse(pipeline_metrics.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/video_feed/{channel_id}")
 async def video_feed(channel_id: int):
-    """HTML <img> 태그에 실시간 영상을 스트리밍"""
-    async def frame_generator():
-        while True:
-            data = latest_results.get(channel_id)
-            if data and "encoded_image" in data:
-                img_data = base64.b64decode(data["encoded_image"])
-                yield (b'--frame\r\n'
-                       b'Content-Type: image/jpeg\r\n\r\n' + img_data + b'\r\n')
-            await asyncio.sleep(0.1)
-    return StreamingResponse(frame_generator(), media_type="multipart/x-mixed-replace; boundary=frame")
+    """HTML <img> 태그에 실시간 영상을 스트리밍 (새 프레임이 나올 때만 전송, 폴링 없음)"""
+    return StreamingResponse(frame_broadcaster.subscribe(channel_id),
+                             media_type="multipart/x-mixed-replace; boundary=frame")
 
 @app.get("/")
 async def read_index():
@@ -189,8 +379,20 @@ if os.path.exists(FRONT_ABS_PATH):
 # =========================
 # 5) 서버 시작 및 자동 실행
 # =========================
+@app.on_event("shutdown")
+async def shutdown_event():
+    capture_service.stop_all()
+    history_store.close()
+    if result_writer is not None:
+        result_writer.close()
+
 @app.on_event("startup")
 async def startup_event():
+    global mask_watch_task
+    frame_broadcaster.bind(asyncio.get_running_loop())
+    traffic_feed.bind(asyncio.get_running_loop())
+    if MASK_RELOAD_SEC > 0:
+        mask_watch_task = asyncio.create_task(watch_masks())
     print(f"🚀 [Startup] 시스템 준비 완료.")
 
 if __name__ == "__main__":
@@ -1,46 +1,129 @@
 import os
 import cv2
+import time
 import asyncio
 import numpy as np
 import torch
-import base64
 import uvicorn
 import nest_asyncio
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Request
-from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from fastapi import FastAPI, Request, Query
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse, Response, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from datetime import datetime
-from ultralytics import YOLO
 from concurrent.futures import ThreadPoolExecutor
+from app.services.capture_service import CaptureService
+from app.services.batch_scheduler import DynamicBatcher
+from app.services.inference_engine import create_engine
+from app.services.occupancy import OccupancyKernel
+from app.services.inference_pool import InferenceWorkerPool
+from app.services.frame_broadcaster import FrameBroadcaster
+from app.services.overlay_renderer import OverlayRenderer
+from app.services.history_store import OccupancyHistoryStore, parse_time, parse_step
+from app.services.result_sinks import ResultSinkWriter, create_sinks
+from app.services.traffic_feed import TrafficFeed
+from app.services.change_gate import FrameChangeGate
+from app.services.roi_crop import RoiCropper
+from app.services.metrics import PipelineMetrics
+from app.services.frame_batch import unpack_frames
+from app.services.mask_registry import MaskRegistry
+from app.services.channel_config import load_channels, channel_cameras
+from app.services.congestion import CongestionTracker, LABELS
+from app.services.tracker import VehicleTracker
 
 # =========================
 # 1) 설정 및 초기화
 # =========================
 YOLO_PT_PATH = "/content/drive/MyDrive/Colab_Notebooks/Segmentation_pro/model_save/best_v8m.pt"
-MASK_BASE_PATH = "/content/drive/MyDrive/Colab_Notebooks/Segmentation_pro/road_mask"
+MASK_BASE_PATH = os.environ.get("MASK_BASE_PATH", "/content/drive/MyDrive/Colab_Notebooks/Segmentation_pro/road_mask")
+# ROI 마스크를 미리 컴파일해 둘 해상도 (비트 압축 mmap 캐시) / 원본 변경 확인 주기
+MASK_RESOLUTION = tuple(map(int, os.environ.get("MASK_RESOLUTION", "1280x720").split("x")))
+MASK_RELOAD_SEC = float(os.environ.get("MASK_RELOAD_SEC", 10))
+# 원근 보정 점유율의 채널별 소실선 높이 (예: "1:0.05,5:0.42", 0~1 비율). 지정하지 않은 채널은 ROI 경계에서 추정
+PERSPECTIVE_HORIZONS = {int(k): float(v) for k, v in
+                        (item.split(":") for item in os.environ.get("PERSPECTIVE_HORIZONS", "").split(",") if item)}
 FRONT_ABS_PATH = "/content/drive/MyDrive/Colab_Notebooks/Segmentation_pro/web_site/front"
 
-DEVICE = "cuda:0"
-IMG_SIZE = 640       # A100의 경우 640이 속도와 정확도의 최적 지점입니다.
+IMG_SIZE = int(os.environ.get("IMG_SIZE", 640))  # A100의 경우 640이 속도와 정확도의 최적 지점입니다.
 JPEG_QUALITY = 65    # CPU 부하를 줄이기 위해 품질을 65로 최적화
-USE_HALF = True      # A100(FP16 가속) 사용 필수
+MAX_BATCH_SIZE = int(os.environ.get("MAX_BATCH_SIZE", 8))   # 한 번에 추론할 최대 채널 수
+MAX_WAIT_MS = float(os.environ.get("MAX_WAIT_MS", 30))      # 배치를 채우기 위해 기다릴 최대 시간
+# 0이면 단일 프로세스 추론, 1 이상이면 공유 메모리 + 추론 워커 프로세스 풀 사용 (CPU 다코어 서버용)
+INFERENCE_WORKERS = int(os.environ.get("INFERENCE_WORKERS", 0))
+# 죽은 추론 워커를 다시 띄우는 최대 횟수. 넘으면 이 프로세스에서 직접 추론으로 전환
+WORKER_MAX_RESTARTS = int(os.environ.get("WORKER_MAX_RESTARTS", 3))
+CHANGE_THRESHOLD = float(os.environ.get("CHANGE_THRESHOLD", 0.002))  # ROI 안에서 바뀐 픽셀 비율 (0이면 게이트 끔)
+MAX_STALENESS_SEC = float(os.environ.get("MAX_STALENESS_SEC", 5.0))  # 장면이 그대로여도 강제 재추론 주기
+# k번째 프레임만 분할 추론, 사이 프레임은 차량 추적 마스크를 예측 위치로 옮겨 점유율 계산 (1이면 매 프레임 추론)
+# 추적은 박스가 필요하므로 워커 풀 모드(INFERENCE_WORKERS > 0)에서는 사용하지 않음
+SEGMENT_EVERY = int(os.environ.get("SEGMENT_EVERY", 1))
+# 1이면 도로 영역(up ∪ low ROI box)만 잘라 letterbox 후 추론 (프레임 전체를 640x640으로 찌그러뜨리지 않음)
+# 워커 풀 모드는 공유 메모리 슬롯에 추론 입력만 싣기 때문에 지원하지 않음
+USE_ROI_CROP = os.environ.get("USE_ROI_CROP", "1") == "1" and INFERENCE_WORKERS == 0
+# 캡처 디코더: opencv | ffmpeg (FFmpeg 파이프 + 디코더 안 스케일, 키프레임만 / k번째 프레임만 디코딩 가능)
+CAPTURE_BACKEND = os.environ.get("CAPTURE_BACKEND", "opencv")
+DECODE_EVERY = int(os.environ.get("DECODE_EVERY", 1))              # k번째 프레임만 사용
+KEYFRAMES_ONLY = os.environ.get("KEYFRAMES_ONLY", "0") == "1"      # 키프레임만 디코딩 (HLS는 보통 1~2초 간격)
+# 디코딩 해상도 (WxH, 예: 960x540). 지정하지 않으면 원본 해상도
+CAPTURE_SIZE = tuple(map(int, os.environ["CAPTURE_SIZE"].split("x"))) if os.environ.get("CAPTURE_SIZE") else None
 
 # 전역 상태 관리
 cached_urls = {}
 latest_results = {}
-preloaded_masks_gpu = {}
+# 단계별 지연 히스토그램 + 채널별 카운터 (쓰레드별 shard에 잠금 없이 기록, /metrics로 노출)
+pipeline_metrics = PipelineMetrics()
+frame_broadcaster = FrameBroadcaster()  # 채널별 최신 JPEG (raw bytes + 버전) 팬아웃
+# 수치 결과는 갱신 시 JSON bytes로 한 번만 만들어 두고 채널/전체 조회 및 SSE push에 재사용
+traffic_feed = TrafficFeed()
+# 채널별 점유율 이력 (메모리 상한 고정 링 버퍼 + 1s/1m/15m 롤업). HISTORY_PATH 지정 시 파일에도 누적
+# (HISTORY_COMPACT_SEC마다 / 종료 시 링 버퍼 스냅숏으로 정리해 파일 크기와 시작 시 복원 시간을 고정)
+history_store = OccupancyHistoryStore(persist_path=os.environ.get("HISTORY_PATH"),
+                                      compact_sec=float(os.environ.get("HISTORY_COMPACT_SEC", 3600)))
+# 결과 영구 기록 (RESULT_SINKS="sqlite:results.db,csv:results_csv,parquet:results_parquet").
+# 분석 루프는 제한된 큐에 넣기만 하고 기록 쓰레드가 묶어서 씀 (큐가 차면 RESULT_SINK_DROP 정책으로 버림)
+result_sinks = create_sinks(os.environ.get("RESULT_SINKS", ""))
+result_writer = ResultSinkWriter(result_sinks, max_queue=int(os.environ.get("RESULT_SINK_QUEUE", 20000)),
+                                 drop_policy=os.environ.get("RESULT_SINK_DROP", "oldest")) if result_sinks else None
+# 카메라 이름(상행선/하행선 폴더) + 기존 {채널}_{방향}.png 마스크 → 해상도별 비트 압축 캐시 (다음 시작부터 mmap 로드)
+# 채널 → 카메라 이름은 url_sender와 같은 channels.json에서 읽음 (CHANNELS_CONFIG로 경로 변경)
+mask_registry = MaskRegistry(MASK_BASE_PATH, channels=channel_cameras(load_channels()), resolution=MASK_RESOLUTION)
+# ROI 마스크는 (채널, 해상도)별로 캐시되고, 합집합/교집합 버퍼는 재사용됨
+occupancy_kernel = OccupancyKernel(horizons=PERSPECTIVE_HORIZONS)
+# res.plot 대신 합집합 마스크를 재사용해 480x270에서 그리는 경량 오버레이
+overlay_renderer = OverlayRenderer(occupancy_kernel)
+# 채널/방향별 EMA + 히스테리시스 + 최소 유지 시간 혼잡도 상태 (구간은 main.py와 공용, 바뀔 때만 이벤트)
+congestion = CongestionTracker()
+# 채널별 차량 추적 (방향별 분당 통과 대수 + 키프레임 사이 마스크 전파). 이벤트 루프에서만 접근
+vehicle_trackers = {}
+# 장면 변화가 없으면 추론을 건너뛰고 이전 결과를 유지하는 게이트
+change_gate = FrameChangeGate(occupancy_kernel, threshold=CHANGE_THRESHOLD, max_staleness=MAX_STALENESS_SEC)
+# 도로 box crop + letterbox 전처리 (점유율은 같은 변환을 적용한 ROI로 캔버스 좌표에서 계산)
+roi_cropper = RoiCropper(occupancy_kernel, IMG_SIZE) if USE_ROI_CROP else None
 
 # [병렬화] A100의 자원을 활용하기 위해 이미지 인코딩 전용 쓰레드 풀 확장
 thread_executor = ThreadPoolExecutor(max_workers=24)
 
-print(f"🚀 A100 GPU 가속 모드 가동 중 (imgsz: {IMG_SIZE})...")
-model = YOLO(YOLO_PT_PATH)
-model.to(DEVICE)
-if USE_HALF:
-    model.half()  # 모델 가중치를 FP16으로 고정
+# [추론] 모델 호출은 전용 쓰레드 하나에서만 수행 (이벤트 루프와 FastAPI 핸들러를 막지 않도록)
+inference_executor = ThreadPoolExecutor(max_workers=1)
+
+# [캡처] 채널마다 전용 디코더 쓰레드를 두고, 리사이즈까지 쓰레드에서 끝낸 최신 프레임만 보관
+#        (ROI crop 모드에서는 도로 영역 해상도를 잃지 않도록 CAPTURE_SIZE(기본 원본) 프레임을 보관하고 crop 단계에서 줄임)
+capture_service = CaptureService(resize_to=CAPTURE_SIZE if USE_ROI_CROP else (IMG_SIZE, IMG_SIZE),
+                                 metrics=pipeline_metrics, backend=CAPTURE_BACKEND,
+                                 decode_every=DECODE_EVERY, keyframes_only=KEYFRAMES_ONLY)
+# [배치] 최대 배치 크기 / 최대 대기 시간으로 처리량과 신선도 사이를 조절
+batcher = DynamicBatcher(capture_service, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS)
+capture_service.on_frame = batcher.notify
+
+# [워커 풀] INFERENCE_WORKERS > 0일 때 lifespan에서 생성 (각 워커가 자기 모델을 보유)
+worker_pool = None
+engine = None
+if INFERENCE_WORKERS == 0:
+    print(f"🚀 분석 엔진 준비 중 (imgsz: {IMG_SIZE})...")
+    # GPU(A100)면 PyTorch FP16, CPU 전용 노드면 ONNX Runtime / OpenVINO로 자동 선택
+    engine = create_engine(YOLO_PT_PATH, imgsz=IMG_SIZE)
 
 # =========================
 # 2) 수명 주기 관리 (Lifespan)
@@ -48,159 +131,439 @@ if USE_HALF:
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # 포트 충돌 방지를 위해 실행 전 기존 프로세스 종료 권장: !fuser -k 8000/tcp
-    prepare_gpu_masks()
+    global worker_pool
+    frame_broadcaster.bind(asyncio.get_running_loop())
+    traffic_feed.bind(asyncio.get_running_loop())
+    prepare_roi_masks()
+    mask_watch_task = asyncio.create_task(watch_masks()) if MASK_RELOAD_SEC > 0 else None
+    if INFERENCE_WORKERS > 0:
+        print(f"🚀 추론 워커 {INFERENCE_WORKERS}개 시작 (imgsz: {IMG_SIZE})...")
+        roi_masks = {f"{cid}_{direct}": img for (cid, direct), img in occupancy_kernel.roi_sources.items()}
+        worker_pool = InferenceWorkerPool(INFERENCE_WORKERS, YOLO_PT_PATH, IMG_SIZE, roi_masks,
+                                          on_result=on_worker_result, jpeg_quality=JPEG_QUALITY,
+                                          horizons=PERSPECTIVE_HORIZONS, max_restarts=WORKER_MAX_RESTARTS,
+                                          metrics=pipeline_metrics)
     # 분석 엔진을 백그라운드 태스크로 분리
     analysis_task = asyncio.create_task(global_analysis_engine())
     yield
     analysis_task.cancel()
+    if mask_watch_task is not None:
+        mask_watch_task.cancel()
+    capture_service.stop_all()
+    if worker_pool is not None:
+        worker_pool.close()
+    history_store.close()
+    if result_writer is not None:
+        result_writer.close()
+    inference_executor.shutdown(wait=False)
     thread_executor.shutdown(wait=False)
 
 app = FastAPI(lifespan=lifespan)
 nest_asyncio.apply()
 
-def prepare_gpu_masks():
-    """마스크를 FP16 타입으로 GPU에 미리 로드하여 연산 속도 극대화"""
-    global preloaded_masks_gpu
+def prepare_roi_masks():
+    """ROI 마스크를 점유율 커널에 등록 (해상도별 리사이즈는 첫 사용 시 한 번만 수행)"""
     if not os.path.exists(MASK_BASE_PATH): return
-    for i in range(1, 7):
-        for direct in ['up', 'low']:
-            path = f"{MASK_BASE_PATH}/{i}_{direct}.png"
-            if os.path.exists(path):
-                mask_img = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
-                mask_img = cv2.resize(mask_img, (IMG_SIZE, IMG_SIZE), interpolation=cv2.INTER_NEAREST)
-                
-                # [에러 방지] 로드 단계부터 Half(FP16)로 강제 변환
-                mask_tensor = torch.from_numpy(mask_img).to(DEVICE).half() / 255.0
-                preloaded_masks_gpu[f"{i}_{direct}"] = (mask_tensor > 0.5).to(dtype=torch.float16)
-    print(f"✅ {len(preloaded_masks_gpu)}개 ROI 마스크 FP16 준비 완료")
+    mask_registry.load()
+    occupancy_kernel.load(mask_registry.masks())
+    print(f"✅ {len(occupancy_kernel.roi_sources)}개 ROI 마스크 준비 완료")
+
+def apply_mask_changes(changed):
+    """
+    바뀐 ROI 마스크를 커널에 반영하고 게이트 / 오버레이 / crop 캐시 무효화.
+    커널은 이벤트 루프(점유율 / 추적), 추론 쓰레드(crop), 인코딩 쓰레드(오버레이)가 함께 쓰므로
+    커널 / crop / 오버레이 캐시는 각자의 잠금으로 보호되고, 여기서는 이벤트 루프에서 바로 교체합니다.
+    """
+    for cid, direct in changed:
+        mask_img = mask_registry.get(cid, direct)
+        if mask_img is None:
+            occupancy_kernel.remove_roi(cid, direct)
+        else:
+            occupancy_kernel.set_roi(cid, direct, mask_img)
+        change_gate.invalidate(cid)
+        overlay_renderer.invalidate(cid)
+        if roi_cropper is not None:
+            roi_cropper.invalidate(cid)
+
+async def watch_masks():
+    """마스크 원본이 추가/수정/삭제되면 재시작 없이 다시 로드 (stat만 확인하므로 가벼움)"""
+    while True:
+        await asyncio.sleep(MASK_RELOAD_SEC)
+        try:
+            changed = await asyncio.to_thread(mask_registry.reload_if_changed)
+        except Exception as e:
+            print(f"⚠️ 마스크 다시 읽기 실패: {e}")
+            continue
+        if not changed:
+            continue
+        if worker_pool is not None:
+            print("⚠️ 워커 풀 모드에서는 마스크 변경이 워커 재시작 후 반영됩니다.")
+            continue
+        apply_mask_changes(changed)
+        print(f"🔄 ROI 마스크 갱신: {sorted(changed)}")
 
 # =========================
 # 3) 비동기 이미지 처리 (CPU 병목 분산)
 # =========================
-def process_and_update(res, cid, final_data):
+def build_final_data(cid, occupancy, weighted=None, flow=None):
+    """
+    {direct: 점유율(0~1)}, {direct: 원근 보정 점유율(0~1)} → API 응답 형식.
+    상태는 원근 보정 점유율을 시간 평활 + 히스테리시스로 판정한 값 (프레임 한 장의 튐으로 바뀌지 않음)
+    flow({direct: 분당 통과 대수})는 추적을 하는 경로에서만 전달 (워커 풀 모드는 없음)
+    """
+    weighted = weighted or {}
+    final_data = {}
+    for direct, occ_rate in occupancy.items():
+        occ_weighted = weighted.get(direct, occ_rate)
+        smoothed, level = congestion.update(cid, direct, occ_weighted)
+        final_data[direct] = {
+            "occupancy_rate": round(occ_rate * 100, 1),
+            "occupancy_rate_weighted": round(occ_weighted * 100, 1),
+            "occupancy_rate_smoothed": round(smoothed * 100, 1),
+            "status": LABELS["ko"][level]
+        }
+        if flow is not None:
+            final_data[direct]["vehicles_per_min"] = round(flow.get(direct, 0.0), 1)
+    return final_data
+
+def publish_result(cid, final_data, vehicle_count, jpeg_bytes):
+    """최신 결과 업데이트 (쓰레드 풀 / 워커 풀 결과 공통). JPEG는 base64 없이 raw bytes로 팬아웃"""
+    if jpeg_bytes is not None:
+        frame_broadcaster.publish(cid, jpeg_bytes)
+    latest_results[cid] = {
+        "channel_id": cid,
+        "vehicle_total_count": vehicle_count,
+        "results": final_data,
+        "timestamp": datetime.now().isoformat()
+    }
+    traffic_feed.publish(cid, latest_results[cid])
+    history_store.add_result(cid, latest_results[cid])
+    if result_writer is not None:
+        result_writer.submit(cid, latest_results[cid])
+
+def process_and_update(cid, frame, union, final_data, vehicle_count):
     """별도 쓰레드에서 이미지 시각화 및 JPEG 인코딩 수행"""
+    jpeg_bytes = None
     try:
-        # 1. 시각화 (CPU)
-        annotated = res.plot(boxes=False, masks=True)
+        # 1. 시각화 (CPU, 480x270 오버레이)
+        with pipeline_metrics.stage("render"):
+            annotated = overlay_renderer.render(cid, frame, union)
         # 2. JPEG 압축 (가장 무거운 작업)
-        _, buffer = cv2.imencode('.jpg', annotated, [int(cv2.IMWRITE_JPEG_QUALITY), JPEG_QUALITY])
-        img_str = base64.b64encode(buffer).decode('utf-8')
-        
-        # 3. 최신 결과 업데이트
-        latest_results[cid] = {
-            "channel_id": cid,
-            "vehicle_total_count": len(res.boxes) if res.boxes is not None else 0,
-            "results": final_data,
-            "encoded_image": img_str,
-            "timestamp": datetime.now().isoformat()
-        }
+        with pipeline_metrics.stage("encode"):
+            ok, buffer = cv2.imencode('.jpg', annotated, [int(cv2.IMWRITE_JPEG_QUALITY), JPEG_QUALITY])
+        if ok:
+            jpeg_bytes = buffer.tobytes()
+        else:
+            pipeline_metrics.inc("encode_failures", cid)
     except Exception as e:
-        pass # 인코딩 도중 발생하는 사소한 에러 무시
+        pipeline_metrics.inc("encode_failures", cid)
+        print(f"⚠️ [채널 {cid}] 오버레이/인코딩 실패: {e}")
+    # 3. 최신 결과 업데이트 (인코딩에 실패해도 수치 결과는 반영)
+    publish_result(cid, final_data, vehicle_count, jpeg_bytes)
+
+def on_worker_result(cid, occupancy, weighted, vehicle_count, jpeg_bytes):
+    """워커 프로세스 결과 수신 (결과 수집 쓰레드에서 호출). 시청자가 없던 채널은 jpeg_bytes가 None"""
+    pipeline_metrics.inc("frames_analyzed", cid)
+    publish_result(cid, build_final_data(cid, occupancy, weighted), vehicle_count, jpeg_bytes)
+
+def filter_changed(batch):
+    """장면 변화가 없는 채널은 이전 분할 결과를 유지하고 배치에서 제외"""
+    kept = []
+    with pipeline_metrics.stage("gate"):
+        for item in batch:
+            if change_gate.check(item[0], item[1]):
+                kept.append(item)
+            else:
+                pipeline_metrics.inc("frames_skipped", item[0])
+    return kept
+
+def publish_analysis(cid, frame, union, final_data, vehicle_count):
+    """시청자가 있으면 오버레이/인코딩을 쓰레드 풀로 넘기고, 없으면 수치만 바로 반영"""
+    if frame_broadcaster.viewer_count(cid) > 0:
+        # 합집합 버퍼는 다음 채널 계산에서 덮어쓰이므로 복사해서 넘김 (stride 4라 작음)
+        # crop 모드에서는 원본 프레임 좌표(표시 해상도)로 되돌린 새 배열을 넘김
+        if roi_cropper is not None:
+            union = roi_cropper.uncrop(cid, union, overlay_renderer.size[::-1])
+        else:
+            union = union.copy() if union is not None else None
+        thread_executor.submit(process_and_update, cid, frame, union, final_data, vehicle_count)
+    else:
+        publish_result(cid, final_data, vehicle_count, None)
+
+def propagate_tracks(batch):
+    """
+    SEGMENT_EVERY > 1: 키프레임이 아닌 채널은 추론 없이 추적 마스크를 옮긴 합집합으로 결과를 반영하고 배치에서 제외.
+    반환: (추론할 항목, {cid: (final_data, vehicle_count)})
+    """
+    if SEGMENT_EVERY <= 1:
+        return batch, {}
+    kernel = roi_cropper.kernel if roi_cropper is not None else occupancy_kernel
+    kept, outputs = [], {}
+    now = time.monotonic()
+    with pipeline_metrics.stage("propagate"):
+        for item in batch:
+            cid = item[0]
+            tracker = vehicle_trackers.setdefault(cid, VehicleTracker())
+            if tracker.needs_segmentation(SEGMENT_EVERY, now):
+                kept.append(item)
+                continue
+            union = tracker.propagate(now)
+            final_data = build_final_data(cid, kernel.occupancy_from_union(cid, union),
+                                          kernel.weighted(cid, union), tracker.flow(now))
+            vehicle_count = tracker.active_count()
+            pipeline_metrics.inc("frames_propagated", cid)
+            outputs[cid] = (final_data, vehicle_count)
+            publish_analysis(cid, item[1], union, final_data, vehicle_count)
+    return kept, outputs
 
 # =========================
 # 4) 통합 분석 엔진 (GPU 배치 추론)
 # =========================
 
+async def analyze_batch(active_cids, batch_frames):
+    """
+    배치 추론 → 채널별 점유율 계산 → 결과 반영 (스트림 배처와 /predict_batch 공용 경로).
+    추론은 전용 쓰레드 하나에서만 돌기 때문에 두 경로의 배치는 순서대로 GPU에 들어갑니다.
+    반환: {cid: (final_data, vehicle_count)}
+    """
+    loop = asyncio.get_running_loop()
+    # crop 모드면 점유율/추적 모두 캔버스 좌표 커널 기준
+    kernel = roi_cropper.kernel if roi_cropper is not None else occupancy_kernel
+
+    def run_inference():
+        # crop + letterbox도 추론 쓰레드에서 수행 (이벤트 루프를 막지 않음)
+        inputs = batch_frames
+        if roi_cropper is not None:
+            with pipeline_metrics.stage("crop"):
+                inputs = [roi_cropper.crop(cid, frame) for cid, frame in zip(active_cids, batch_frames)]
+        with pipeline_metrics.stage("predict"):
+            return engine.predict(inputs, imgsz=IMG_SIZE)
+
+    # 1. Batch Inference (GPU면 A100 병렬 연산, CPU면 ONNX/OpenVINO 런타임)
+    results = await loop.run_in_executor(inference_executor, run_inference)
+    now = time.monotonic()
+
+    # 2. 결과 분석 및 쓰레드 위임
+    outputs = {}
+    for i, res in enumerate(results):
+        cid = active_cids[i]
+
+        # 합집합은 추론 장치 위에서 한 번에 계산하고, 작은 마스크만 CPU로 가져와 ROI와 비교
+        with pipeline_metrics.stage("occupancy"):
+            masks = res.masks.data if res.masks is not None else None
+            occupancy, union = kernel.analyze(cid, masks)
+            # 원근 보정 점유율: 미리 만든 (ROI × 행 가중치) 맵과 합집합의 내적 한 번
+            weighted = kernel.weighted(cid, union)
+        # 차량 추적: 같은 차량을 프레임 사이에서 이어 방향별 분당 통과 대수 집계
+        with pipeline_metrics.stage("track"):
+            tracker = vehicle_trackers.setdefault(cid, VehicleTracker())
+            boxes, scores, instances = tracker.detections(res)
+            rois = {} if union is None else \
+                {d: kernel.roi(cid, d, union.shape)[0] for d in kernel.directions(cid)}
+            tracker.update(boxes, scores, instances, rois, now)
+        final_data = build_final_data(cid, occupancy, weighted, tracker.flow(now))
+        vehicle_count = len(res.boxes) if res.boxes is not None else 0
+        pipeline_metrics.inc("frames_analyzed", cid)
+        outputs[cid] = (final_data, vehicle_count)
+
+        # 3. 무거운 인코딩 작업은 시청자가 있는 채널만 쓰레드 풀로 전달 (Fire-and-Forget)
+        #    시청자가 없으면 시각화/imencode 없이 수치만 바로 반영
+        publish_analysis(cid, batch_frames[i], union, final_data, vehicle_count)
+    return outputs
+
 async def global_analysis_engine():
-    caps = {}
-    while True:
-        if not cached_urls:
-            await asyncio.sleep(0.5)
-            continue
+    if worker_pool is not None:
+        return await pooled_analysis_engine()
 
-        cids = list(cached_urls.keys())
-        batch_frames = []
-        active_cids = []
-
-        # 1. 프레임 캡처 및 전처리 (Resize)
-        for cid in cids:
-            if cid not in caps:
-                caps[cid] = cv2.VideoCapture(cached_urls[cid])
-                caps[cid].set(cv2.CAP_PROP_BUFFERSIZE, 1)
-            
-            if caps[cid].grab():
-                success, frame = caps[cid].retrieve()
-                if success:
-                    batch_frames.append(cv2.resize(frame, (IMG_SIZE, IMG_SIZE)))
-                    active_cids.append(cid)
-
-        if not batch_frames:
-            await asyncio.sleep(0.01)
+    while True:
+        # 동적 배처가 마감 시간 또는 최대 배치 크기에 도달할 때까지 새 프레임을 모음
+        # (느린 카메라가 있어도 기다리지 않으므로 배치 지연은 추론 시간에만 좌우됨)
+        batch, _ = propagate_tracks(filter_changed(await batcher.next_batch()))
+        if not batch:
             continue
-
         try:
-            # 2. GPU Batch Inference (A100의 병렬 연산 활용)
-            results = model.predict(
-                source=batch_frames, 
-                imgsz=IMG_SIZE, 
-                device=DEVICE, 
-                half=USE_HALF, 
-                verbose=False
-            )
-
-            # 3. 결과 분석 및 쓰레드 위임
-            for i, res in enumerate(results):
-                cid = active_cids[i]
-                final_data = {}
-
-                if res.masks is not None:
-                    # [에러 방지 핵심] 모든 텐서 연산 직전에 FP16으로 강제 캐스팅
-                    pred_masks = res.masks.data.to(dtype=torch.float16)
-                    combined_mask = torch.any(pred_masks > 0.5, dim=0).to(dtype=torch.float16)
-                    
-                    for direct in ['up', 'low']:
-                        m_key = f"{cid}_{direct}"
-                        if m_key in preloaded_masks_gpu:
-                            roi = preloaded_masks_gpu[m_key].to(dtype=torch.float16)
-                            
-                            # 텐서 연산을 통한 점유율 계산
-                            overlap = (combined_mask * roi).sum().item()
-                            roi_area = roi.sum().item()
-                            occ_rate = overlap / (roi_area + 1e-6)
-                            
-                            final_data[direct] = {
-                                "occupancy_rate": round(occ_rate * 100, 1),
-                                "status": "원활" if occ_rate < 0.25 else "정체" if occ_rate > 0.5 else "서행"
-                            }
-
-                # 4. 무거운 인코딩 작업은 쓰레드 풀로 전달 (Fire-and-Forget)
-                thread_executor.submit(process_and_update, res, cid, final_data)
-
+            await analyze_batch([cid for cid, _, _, _ in batch], [frame for _, frame, _, _ in batch])
         except Exception as e:
             print(f"⚠️ 분석 루프 오류: {e}")
-        
-        await asyncio.sleep(0) # 즉시 다음 루프 실행
+
+async def pooled_analysis_engine():
+    """워커 풀 모드: 배치를 공유 메모리 링에 써서 워커 프로세스로 넘기고, 결과는 수집 쓰레드가 반영"""
+    loop = asyncio.get_running_loop()
+    while True:
+        if worker_pool.failed:
+            return await fallback_to_local_engine()
+        # 워커가 밀려 있으면 빈 슬롯이 생길 때까지 새 배치를 만들지 않음 (배압)
+        # 워커가 죽어 슬롯이 영영 안 풀리는 경우에도 멈추지 않도록 1초마다 풀 상태를 다시 확인
+        if not await loop.run_in_executor(None, worker_pool.wait_free, MAX_BATCH_SIZE, 1.0):
+            continue
+        batch = filter_changed(await batcher.next_batch())
+        if not batch:
+            continue
+        worker_pool.submit([(cid, frame, frame_broadcaster.viewer_count(cid) > 0)
+                            for cid, frame, _, _ in batch])
+
+async def fallback_to_local_engine():
+    """추론 워커를 모두 잃었을 때 풀을 닫고 이 프로세스에서 모델을 올려 단일 프로세스 분석 루프로 전환"""
+    global worker_pool, engine
+    print("⚠️ 추론 워커를 모두 잃어 이 프로세스에서 직접 추론합니다.")
+    pool, worker_pool = worker_pool, None
+    await asyncio.to_thread(pool.close)
+    loop = asyncio.get_running_loop()
+    engine = await loop.run_in_executor(inference_executor, lambda: create_engine(YOLO_PT_PATH, imgsz=IMG_SIZE))
+    print(f"✅ 프로세스 내 추론으로 전환 완료 ({engine.name})")
+    return await global_analysis_engine()
 
 # =========================
 # 5) API 엔드포인트
 # =========================
 class URLUpdate(BaseModel):
     urls: Dict[str, str]
+    replace: bool = False  # True면 보낸 채널만 남기고 나머지는 종료 (기본은 바뀐 채널만 보내는 병합)
 
 @app.post("/update_urls")
 async def update_urls(data: URLUpdate):
+    """바뀐 채널만 병합 (replace=True면 전체 교체). URL이 바뀐 채널은 새 스트림의 첫 프레임이 들어올 때 교체"""
     global cached_urls
-    cached_urls = {int(k): v for k, v in data.urls.items()}
-    return {"status": "success"}
+    incoming = {int(k): v for k, v in data.urls.items()}
+    if data.replace:
+        for cid in set(cached_urls) - set(incoming):
+            congestion.forget(cid)
+            vehicle_trackers.pop(cid, None)
+            traffic_feed.forget(cid)
+            batcher.forget(cid)
+        cached_urls = incoming
+    else:
+        cached_urls.update(incoming)
+    capture_service.sync(cached_urls)
+    # ROI 마스크가 없는 채널은 다른 카메라 마스크로 대신하지 않고 응답/로그로 알림
+    missing = sorted(cid for cid in cached_urls if not occupancy_kernel.directions(cid))
+    for cid in missing:
+        print(f"❌ [채널 {cid}] ROI 마스크가 없어 점유율/혼잡도를 계산하지 않습니다.")
+    return {"status": "success", "active_channels": list(cached_urls.keys()), "missing_masks": missing}
+
+def decode_remote_frame(jpeg):
+    """
+    엣지에서 받은 JPEG 디코딩 (캡처 쓰레드와 같은 해상도 규칙: crop 모드는 원본, 아니면 IMG_SIZE 정사각형).
+    decode 단계 시간은 작업 쓰레드 안에서 프레임마다 측정 (쓰레드 풀 대기 / gather 시간은 포함하지 않음)
+    """
+    with pipeline_metrics.stage("decode"):
+        frame = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if frame is not None and roi_cropper is None and frame.shape[:2] != (IMG_SIZE, IMG_SIZE):
+            frame = cv2.resize(frame, (IMG_SIZE, IMG_SIZE))
+    return frame
+
+@app.post("/predict_batch")
+async def predict_batch(request: Request):
+    """
+    엣지 브릿지용 다채널 추론: 본문은 [u32 채널][u32 길이][JPEG] 반복 (app/services/frame_batch.py).
+    JPEG는 쓰레드 풀에서 병렬 디코딩하고, 스트림 배치와 같은 analyze_batch 경로로 한 번에 추론한 뒤
+    {채널: 최신 결과}를 한 응답으로 반환. 장면 변화가 없는 채널은 추론 없이 직전 결과를 돌려줌
+    """
+    if engine is None:
+        return JSONResponse({"error": "INFERENCE_WORKERS 모드에서는 /predict_batch를 지원하지 않습니다"},
+                            status_code=503)
+    try:
+        items = unpack_frames(await request.body())
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    if not items:
+        return JSONResponse({})
+
+    loop = asyncio.get_running_loop()
+    frames = await asyncio.gather(*(loop.run_in_executor(thread_executor, decode_remote_frame, jpeg)
+                                    for _, jpeg in items))
+    batch = [(cid, frame) for (cid, _), frame in zip(items, frames) if frame is not None]
+    for (cid, _), frame in zip(items, frames):
+        if frame is None:
+            pipeline_metrics.inc("read_failures", cid)
+    batch, outputs = propagate_tracks(filter_changed(batch))
+    for start in range(0, len(batch), MAX_BATCH_SIZE):
+        chunk = batch[start:start + MAX_BATCH_SIZE]
+        outputs.update(await analyze_batch([cid for cid, _ in chunk], [frame for _, frame in chunk]))
+
+    # 시청자가 있는 채널은 latest_results 반영이 인코딩 쓰레드에서 늦게 일어나므로 이번 추론 결과로 바로 응답
+    response = {}
+    now = datetime.now().isoformat()
+    for cid, _ in items:
+        if cid in outputs:
+            final_data, vehicle_count = outputs[cid]
+            response[cid] = {"channel_id": cid, "vehicle_total_count": vehicle_count,
+                             "results": final_data, "timestamp": now}
+        elif cid in latest_results:
+            response[cid] = latest_results[cid]
+    return JSONResponse(response)
+
+@app.get("/api/v1/traffic/{channel_id}/records")
+async def get_traffic_records(channel_id: int, from_: Optional[str] = Query(None, alias="from"),
+                              to: Optional[str] = None, limit: int = Query(10000, ge=1, le=100000)):
+    """결과 싱크에 기록된 원본 결과 조회 (방향별 행, 오래된 순). from/to: epoch 초 또는 ISO 8601 (기본 최근 1시간)"""
+    if result_writer is None:
+        return JSONResponse(content={"error": "RESULT_SINKS가 설정되지 않았습니다"}, status_code=404)
+    try:
+        t1 = parse_time(to, time.time())
+        t0 = parse_time(from_, t1 - 3600)
+    except ValueError:
+        return JSONResponse(content={"error": "invalid from/to"}, status_code=400)
+    rows = await asyncio.to_thread(result_writer.query, channel_id, t0, t1, limit)
+    return {"channel_id": channel_id, "from": t0, "to": t1, "rows": rows}
+
+@app.get("/api/v1/congestion/events")
+async def get_congestion_events(since: int = 0, channel_id: Optional[int] = None):
+    """혼잡도 상태 전환 이벤트 (seq > since, 오래된 순). 마지막 seq를 since로 넘겨 이어 읽기"""
+    return {"events": congestion.events(since, channel_id), "states": congestion.snapshot()}
+
+@app.get("/api/v1/stats")
+async def get_engine_stats():
+    """배치 크기 / 대기 시간 히스토그램 (처리량 vs 신선도 튜닝용), 채널별 추론 생략 비율, 스트림 연결 상태, 결과 싱크 / 워커 풀 현황"""
+    return {"batcher": batcher.stats(), "gate": change_gate.stats(), "channels": capture_service.health(),
+            "sinks": result_writer.stats() if result_writer is not None else None,
+            "workers": worker_pool.stats() if worker_pool is not None else None}
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus 텍스트 형식: 단계별 지연 히스토그램, 채널별 카운터, 배치 크기 / 대기 시간"""
+    text = pipeline_metrics.render({
+        "batch_size": ("동적 배처가 내보낸 배치 크기", batcher.batch_size_hist),
+        "queue_wait_milliseconds": ("프레임이 배치에 들어가기까지 기다린 시간(ms)", batcher.queue_wait_hist),
+    })
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
+
+@app.get("/api/v1/traffic")
+async def get_all_traffic_data():
+    return Response(content=traffic_feed.bulk(), media_type="application/json")
+
+@app.get("/api/v1/traffic/stream")
+async def traffic_stream():
+    # SSE: 접속 시 전체 채널, 이후에는 바뀐 채널만 push
+    return StreamingResponse(traffic_feed.stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.get("/api/v1/traffic/{channel_id}")
 async def get_traffic_data(channel_id: int):
-    data = latest_results.get(channel_id)
-    if not data: return JSONResponse(content={"error": "no data"}, status_code=503)
-    res_only = data.copy()
-    if "encoded_image" in res_only: del res_only["encoded_image"]
-    return res_only
+    payload = traffic_feed.get(channel_id)
+    if payload is None: return JSONResponse(content={"error": "no data"}, status_code=503)
+    return Response(content=payload, media_type="application/json")
+
+@app.get("/api/v1/traffic/{channel_id}/history")
+async def get_traffic_history(channel_id: int, from_: Optional[str] = Query(None, alias="from"),
+                              to: Optional[str] = None, step: Optional[str] = None):
+    """점유율 이력 조회. from/to: epoch 초 또는 ISO 8601 (기본 최근 1시간), step: raw | 1s | 1m | 15m | 초"""
+    try:
+        t1 = parse_time(to, time.time())
+        t0 = parse_time(from_, t1 - 3600)
+        step_sec = parse_step(step)
+    except ValueError:
+        return JSONResponse(content={"error": "invalid from/to/step"}, status_code=400)
+    data = history_store.query(channel_id, t0, t1, step_sec)
+    if data is None:
+        return JSONResponse(content={"error": "no data"}, status_code=404)
+    return data
 
 @app.get("/video_feed/{channel_id}")
 async def video_feed(channel_id: int):
-    async def frame_generator():
-        while True:
-            data = latest_results.get(channel_id)
-            if data and "encoded_image" in data:
-                img_data = base64.b64decode(data["encoded_image"])
-                yield (b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n' + img_data + b'\r\n')
-            await asyncio.sleep(0.04) # 약 25 FPS
-    return StreamingResponse(frame_generator(), media_type="multipart/x-mixed-replace; boundary=frame")
+    # 새 프레임이 발행될 때만 전송 (폴링/base64 디코딩 없음)
+    return StreamingResponse(frame_broadcaster.subscribe(channel_id),
+                             media_type="multipart/x-mixed-replace; boundary=frame")
 
 @app.get("/")
 async def read_index():